@@ -0,0 +1,39 @@
+"""Replace video_clips indexes with a covering (session_id, start_time) index
+
+Revision ID: b7d2e91c4a10
+Revises: f4c4b3a6d22e
+Create Date: 2026-10-14 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e91c4a10'
+down_revision = 'f4c4b3a6d22e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_video_clips_session_start',
+        'video_clips',
+        ['session_id', 'start_time'],
+        unique=False,
+        postgresql_include=['end_time', 'clip_index', 's3_key', 's3_bucket', 'thumbnail_s3_key'],
+    )
+    op.drop_index('ix_video_clips_session_time', table_name='video_clips')
+    op.drop_index(op.f('ix_video_clips_start_time'), table_name='video_clips')
+    op.drop_index(op.f('ix_video_clips_end_time'), table_name='video_clips')
+    op.drop_index(op.f('ix_video_clips_session_id'), table_name='video_clips')
+
+
+def downgrade():
+    op.create_index(op.f('ix_video_clips_session_id'), 'video_clips', ['session_id'], unique=False)
+    op.create_index(op.f('ix_video_clips_end_time'), 'video_clips', ['end_time'], unique=False)
+    op.create_index(op.f('ix_video_clips_start_time'), 'video_clips', ['start_time'], unique=False)
+    op.create_index('ix_video_clips_session_time', 'video_clips', ['session_id', 'start_time', 'end_time'], unique=False)
+    op.drop_index('ix_video_clips_session_start', table_name='video_clips')
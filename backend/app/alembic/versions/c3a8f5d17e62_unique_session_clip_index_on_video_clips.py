@@ -0,0 +1,37 @@
+"""Add a unique (session_id, clip_index) constraint to video_clips
+
+Revision ID: c3a8f5d17e62
+Revises: b7d2e91c4a10
+Create Date: 2026-10-14 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a8f5d17e62'
+down_revision = 'b7d2e91c4a10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep the earliest row of any duplicated clip so the constraint can be created
+    op.execute(
+        """
+        DELETE FROM video_clips a
+        USING video_clips b
+        WHERE a.session_id = b.session_id
+          AND a.clip_index = b.clip_index
+          AND a.id > b.id
+        """
+    )
+    op.create_unique_constraint(
+        'uq_video_clips_session_clip', 'video_clips', ['session_id', 'clip_index']
+    )
+
+
+def downgrade():
+    op.drop_constraint('uq_video_clips_session_clip', 'video_clips', type_='unique')
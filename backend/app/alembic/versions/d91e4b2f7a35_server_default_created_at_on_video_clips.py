@@ -0,0 +1,25 @@
+"""Stamp video_clips.created_at with a server default
+
+Revision ID: d91e4b2f7a35
+Revises: c3a8f5d17e62
+Create Date: 2026-10-14 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91e4b2f7a35'
+down_revision = 'c3a8f5d17e62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column('video_clips', 'created_at', server_default=sa.text("timezone('utc', now())"))
+
+
+def downgrade():
+    op.alter_column('video_clips', 'created_at', server_default=None)
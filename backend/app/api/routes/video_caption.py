@@ -5,25 +5,618 @@ Includes video clip encoding and S3 storage for frame persistence.
 """
 
 import asyncio
-import base64
-import json
+import contextlib
 import os
 from datetime import datetime
 
+import orjson
+import pybase64
 from deepgram import AsyncDeepgramClient
 from deepgram.core.events import EventType
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
-from app.core.clip_encoder import ClipEncoder
-from app.core.db import async_session_maker
+from app.core.clip_encoder import ClipEncoder, decode_jpeg
+from app.core.clip_store import clip_metadata_writer
 from app.core.log_config import logger
 from app.core.mem0_client import mem0_manager
 from app.core.moondream_processor import moondream_processor
 from app.core.s3_utils import s3_manager
-from app.crud import create_video_clip
 
 router = APIRouter()
 
+# Queue bounds - a stalled consumer must not grow session memory without limit
+AUDIO_QUEUE_MAXSIZE = 200
+IMAGE_QUEUE_MAXSIZE = 120  # 5 s at 24 FPS
+UPLOAD_QUEUE_MAXSIZE = 8
+TRANSCRIPT_QUEUE_MAXSIZE = 512
+CAPTION_QUEUE_MAXSIZE = 1  # Only the latest sampled frame is worth captioning
+
+# Deepgram send coalescing: 100 ms of 24 kHz linear16 mono, or whatever arrived in 20 ms
+AUDIO_BATCH_BYTES = 4800
+AUDIO_BATCH_TIMEOUT_SEC = 0.020
+
+# Mem0 batching: push every 30 s, or early once either buffer reaches 64 items
+MEM0_BATCH_INTERVAL_SEC = 30.0
+MEM0_BATCH_MAX_ITEMS = 64
+
+# Time allowed after disconnect for the final partial clip to encode and upload
+SHUTDOWN_DRAIN_TIMEOUT_SEC = 15.0
+
+# Binary frame type tags (first byte of the frame); the rest is raw JPEG / PCM
+FRAME_TYPE_IMAGE = 0
+FRAME_TYPE_AUDIO = 1
+FRAME_TYPE_AUDIO_STOP = 2
+
+
+def _combine_transcripts(transcripts: list[dict]) -> tuple[str, str]:
+    """Join batched utterances and collapse their speakers in a single pass.
+
+    Returns:
+        The space-joined text and the sole speaker, or "multiple" if several spoke.
+    """
+    parts = []
+    speakers = set()
+    for t in transcripts:
+        parts.append(t["text"])
+        speakers.add(t["speaker"])
+    speaker = next(iter(speakers)) if len(speakers) == 1 else "multiple"
+    return " ".join(parts), speaker
+
+
+def _put_drop_oldest(queue: asyncio.Queue, item, name: str) -> None:
+    """Enqueue without blocking, evicting the oldest item if the queue is full."""
+    try:
+        queue.put_nowait(item)
+    except asyncio.QueueFull:
+        with contextlib.suppress(asyncio.QueueEmpty):
+            queue.get_nowait()
+        queue.put_nowait(item)
+        logger.warning(f"[Router] {name} queue overflow, dropping oldest")
+
+
+def _replace_latest(queue: asyncio.Queue, item) -> None:
+    """Put into a size-1 queue, replacing an item that is still waiting."""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(item)
+
+
+def _decode_image_message(msg: dict) -> bytes | None:
+    """Pull the JPEG bytes out of a binary or JSON image message."""
+    # Binary frames carry raw JPEG; JSON frames carry base64
+    image_bytes = msg.get("image_bytes")
+    if image_bytes is not None:
+        return image_bytes
+
+    image_b64 = msg.get("image")
+    if not image_b64:
+        return None
+
+    # Strip data URL prefix if present (Ray-Ban format)
+    if isinstance(image_b64, str) and image_b64.startswith("data:"):
+        _, sep, payload = image_b64.partition(",")
+        if sep:
+            image_b64 = payload
+
+    return pybase64.b64decode(image_b64, validate=False)
+
+
+class _CaptionSession:
+    """Per-connection queues, Mem0 batch buffers and counters for one video-caption socket."""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        # Session ID for tracking
+        self.session_id = f"vc_{id(websocket)}_{int(datetime.now().timestamp())}"
+
+        # Create separate bounded queues for parallel processing
+        self.audio_queue: asyncio.Queue = asyncio.Queue(maxsize=AUDIO_QUEUE_MAXSIZE)
+        self.image_queue: asyncio.Queue = asyncio.Queue(maxsize=IMAGE_QUEUE_MAXSIZE)
+        # Upload uses blocking puts: a slow S3 backs up into image_queue, which drops frames
+        self.upload_queue: asyncio.Queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_MAXSIZE)
+        self.caption_queue: asyncio.Queue = asyncio.Queue(maxsize=CAPTION_QUEUE_MAXSIZE)
+        # Deepgram results, drained by one sender task instead of a task per message
+        self.transcript_queue: asyncio.Queue = asyncio.Queue(maxsize=TRANSCRIPT_QUEUE_MAXSIZE)
+
+        # Batch buffers for Mem0 (flushed on a timer or when full instead of immediate push)
+        self.transcript_batch: list[dict] = []
+        self.caption_batch: list[dict] = []
+        # Set when a buffer is full so the batch processor flushes before the timer
+        self.mem0_flush_event = asyncio.Event()
+
+        # Counters for Mem0 requests
+        self.mem0_transcript_requests = 0
+        self.mem0_caption_requests = 0
+        self.mem0_total_transcripts = 0
+        self.mem0_total_captions = 0
+
+        # Video clip encoder (10-second clips at 24 FPS)
+        self.clip_encoder = ClipEncoder(clip_duration_sec=10.0, fps=24)
+
+        # Track current clip metadata for Mem0 linking
+        self.current_clip_metadata: dict | None = None
+
+        # Shared state for Deepgram socket
+        self.deepgram_connection = None
+        self.deepgram_running = False
+
+
+async def _on_transcript(session: _CaptionSession, text: str, is_final: bool, speaker: str):
+    """Handle transcripts from Deepgram - stores separately in Mem0."""
+    # Send to client - orjson emits bytes, decoded because the Android client
+    # only handles text frames
+    await session.websocket.send_text(orjson.dumps({
+        "type": "transcript",
+        "text": text,
+        "is_final": is_final,
+        "speaker": speaker
+    }).decode())
+
+    # Highlight in logs
+    if is_final:
+        logger.info(f">>> [STT FINAL] [{speaker}] {text}")
+        # Accumulate transcript for batched Mem0 push (every 30 seconds)
+        session.transcript_batch.append({
+            "timestamp": datetime.now().isoformat(),
+            "speaker": speaker,
+            "text": text,
+            "session_id": session.session_id
+        })
+        if len(session.transcript_batch) >= MEM0_BATCH_MAX_ITEMS:
+            session.mem0_flush_event.set()
+    else:
+        logger.info(f"    [STT interim] [{speaker}] {text}")
+
+
+# === Parallel Processing Tasks ===
+
+def _route_binary(session: _CaptionSession, data: bytes, msg_count: int) -> None:
+    """Route a type-prefixed binary frame's raw payload without copying or base64."""
+    frame_type = data[0]
+    payload = memoryview(data)[1:]
+
+    if msg_count == 1 or msg_count % 50 == 0:
+        logger.info(f"[Router] Msg #{msg_count}: binary type={frame_type}")
+
+    if frame_type == FRAME_TYPE_IMAGE:
+        _put_drop_oldest(session.image_queue, {"image_bytes": payload}, "image")
+    elif frame_type == FRAME_TYPE_AUDIO:
+        _put_drop_oldest(session.audio_queue, {"audio_bytes": payload}, "audio")
+    elif frame_type == FRAME_TYPE_AUDIO_STOP:
+        _put_drop_oldest(session.audio_queue, {"type": "audio_stream_stop"}, "audio")
+    else:
+        logger.warning(f"[Router] Unknown binary frame type: {frame_type}")
+
+
+def _route_text(session: _CaptionSession, text: str, msg_count: int) -> None:
+    """Route a legacy JSON text frame; a malformed one is logged and dropped."""
+    try:
+        msg = orjson.loads(text)
+    except orjson.JSONDecodeError as e:
+        logger.warning(f"[Router] Dropping malformed JSON frame #{msg_count}: {e}")
+        return
+    if not isinstance(msg, dict):
+        logger.warning(f"[Router] Dropping non-object JSON frame #{msg_count}")
+        return
+    msg_type = msg.get("type", "")
+
+    # Log every 50th message to avoid spam
+    if msg_count == 1 or msg_count % 50 == 0:
+        logger.info(f"[Router] Msg #{msg_count}: type={msg_type}")
+
+    # Route audio messages
+    if msg_type in ("audio", "audio_stream", "audio_stream_stop") or "audio_chunk" in msg:
+        _put_drop_oldest(session.audio_queue, msg, "audio")
+    # Route image messages
+    elif "image" in msg:
+        _put_drop_oldest(session.image_queue, msg, "image")
+
+
+async def _message_router(session: _CaptionSession):
+    """Routes incoming WebSocket messages to appropriate queue."""
+    msg_count = 0
+    try:
+        while True:
+            message = await session.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            msg_count += 1
+
+            data = message.get("bytes")
+            if data:
+                _route_binary(session, data, msg_count)
+            elif text := message.get("text"):
+                _route_text(session, text, msg_count)
+
+    finally:
+        # Send poison pills however the router ends, so the image and upload
+        # tasks flush the final clip instead of waiting out the drain timeout
+        # (never blocks on a full queue)
+        _put_drop_oldest(session.audio_queue, None, "audio")
+        _put_drop_oldest(session.image_queue, None, "image")
+
+
+async def _send_audio(session: _CaptionSession, pending: bytearray) -> None:
+    """Send any coalesced PCM to Deepgram as a single frame."""
+    if pending and session.deepgram_connection and session.deepgram_running:
+        try:
+            await session.deepgram_connection.send_media(bytes(pending))
+        except Exception as e:
+            logger.error(f"[Deepgram] Error sending audio: {e}")
+    pending.clear()
+
+
+async def _audio_processor(session: _CaptionSession):
+    """Processes audio chunks - coalesces them and sends to Deepgram STT."""
+    chunk_count = 0
+    pending = bytearray()
+
+    while True:
+        try:
+            msg = await asyncio.wait_for(
+                session.audio_queue.get(), timeout=AUDIO_BATCH_TIMEOUT_SEC
+            )
+        except asyncio.TimeoutError:
+            # Input went quiet - don't hold a partial batch back
+            await _send_audio(session, pending)
+            continue
+
+        if msg is None:
+            await _send_audio(session, pending)
+            break  # Poison pill - shutdown
+
+        if msg.get("type") == "audio_stream_stop":
+            await _send_audio(session, pending)
+            logger.info(f"[Audio] Stream stopped by client (processed {chunk_count} chunks)")
+            continue
+
+        audio_bytes = msg.get("audio_bytes")
+        audio_b64 = msg.get("audio_chunk") or msg.get("audio")
+        if not (audio_bytes or audio_b64) or not session.deepgram_running:
+            continue
+
+        chunk_count += 1
+        # Log every 10 chunks to reduce clutter
+        if chunk_count % 10 == 0:
+            logger.info(f"[Audio] Chunk #{chunk_count} forwarded to Deepgram")
+
+        # Deepgram takes raw bytes directly
+        if audio_bytes is None:
+            audio_bytes = pybase64.b64decode(audio_b64, validate=False)
+        pending += audio_bytes
+        if len(pending) >= AUDIO_BATCH_BYTES:
+            await _send_audio(session, pending)
+
+
+async def _upload_clip(session: _CaptionSession, item: tuple) -> None:
+    """Upload one encoded clip and its thumbnail, then record it in PostgreSQL."""
+    video_bytes, start_time_str, end_time_str, clip_index, thumbnail_bytes = item
+    logger.info(f"[Upload] Processing clip {clip_index}: {len(video_bytes)} bytes, thumbnail {len(thumbnail_bytes)} bytes")
+
+    if not s3_manager.bucket_name:
+        logger.warning(f"[Upload] Skipping clip {clip_index} - no S3 bucket configured")
+        return
+
+    try:
+        # 1. Upload video clip and thumbnail to S3 concurrently
+        s3_metadata, thumbnail_s3_key = await s3_manager.upload_clip_with_thumbnail(
+            session_id=session.session_id,
+            clip_index=clip_index,
+            video_bytes=video_bytes,
+            thumbnail_bytes=thumbnail_bytes,
+            start_time=start_time_str,
+            end_time=end_time_str,
+        )
+
+        # 2. Store in PostgreSQL for time-range queries (batched across sessions)
+        clip_metadata_writer.enqueue({
+            "session_id": session.session_id,
+            "clip_index": clip_index,
+            "s3_key": s3_metadata["s3_key"],
+            "s3_bucket": s3_metadata["s3_bucket"],
+            "start_time": datetime.fromisoformat(start_time_str),
+            "end_time": datetime.fromisoformat(end_time_str),
+            "thumbnail_s3_key": thumbnail_s3_key,
+        })
+
+        session.current_clip_metadata = s3_metadata
+        logger.info(f"[Upload] Clip {clip_index} complete: {s3_metadata['s3_key']}")
+
+    except Exception as e:
+        logger.error(f"[Upload] Failed for clip {clip_index}: {e}")
+
+
+async def _upload_processor(session: _CaptionSession):
+    """Separate task for S3 uploads + PostgreSQL storage."""
+    # Check S3 configuration on startup
+    if not s3_manager.bucket_name:
+        logger.warning("[Upload] S3_BUCKET_NAME not configured - clips will NOT be stored!")
+    else:
+        logger.info(f"[Upload] S3 configured: bucket={s3_manager.bucket_name}")
+
+    while True:
+        item = await session.upload_queue.get()
+        if item is None:
+            logger.info("[Upload] Received shutdown signal")
+            break  # Shutdown signal
+        await _upload_clip(session, item)
+
+
+async def _finish_image_stream(session: _CaptionSession) -> None:
+    """Flush the final partial clip and stop the upload and caption tasks."""
+    final_clip = await session.clip_encoder.flush()
+    if final_clip:
+        await session.upload_queue.put(final_clip)
+    await session.upload_queue.put(None)  # Signal upload_processor to stop
+    _replace_latest(session.caption_queue, None)  # Signal caption_processor to stop
+
+
+async def _image_processor(session: _CaptionSession):
+    """Processes video frames - Moondream captioning + clip buffering."""
+    clip_encoder = session.clip_encoder
+    while True:
+        msg = await session.image_queue.get()
+        if msg is None:
+            # Flush remaining frames on disconnect
+            await _finish_image_stream(session)
+            break
+
+        image_bytes = _decode_image_message(msg)
+        if image_bytes is None:
+            continue
+
+        # Decode once, shared by clip encoding and Moondream
+        timestamp = datetime.now()
+        frame = await decode_jpeg(image_bytes)
+        if frame is None:
+            logger.warning("[Clip] Failed to decode frame")
+            continue
+
+        # Add to clip buffer (ALL frames for smooth video)
+        clip_result = await clip_encoder.add_frame_decoded(
+            frame, timestamp, jpeg_bytes=image_bytes
+        )
+        if clip_result:
+            # Clip ready - queue for upload (non-blocking)
+            logger.info("[Clip] Clip ready! Queuing for upload...")
+            await session.upload_queue.put(clip_result)
+
+        # Log frame buffer status periodically
+        buffered = clip_encoder.frame_count
+        if buffered % 50 == 0 and buffered > 0:
+            elapsed = (timestamp - clip_encoder.clip_start_time).total_seconds() if clip_encoder.clip_start_time else 0
+            logger.info(f"[Clip] Buffer: {buffered} frames, {elapsed:.1f}s elapsed")
+
+        # Hand every 10th frame to caption_processor so the Moondream request
+        # never stalls clip encoding; a newer frame replaces one still waiting
+        frame_number = moondream_processor.claim_frame()
+        if frame_number is not None:
+            _replace_latest(session.caption_queue, (frame, frame_number))
+
+
+async def _caption_processor(session: _CaptionSession):
+    """Captions sampled frames with Moondream and forwards results."""
+    while True:
+        item = await session.caption_queue.get()
+        if item is None:
+            break
+
+        frame, frame_number = item
+        result = await moondream_processor.caption_frame_ndarray(frame, frame_number)
+        if not result:
+            continue
+
+        clip_metadata = session.current_clip_metadata
+        # Accumulate caption for batched Mem0 push (every 30 seconds)
+        session.caption_batch.append({
+            "caption": {
+                "timestamp": result["timestamp"],
+                "description": result["description"],
+                "frame_number": result["frame_number"],
+            },
+            "clip_metadata": clip_metadata,
+        })
+        if len(session.caption_batch) >= MEM0_BATCH_MAX_ITEMS:
+            session.mem0_flush_event.set()
+
+        # Send to client (include clip reference if available)
+        response = {
+            "type": "moondream_caption",
+            "timestamp": result["timestamp"],
+            "description": result["description"],
+            "frame_number": result["frame_number"],
+        }
+        if clip_metadata:
+            response["clip_key"] = clip_metadata.get("s3_key")
+
+        await session.websocket.send_text(orjson.dumps(response).decode())
+        logger.info(
+            f"[Moondream] #{result['frame_number']} | {result['description'][:50]}..."
+        )
+
+
+async def _transcript_sender(session: _CaptionSession):
+    """Delivers queued Deepgram transcripts to the client in arrival order."""
+    while True:
+        text, is_final, speaker = await session.transcript_queue.get()
+        try:
+            await _on_transcript(session, text, is_final, speaker)
+        except Exception as e:
+            logger.warning(f"[STT] Failed to deliver transcript: {e}")
+
+
+async def _push_mem0_batch(
+    session: _CaptionSession, transcripts: list[dict], captions: list[dict]
+) -> None:
+    """Store a batch of transcripts and captions as one Mem0 memory each."""
+    # Combine transcripts into single coherent text
+    if transcripts:
+        combined_transcript, speaker_str = _combine_transcripts(transcripts)
+        await mem0_manager.store_transcript({
+            "timestamp": transcripts[0]["timestamp"],
+            "speaker": speaker_str,
+            "text": combined_transcript,
+            "session_id": session.session_id,
+        })
+        session.mem0_transcript_requests += 1
+        session.mem0_total_transcripts += len(transcripts)
+        logger.info(f"[Mem0] Batch transcript: {len(transcripts)} utterances -> '{combined_transcript[:60]}...'")
+
+    # Combine captions into grouped visual context
+    if captions:
+        combined_description = " | ".join(c["caption"]["description"] for c in captions)
+        # Use the last clip metadata
+        await mem0_manager.store_caption_with_clip(
+            caption={
+                "timestamp": captions[0]["caption"]["timestamp"],
+                "description": combined_description,
+                "frame_number": captions[-1]["caption"]["frame_number"],
+            },
+            clip_metadata=captions[-1].get("clip_metadata"),
+        )
+        session.mem0_caption_requests += 1
+        session.mem0_total_captions += len(captions)
+        logger.info(f"[Mem0] Batch captions: {len(captions)} frames -> '{combined_description[:60]}...'")
+
+
+def _take_mem0_batch(session: _CaptionSession) -> tuple[list[dict], list[dict]]:
+    """Swap in fresh buffers instead of copying and clearing the old ones."""
+    transcripts, session.transcript_batch = session.transcript_batch, []
+    captions, session.caption_batch = session.caption_batch, []
+    return transcripts, captions
+
+
+async def _mem0_batch_processor(session: _CaptionSession):
+    """Flushes accumulated transcripts and captions to Mem0 every 30 seconds or when full."""
+    while True:
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(
+                session.mem0_flush_event.wait(), timeout=MEM0_BATCH_INTERVAL_SEC
+            )
+        session.mem0_flush_event.clear()
+
+        transcripts_to_push, captions_to_push = _take_mem0_batch(session)
+        if not transcripts_to_push and not captions_to_push:
+            logger.debug("[Mem0] No data to batch push")
+            continue
+
+        await _push_mem0_batch(session, transcripts_to_push, captions_to_push)
+        logger.info(f"[Mem0] Batch pushed: {len(transcripts_to_push)} transcripts, {len(captions_to_push)} captions")
+
+
+async def _flush_mem0_batch(session: _CaptionSession):
+    """Flush any remaining buffered data on disconnect."""
+    transcripts, captions = _take_mem0_batch(session)
+    if not transcripts and not captions:
+        return
+
+    logger.info(f"[Mem0] Flushing final batch: {len(transcripts)} transcripts, {len(captions)} captions")
+    await _push_mem0_batch(session, transcripts, captions)
+
+
+def _log_mem0_summary(session: _CaptionSession) -> None:
+    """Print the session's Mem0 request summary."""
+    total_requests = session.mem0_transcript_requests + session.mem0_caption_requests
+    logger.info("=" * 60)
+    logger.info("[Mem0] SESSION SUMMARY")
+    logger.info(f"[Mem0] Transcript requests: {session.mem0_transcript_requests} (batched {session.mem0_total_transcripts} utterances)")
+    logger.info(f"[Mem0] Caption requests: {session.mem0_caption_requests} (batched {session.mem0_total_captions} frames)")
+    logger.info(f"[Mem0] TOTAL API REQUESTS: {total_requests}")
+    logger.info("=" * 60)
+
+
+# Deepgram message handler (v5.x SDK)
+def _on_deepgram_message(session: _CaptionSession, message) -> None:
+    """Handle Deepgram transcript messages."""
+    try:
+        msg_type = getattr(message, "type", "Unknown")
+        logger.debug(f"[Deepgram] Received: {msg_type}")
+
+        # Check for transcript in channel.alternatives
+        if not hasattr(message, 'channel'):
+            return
+        alternatives = message.channel.alternatives
+        if not alternatives or not alternatives[0].transcript:
+            return
+        text = alternatives[0].transcript
+        is_final = getattr(message, 'is_final', False)
+
+        # Extract speaker info if available
+        speaker = "Speaker 0"
+        if alternatives[0].words:
+            first_word = alternatives[0].words[0]
+            if hasattr(first_word, 'speaker'):
+                speaker = f"Speaker {first_word.speaker}"
+
+        # Hand off to transcript_sender (the async client calls us on the loop)
+        _put_drop_oldest(session.transcript_queue, (text, is_final, speaker), "Transcript")
+    except Exception as e:
+        logger.error(f"[Deepgram] Error processing message: {e}")
+
+
+def _on_deepgram_error(error) -> None:
+    logger.error(f"[Deepgram] Error: {error}")
+
+
+async def _deepgram_listener(connection) -> None:
+    """Deepgram listener - keeps connection alive."""
+    try:
+        await connection.start_listening()
+    except Exception as e:
+        logger.warning(f"[Deepgram] Listener ended: {e}")
+
+
+def _retrieve_results(tasks: list[asyncio.Task]) -> None:
+    """Retrieve results to avoid "Task exception never retrieved" warnings."""
+    for task in tasks:
+        if not task.done():
+            continue
+        try:
+            task.result()
+        except (WebSocketDisconnect, asyncio.CancelledError):
+            pass  # Normal disconnect
+        except Exception as e:
+            logger.error(f"Task {task.get_name()} error: {e}")
+
+
+async def _run_session_tasks(session: _CaptionSession, connection) -> None:
+    """Run the processing tasks until the client disconnects or one of them fails."""
+    # Launch parallel tasks (named so supervisor logs say which one failed)
+    router_task = asyncio.create_task(_message_router(session), name="router")
+    image_task = asyncio.create_task(_image_processor(session), name="image")
+    upload_task = asyncio.create_task(_upload_processor(session), name="upload")
+    tasks = [
+        asyncio.create_task(_audio_processor(session), name="audio"),
+        image_task,
+        router_task,
+        asyncio.create_task(_deepgram_listener(connection), name="deepgram"),
+        upload_task,
+        asyncio.create_task(_mem0_batch_processor(session), name="mem0"),
+        asyncio.create_task(_transcript_sender(session), name="transcripts"),
+        asyncio.create_task(_caption_processor(session), name="captions"),
+    ]
+
+    try:
+        # Wait for any task to complete (usually router on disconnect)
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+
+        # On disconnect the router has sent poison pills; let the image and
+        # upload tasks flush the final partial clip before tearing down
+        if router_task in done:
+            await asyncio.wait(
+                [image_task, upload_task], timeout=SHUTDOWN_DRAIN_TIMEOUT_SEC
+            )
+
+        _retrieve_results(tasks)
+
+    except Exception as e:
+        logger.error(f"Video caption error: {e}")
+    finally:
+        # Cancel and await the rest so no task outlives the Deepgram connection
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
 
 @router.websocket("/ws/video-caption")
 async def video_caption_endpoint(websocket: WebSocket):
@@ -39,6 +632,8 @@ async def video_caption_endpoint(websocket: WebSocket):
         {"image": "data:image/jpeg;base64,<base64>", "processor": 0}
         {"type": "audio_stream", "audio_chunk": "<base64 PCM 24kHz>"}
         {"type": "audio_stream_stop"}
+        or binary frames (no base64): 1 type byte followed by the payload
+        0x00 + <jpeg bytes> | 0x01 + <PCM 24kHz linear16> | 0x02 (audio stream stop)
 
     Message format (outgoing):
         {"type": "moondream_caption", "timestamp": "...", "description": "...", "frame_number": N}
@@ -47,334 +642,7 @@ async def video_caption_endpoint(websocket: WebSocket):
     await websocket.accept()
     logger.info("Video caption WebSocket connected")
 
-    # Session ID for tracking
-    session_id = f"vc_{id(websocket)}_{int(datetime.now().timestamp())}"
-
-    # Create separate queues for parallel processing
-    audio_queue: asyncio.Queue = asyncio.Queue()
-    image_queue: asyncio.Queue = asyncio.Queue()
-    upload_queue: asyncio.Queue = asyncio.Queue()
-
-    # Batch buffers for Mem0 (flush every 30 seconds instead of immediate push)
-    transcript_batch: list[dict] = []
-    caption_batch: list[dict] = []
-
-    # Counters for Mem0 requests
-    mem0_transcript_requests = 0
-    mem0_caption_requests = 0
-    mem0_total_transcripts = 0
-    mem0_total_captions = 0
-
-    # Video clip encoder (10-second clips at 24 FPS)
-    clip_encoder = ClipEncoder(clip_duration_sec=10.0, fps=24)
-
-    # Track current clip metadata for Mem0 linking
-    current_clip_metadata: dict | None = None
-
-    # Shared state for Deepgram socket
-    deepgram_connection = None
-    deepgram_running = False
-
-    # Transcript callback
-    async def on_transcript(text: str, is_final: bool, speaker: str):
-        """Handle transcripts from Deepgram - stores separately in Mem0."""
-        # Send to client
-        await websocket.send_text(json.dumps({
-            "type": "transcript",
-            "text": text,
-            "is_final": is_final,
-            "speaker": speaker
-        }))
-
-        # Highlight in logs
-        if is_final:
-            logger.info(f">>> [STT FINAL] [{speaker}] {text}")
-            # Accumulate transcript for batched Mem0 push (every 30 seconds)
-            transcript_batch.append({
-                "timestamp": datetime.now().isoformat(),
-                "speaker": speaker,
-                "text": text,
-                "session_id": session_id
-            })
-        else:
-            logger.info(f"    [STT interim] [{speaker}] {text}")
-
-    # === Parallel Processing Tasks ===
-
-    async def message_router():
-        """Routes incoming WebSocket messages to appropriate queue."""
-        msg_count = 0
-        try:
-            while True:
-                data = await websocket.receive_text()
-                msg = json.loads(data)
-                msg_type = msg.get("type", "")
-                msg_count += 1
-
-                # Log every 50th message to avoid spam
-                if msg_count == 1 or msg_count % 50 == 0:
-                    logger.info(f"[Router] Msg #{msg_count}: type={msg_type}")
-
-                # Route audio messages
-                if msg_type in ("audio", "audio_stream") or "audio_chunk" in msg or msg_type == "audio_stream_stop":
-                    await audio_queue.put(msg)
-                # Route image messages
-                elif "image" in msg:
-                    await image_queue.put(msg)
-
-        except WebSocketDisconnect:
-            # Send poison pills to signal shutdown
-            await audio_queue.put(None)
-            await image_queue.put(None)
-            raise
-
-    async def audio_processor():
-        """Processes audio chunks - sends to Deepgram STT."""
-        nonlocal deepgram_connection, deepgram_running
-        chunk_count = 0
-
-        while True:
-            msg = await audio_queue.get()
-            if msg is None:
-                break  # Poison pill - shutdown
-
-            msg_type = msg.get("type")
-            if msg_type == "audio_stream_stop":
-                logger.info(f"[Audio] Stream stopped by client (processed {chunk_count} chunks)")
-                continue
-
-            audio_b64 = msg.get("audio_chunk") or msg.get("audio")
-            if audio_b64 and deepgram_connection and deepgram_running:
-                chunk_count += 1
-                # Log every 10 chunks to reduce clutter
-                if chunk_count % 10 == 0:
-                    logger.info(f"[Audio] Chunk #{chunk_count} forwarded to Deepgram")
-
-                # Deepgram takes raw bytes directly
-                audio_bytes = base64.b64decode(audio_b64)
-                try:
-                    await deepgram_connection.send_media(audio_bytes)
-                except Exception as e:
-                    logger.error(f"[Deepgram] Error sending audio: {e}")
-
-    async def upload_processor():
-        """Separate task for S3 uploads + PostgreSQL storage."""
-        nonlocal current_clip_metadata
-
-        # Check S3 configuration on startup
-        if not s3_manager.bucket_name:
-            logger.warning("[Upload] S3_BUCKET_NAME not configured - clips will NOT be stored!")
-        else:
-            logger.info(f"[Upload] S3 configured: bucket={s3_manager.bucket_name}")
-
-        while True:
-            item = await upload_queue.get()
-            if item is None:
-                logger.info("[Upload] Received shutdown signal")
-                break  # Shutdown signal
-
-            video_bytes, start_time_str, end_time_str, clip_index, thumbnail_bytes = item
-            logger.info(f"[Upload] Processing clip {clip_index}: {len(video_bytes)} bytes, thumbnail {len(thumbnail_bytes)} bytes")
-
-            if not s3_manager.bucket_name:
-                logger.warning(f"[Upload] Skipping clip {clip_index} - no S3 bucket configured")
-                continue
-
-            try:
-                # 1. Upload video clip to S3
-                s3_metadata = await s3_manager.upload_clip(
-                    session_id=session_id,
-                    clip_index=clip_index,
-                    video_bytes=video_bytes,
-                    start_time=start_time_str,
-                    end_time=end_time_str,
-                )
-
-                # 2. Upload thumbnail to S3
-                thumbnail_s3_key = None
-                if thumbnail_bytes:
-                    thumbnail_s3_key = await s3_manager.upload_thumbnail(
-                        session_id=session_id,
-                        clip_index=clip_index,
-                        image_bytes=thumbnail_bytes,
-                    )
-
-                # 3. Store in PostgreSQL for time-range queries
-                async with async_session_maker() as db_session:
-                    clip_record = await create_video_clip(
-                        session=db_session,
-                        session_id=session_id,
-                        clip_index=clip_index,
-                        s3_key=s3_metadata["s3_key"],
-                        s3_bucket=s3_metadata["s3_bucket"],
-                        start_time=datetime.fromisoformat(start_time_str),
-                        end_time=datetime.fromisoformat(end_time_str),
-                        thumbnail_s3_key=thumbnail_s3_key,
-                    )
-                    logger.info(f"[DB] Clip {clip_index} stored: id={clip_record.id}, thumb={thumbnail_s3_key}")
-
-                current_clip_metadata = s3_metadata
-                logger.info(f"[Upload] Clip {clip_index} complete: {s3_metadata['s3_key']}")
-
-            except Exception as e:
-                logger.error(f"[Upload] Failed for clip {clip_index}: {e}")
-
-    async def image_processor():
-        """Processes video frames - Moondream captioning + clip buffering."""
-        while True:
-            msg = await image_queue.get()
-            if msg is None:
-                # Flush remaining frames on disconnect
-                final_clip = clip_encoder.flush()
-                if final_clip:
-                    await upload_queue.put(final_clip)
-                await upload_queue.put(None)  # Signal upload_processor to stop
-                break
-
-            image_b64 = msg.get("image")
-            if not image_b64:
-                continue
-
-            # Strip data URL prefix if present (Ray-Ban format)
-            if isinstance(image_b64, str) and image_b64.startswith("data:"):
-                image_b64 = image_b64.split(",", 1)[1] if "," in image_b64 else image_b64
-
-            # Decode for both Moondream and clip encoding
-            image_bytes = base64.b64decode(image_b64)
-            timestamp = datetime.now()
-
-            # Add to clip buffer (ALL frames for smooth video)
-            clip_result = clip_encoder.add_frame(image_bytes, timestamp)
-            if clip_result:
-                # Clip ready - queue for upload (non-blocking)
-                logger.info("[Clip] Clip ready! Queuing for upload...")
-                await upload_queue.put(clip_result)
-
-            # Log frame buffer status periodically
-            if len(clip_encoder.frames) % 50 == 0 and len(clip_encoder.frames) > 0:
-                elapsed = (timestamp - clip_encoder.clip_start_time).total_seconds() if clip_encoder.clip_start_time else 0
-                logger.info(f"[Clip] Buffer: {len(clip_encoder.frames)} frames, {elapsed:.1f}s elapsed")
-
-            # Process with Moondream (throttled internally to every 10th frame)
-            result = await moondream_processor.process_frame(image_b64)
-
-            if result:
-                # Accumulate caption for batched Mem0 push (every 30 seconds)
-                caption_batch.append({
-                    "caption": {
-                        "timestamp": result["timestamp"],
-                        "description": result["description"],
-                        "frame_number": result["frame_number"],
-                    },
-                    "clip_metadata": current_clip_metadata,
-                })
-
-                # Send to client (include clip reference if available)
-                response = {
-                    "type": "moondream_caption",
-                    "timestamp": result["timestamp"],
-                    "description": result["description"],
-                    "frame_number": result["frame_number"],
-                }
-                if current_clip_metadata:
-                    response["clip_key"] = current_clip_metadata.get("s3_key")
-
-                await websocket.send_text(json.dumps(response))
-                logger.info(
-                    f"[Moondream] #{result['frame_number']} | {result['description'][:50]}..."
-                )
-
-    async def mem0_batch_processor():
-        """Flushes accumulated transcripts and captions to Mem0 every 30 seconds."""
-        nonlocal mem0_transcript_requests, mem0_caption_requests
-        nonlocal mem0_total_transcripts, mem0_total_captions
-
-        while True:
-            await asyncio.sleep(30)
-
-            # Snapshot and clear buffers
-            transcripts_to_push = transcript_batch.copy()
-            captions_to_push = caption_batch.copy()
-            transcript_batch.clear()
-            caption_batch.clear()
-
-            if not transcripts_to_push and not captions_to_push:
-                logger.debug("[Mem0] No data to batch push")
-                continue
-
-            # Combine transcripts into single coherent text
-            if transcripts_to_push:
-                combined_transcript = " ".join(t["text"] for t in transcripts_to_push)
-                # Aggregate speakers
-                speakers = list({t["speaker"] for t in transcripts_to_push})
-                speaker_str = speakers[0] if len(speakers) == 1 else "multiple"
-                await mem0_manager.store_transcript({
-                    "timestamp": transcripts_to_push[0]["timestamp"],
-                    "speaker": speaker_str,
-                    "text": combined_transcript,
-                    "session_id": session_id,
-                })
-                mem0_transcript_requests += 1
-                mem0_total_transcripts += len(transcripts_to_push)
-                logger.info(f"[Mem0] Batch transcript: {len(transcripts_to_push)} utterances -> '{combined_transcript[:60]}...'")
-
-            # Combine captions into grouped visual context
-            if captions_to_push:
-                descriptions = [c["caption"]["description"] for c in captions_to_push]
-                combined_description = " | ".join(descriptions)
-                # Use the last clip metadata
-                last_clip = captions_to_push[-1].get("clip_metadata")
-                await mem0_manager.store_caption_with_clip(
-                    caption={
-                        "timestamp": captions_to_push[0]["caption"]["timestamp"],
-                        "description": combined_description,
-                        "frame_number": captions_to_push[-1]["caption"]["frame_number"],
-                    },
-                    clip_metadata=last_clip,
-                )
-                mem0_caption_requests += 1
-                mem0_total_captions += len(captions_to_push)
-                logger.info(f"[Mem0] Batch captions: {len(captions_to_push)} frames -> '{combined_description[:60]}...'")
-
-            logger.info(f"[Mem0] Batch pushed: {len(transcripts_to_push)} transcripts, {len(captions_to_push)} captions")
-
-    async def flush_mem0_batch():
-        """Flush any remaining buffered data on disconnect."""
-        nonlocal mem0_transcript_requests, mem0_caption_requests
-        nonlocal mem0_total_transcripts, mem0_total_captions
-
-        if not transcript_batch and not caption_batch:
-            return
-
-        logger.info(f"[Mem0] Flushing final batch: {len(transcript_batch)} transcripts, {len(caption_batch)} captions")
-
-        if transcript_batch:
-            combined_transcript = " ".join(t["text"] for t in transcript_batch)
-            speakers = list({t["speaker"] for t in transcript_batch})
-            speaker_str = speakers[0] if len(speakers) == 1 else "multiple"
-            await mem0_manager.store_transcript({
-                "timestamp": transcript_batch[0]["timestamp"],
-                "speaker": speaker_str,
-                "text": combined_transcript,
-                "session_id": session_id,
-            })
-            mem0_transcript_requests += 1
-            mem0_total_transcripts += len(transcript_batch)
-
-        if caption_batch:
-            descriptions = [c["caption"]["description"] for c in caption_batch]
-            combined_description = " | ".join(descriptions)
-            last_clip = caption_batch[-1].get("clip_metadata")
-            await mem0_manager.store_caption_with_clip(
-                caption={
-                    "timestamp": caption_batch[0]["caption"]["timestamp"],
-                    "description": combined_description,
-                    "frame_number": caption_batch[-1]["caption"]["frame_number"],
-                },
-                clip_metadata=last_clip,
-            )
-            mem0_caption_requests += 1
-            mem0_total_captions += len(caption_batch)
+    session = _CaptionSession(websocket)
 
     # Initialize Deepgram
     deepgram_api_key = os.environ.get("DEEPGRAM_API_KEY")
@@ -385,36 +653,6 @@ async def video_caption_endpoint(websocket: WebSocket):
 
     client = AsyncDeepgramClient(api_key=deepgram_api_key)
 
-    # Deepgram message handler (v5.x SDK)
-    def on_message(message):
-        """Handle Deepgram transcript messages."""
-        try:
-            msg_type = getattr(message, "type", "Unknown")
-            logger.debug(f"[Deepgram] Received: {msg_type}")
-
-            # Check for transcript in channel.alternatives
-            if hasattr(message, 'channel'):
-                alternatives = message.channel.alternatives
-                if alternatives:
-                    text = alternatives[0].transcript
-                    is_final = getattr(message, 'is_final', False)
-
-                    # Extract speaker info if available
-                    speaker = "Speaker 0"
-                    if alternatives[0].words:
-                        first_word = alternatives[0].words[0]
-                        if hasattr(first_word, 'speaker'):
-                            speaker = f"Speaker {first_word.speaker}"
-
-                    if text:
-                        # Schedule the async callback
-                        asyncio.create_task(on_transcript(text, is_final, speaker))
-        except Exception as e:
-            logger.error(f"[Deepgram] Error processing message: {e}")
-
-    def on_error(error):
-        logger.error(f"[Deepgram] Error: {error}")
-
     try:
         # Connect using v1 API with nova-3 model
         async with client.listen.v1.connect(
@@ -427,68 +665,24 @@ async def video_caption_endpoint(websocket: WebSocket):
             sample_rate=24000,
             channels=1
         ) as connection:
-            deepgram_connection = connection
-            deepgram_running = True
+            session.deepgram_connection = connection
+            session.deepgram_running = True
 
             # Register event handlers
             connection.on(EventType.OPEN, lambda _: logger.info("[Deepgram] Connection opened"))
-            connection.on(EventType.MESSAGE, on_message)
+            connection.on(EventType.MESSAGE, lambda message: _on_deepgram_message(session, message))
             connection.on(EventType.CLOSE, lambda _: logger.info("[Deepgram] Connection closed"))
-            connection.on(EventType.ERROR, on_error)
+            connection.on(EventType.ERROR, _on_deepgram_error)
 
             logger.info("[Deepgram] Connected (Nova-3, diarize=true, 24kHz)")
 
-            # Launch parallel tasks
-            audio_task = asyncio.create_task(audio_processor())
-            image_task = asyncio.create_task(image_processor())
-            router_task = asyncio.create_task(message_router())
-            upload_task = asyncio.create_task(upload_processor())
-            mem0_task = asyncio.create_task(mem0_batch_processor())
-
-            # Deepgram listener task - keeps connection alive
-            async def deepgram_listener():
-                try:
-                    await connection.start_listening()
-                except Exception as e:
-                    logger.warning(f"[Deepgram] Listener ended: {e}")
-
-            deepgram_task = asyncio.create_task(deepgram_listener())
-
-            try:
-                # Wait for any task to complete (usually router on disconnect)
-                done, pending = await asyncio.wait(
-                    [audio_task, image_task, router_task, deepgram_task, upload_task, mem0_task],
-                    return_when=asyncio.FIRST_COMPLETED
-                )
-
-                # Retrieve results to avoid "Task exception never retrieved" warnings
-                for task in done:
-                    try:
-                        task.result()
-                    except WebSocketDisconnect:
-                        pass  # Normal disconnect
-                    except Exception as e:
-                        logger.error(f"Task error: {e}")
-
-                # Cancel pending tasks
-                for task in pending:
-                    task.cancel()
-
-            except Exception as e:
-                logger.error(f"Video caption error: {e}")
+            await _run_session_tasks(session, connection)
 
     except Exception as e:
         logger.error(f"[Deepgram] Connection error: {e}")
     finally:
-        deepgram_running = False
+        session.deepgram_running = False
         # Flush any remaining batched data to Mem0
-        await flush_mem0_batch()
-        # Print Mem0 request summary
-        total_requests = mem0_transcript_requests + mem0_caption_requests
-        logger.info("=" * 60)
-        logger.info("[Mem0] SESSION SUMMARY")
-        logger.info(f"[Mem0] Transcript requests: {mem0_transcript_requests} (batched {mem0_total_transcripts} utterances)")
-        logger.info(f"[Mem0] Caption requests: {mem0_caption_requests} (batched {mem0_total_captions} frames)")
-        logger.info(f"[Mem0] TOTAL API REQUESTS: {total_requests}")
-        logger.info("=" * 60)
+        await _flush_mem0_batch(session)
+        _log_mem0_summary(session)
         logger.info("Video caption WebSocket closed")
@@ -1,23 +1,202 @@
-"""Video clip encoder using OpenCV.
+"""Video clip encoder using PyAV.
 
-Buffers incoming frames and encodes them into MP4 clips at specified intervals.
+Encodes incoming frames into H.264 MP4 clips of a fixed duration. Each frame is
+encoded as it arrives, so only the thumbnail candidate is held in memory rather
+than a whole clip of raw frames. JPEG decoding uses libjpeg-turbo when available;
+decode and encode both run in thread pools so the event loop is never blocked.
+Encoding prefers NVENC and falls back to software encoders when no GPU is present.
 """
 
-import tempfile
-from collections import deque
-from datetime import datetime
-from pathlib import Path
+import asyncio
+import contextlib
+import functools
+import io
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from fractions import Fraction
 
+import av
 import cv2
 import numpy as np
 
 from app.core.log_config import logger
 
+try:
+    from turbojpeg import TJPF_BGR, TurboJPEG
+
+    _turbo_jpeg: TurboJPEG | None = TurboJPEG()
+    logger.info("[Encoder] Using libjpeg-turbo for JPEG decode")
+except (ImportError, RuntimeError, OSError):
+    # Native libturbojpeg not installed - fall back to OpenCV's decoder
+    _turbo_jpeg = None
+    logger.info("[Encoder] libjpeg-turbo unavailable, using OpenCV for JPEG decode")
+
+# Shared across sessions; both decoders release the GIL while decoding
+_decode_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="jpeg-decode")
+
+# Per-frame encode and per-clip finalize. Threads rather than processes: PyAV and
+# OpenCV release the GIL, and an open container cannot be handed to another process.
+_encode_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="clip-encode")
+
+# Thumbnails: inbound JPEGs up to this size are stored as-is; larger frames are
+# downscaled to THUMBNAIL_WIDTH before re-encoding
+THUMBNAIL_MAX_REUSE_BYTES = 64 * 1024
+THUMBNAIL_WIDTH = 320
+THUMBNAIL_JPEG_QUALITY = 75
+
+# Tried in order - hardware H.264 first, then software H.264, then MPEG-4 Part 2
+_VIDEO_CODEC_CANDIDATES = ("h264_nvenc", "libx264", "mpeg4")
+
+
+def decode_jpeg_sync(image_bytes: bytes) -> np.ndarray | None:
+    """Decode JPEG bytes to a BGR frame on the calling thread.
+
+    For callers already off the event loop; ``decode_jpeg`` runs this in the
+    shared decode pool.
+
+    Args:
+        image_bytes: JPEG-encoded image data.
+
+    Returns:
+        BGR uint8 array, or None if the data could not be decoded.
+    """
+    if _turbo_jpeg is not None:
+        try:
+            return _turbo_jpeg.decode(image_bytes, pixel_format=TJPF_BGR)
+        except OSError:
+            return None
+
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+async def decode_jpeg(image_bytes: bytes) -> np.ndarray | None:
+    """Decode JPEG bytes to a BGR frame in the shared decode pool.
+
+    Args:
+        image_bytes: JPEG-encoded image data.
+
+    Returns:
+        BGR uint8 array, or None if the data could not be decoded.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_decode_pool, decode_jpeg_sync, image_bytes)
+
+
+@functools.cache
+def _select_video_codec() -> str:
+    """Return the first encoder from the candidate list that can be opened on this host.
+
+    The probe runs once per process; an NVENC build without a usable GPU fails
+    to open and is skipped.
+    """
+    for name in _VIDEO_CODEC_CANDIDATES:
+        try:
+            ctx = av.CodecContext.create(name, "w")
+            ctx.width = 64
+            ctx.height = 64
+            ctx.pix_fmt = "yuv420p"
+            ctx.time_base = Fraction(1, 24)
+            ctx.open()
+        except (av.error.FFmpegError, ValueError):
+            continue
+        logger.info(f"[Encoder] Using video codec: {name}")
+        return name
+    raise RuntimeError(f"No usable video encoder among {_VIDEO_CODEC_CANDIDATES}")
+
+
+class _ClipWriter:
+    """Incremental in-memory MP4 writer for a single clip.
+
+    Not thread-safe: ClipEncoder awaits each call before issuing the next, so at
+    most one pool thread touches a writer at a time.
+    """
+
+    def __init__(self, width: int, height: int, fps: int):
+        # Mux straight into memory - MP4 needs a seekable output, which BytesIO is
+        self._buffer = io.BytesIO()
+        self._container = av.open(self._buffer, mode="w", format="mp4")
+        self._stream = self._container.add_stream(_select_video_codec(), rate=fps)
+        # yuv420p requires even dimensions; frames are rescaled on encode
+        self._stream.width = width - (width % 2)
+        self._stream.height = height - (height % 2)
+        self._stream.pix_fmt = "yuv420p"
+
+    def write(self, frame: np.ndarray) -> None:
+        """Encode one BGR frame and mux any packets the encoder emits."""
+        av_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+        self._container.mux(self._stream.encode(av_frame))
+
+    def finish(self) -> bytes:
+        """Drain the encoder, finalize the MP4 and return its bytes."""
+        self._container.mux(self._stream.encode(None))
+        self._container.close()
+        return self._buffer.getvalue()
+
+    def abort(self) -> None:
+        """Discard the clip without finalizing it."""
+        with contextlib.suppress(av.error.FFmpegError):
+            self._container.close()
+
+
+def _encode_thumbnail(frame: np.ndarray, jpeg_bytes: bytes | memoryview | None) -> bytes:
+    """Produce thumbnail JPEG bytes for a frame.
+
+    Args:
+        frame: BGR uint8 array.
+        jpeg_bytes: The frame's original JPEG encoding, if known.
+
+    Returns:
+        The original JPEG when it is small enough, otherwise a downscaled re-encode.
+    """
+    if jpeg_bytes is not None and len(jpeg_bytes) <= THUMBNAIL_MAX_REUSE_BYTES:
+        return bytes(jpeg_bytes)
+
+    height, width = frame.shape[:2]
+    if width > THUMBNAIL_WIDTH:
+        size = (THUMBNAIL_WIDTH, max(1, round(height * THUMBNAIL_WIDTH / width)))
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_JPEG_QUALITY])
+    return buffer.tobytes()
+
+
+def _finish_clip(
+    writer: _ClipWriter,
+    thumbnail_frame: np.ndarray,
+    thumbnail_jpeg: bytes | memoryview | None,
+    frame_count: int,
+    start_time: datetime,
+    end_time: datetime,
+    clip_index: int,
+) -> tuple[bytes, str, str, int, bytes]:
+    """Finalize a clip's MP4 and encode its thumbnail. Runs in ``_encode_pool``.
+
+    Returns:
+        Tuple of (video_bytes, start_time_iso, end_time_iso, clip_index, thumbnail_bytes).
+    """
+    video_bytes = writer.finish()
+    thumbnail_bytes = _encode_thumbnail(thumbnail_frame, thumbnail_jpeg)
+
+    logger.info(
+        f"[Encoder] Clip {clip_index}: {frame_count} frames, "
+        f"{len(video_bytes)} bytes, thumb {len(thumbnail_bytes)} bytes"
+    )
+
+    return (
+        video_bytes,
+        start_time.isoformat(),
+        end_time.isoformat(),
+        clip_index,
+        thumbnail_bytes,
+    )
+
 
 class ClipEncoder:
-    """Buffers frames and encodes them into video clips.
+    """Encodes frames into video clips as they arrive.
 
-    Accumulates frames for a specified duration, then encodes them to MP4.
+    Opens an MP4 writer on the first frame of each clip, encodes every frame
+    immediately, and finalizes the clip once the duration is reached. The frame
+    nearest the middle of the clip is kept as the thumbnail.
     """
 
     def __init__(self, clip_duration_sec: float = 10.0, fps: int = 24):
@@ -29,14 +208,28 @@ class ClipEncoder:
         """
         self.clip_duration = clip_duration_sec
         self.fps = fps
-        self.frames: deque = deque()
+        self._writer: _ClipWriter | None = None
+        self._thumbnail_frame: np.ndarray | None = None
+        self._thumbnail_jpeg: bytes | memoryview | None = None
+        self._last_frame: np.ndarray | None = None
+        self._last_jpeg: bytes | memoryview | None = None
+        self._n = 0
         self.clip_start_time: datetime | None = None
+        self._last_timestamp: datetime | None = None
+        # Absolute cut-off times, so each frame costs two comparisons
+        self._thumbnail_after: datetime | None = None
+        self._clip_end_after: datetime | None = None
         self.clip_index = 0
 
-    def add_frame(
+    @property
+    def frame_count(self) -> int:
+        """Number of frames encoded into the current clip."""
+        return self._n
+
+    async def add_frame(
         self, image_bytes: bytes, timestamp: datetime
     ) -> tuple[bytes, str, str, int, bytes] | None:
-        """Add a frame to the buffer.
+        """Decode a JPEG frame and add it to the current clip.
 
         Args:
             image_bytes: JPEG-encoded image data.
@@ -47,84 +240,98 @@ class ClipEncoder:
             (video_bytes, start_time_iso, end_time_iso, clip_index, thumbnail_bytes).
             Otherwise returns None.
         """
-        # Decode JPEG to numpy array
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
+        frame = await decode_jpeg(image_bytes)
         if frame is None:
             logger.warning("[Encoder] Failed to decode frame")
             return None
+        return await self.add_frame_decoded(frame, timestamp, jpeg_bytes=image_bytes)
+
+    async def add_frame_decoded(
+        self,
+        frame: np.ndarray,
+        timestamp: datetime,
+        jpeg_bytes: bytes | memoryview | None = None,
+    ) -> tuple[bytes, str, str, int, bytes] | None:
+        """Encode an already-decoded frame into the current clip.
+
+        Args:
+            frame: BGR uint8 array. Must not be mutated afterwards, as it may be
+                kept as the clip thumbnail.
+            timestamp: Capture timestamp for the frame.
+            jpeg_bytes: The frame's original JPEG, reused as the thumbnail if
+                this frame is picked and the JPEG is small enough.
+
+        Returns:
+            If clip duration is reached, returns tuple of:
+            (video_bytes, start_time_iso, end_time_iso, clip_index, thumbnail_bytes).
+            Otherwise returns None.
+        """
+        loop = asyncio.get_running_loop()
 
-        if self.clip_start_time is None:
+        if self._writer is None:
+            height, width = frame.shape[:2]
+            self._writer = await loop.run_in_executor(
+                _encode_pool, _ClipWriter, width, height, self.fps
+            )
             self.clip_start_time = timestamp
+            self._thumbnail_after = timestamp + timedelta(seconds=self.clip_duration / 2)
+            self._clip_end_after = timestamp + timedelta(seconds=self.clip_duration)
 
-        self.frames.append((frame, timestamp))
+        await loop.run_in_executor(_encode_pool, self._writer.write, frame)
+        self._n += 1
+        self._last_frame = frame
+        self._last_jpeg = jpeg_bytes
+        self._last_timestamp = timestamp
+
+        # Keep the first frame past the clip midpoint as thumbnail
+        if self._thumbnail_frame is None and timestamp >= self._thumbnail_after:
+            self._thumbnail_frame = frame
+            self._thumbnail_jpeg = jpeg_bytes
 
         # Check if clip duration reached
-        elapsed = (timestamp - self.clip_start_time).total_seconds()
-        if elapsed >= self.clip_duration:
-            return self._encode_clip()
+        if timestamp >= self._clip_end_after:
+            return await self._encode_clip()
 
         return None
 
-    def _encode_clip(self) -> tuple[bytes, str, str, int, bytes]:
-        """Encode buffered frames to MP4 and extract middle frame as thumbnail.
+    async def _encode_clip(self) -> tuple[bytes, str, str, int, bytes]:
+        """Finalize the current clip in the encode pool and start a fresh one.
+
+        Clips that end before their midpoint (e.g. on flush) use the most recent
+        frame as thumbnail.
 
         Returns:
             Tuple of (video_bytes, start_time_iso, end_time_iso, clip_index, thumbnail_bytes).
         """
-        if not self.frames:
-            return (b"", "", "", self.clip_index, b"")
-
-        # Get frame dimensions from first frame
-        first_frame = self.frames[0][0]
-        height, width = first_frame.shape[:2]
-
-        # Extract middle frame as thumbnail BEFORE clearing frames
-        middle_idx = len(self.frames) // 2
-        middle_frame = self.frames[middle_idx][0]
-        _, thumbnail_buffer = cv2.imencode(
-            ".jpg", middle_frame, [cv2.IMWRITE_JPEG_QUALITY, 80]
-        )
-        thumbnail_bytes = thumbnail_buffer.tobytes()
-
-        # Write to temp file (OpenCV VideoWriter requires file path)
-        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as f:
-            temp_path = f.name
-
-        # Use mp4v codec for compatibility
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        writer = cv2.VideoWriter(temp_path, fourcc, self.fps, (width, height))
-
-        frame_count = 0
-        for frame, _ in self.frames:
-            writer.write(frame)
-            frame_count += 1
-        writer.release()
-
-        # Read encoded bytes
-        video_bytes = Path(temp_path).read_bytes()
-        Path(temp_path).unlink()  # Delete temp file
-
-        # Extract timestamps
-        start_time = self.frames[0][1].isoformat()
-        end_time = self.frames[-1][1].isoformat()
+        writer = self._writer
+        if self._thumbnail_frame is not None:
+            thumbnail_frame, thumbnail_jpeg = self._thumbnail_frame, self._thumbnail_jpeg
+        else:
+            thumbnail_frame, thumbnail_jpeg = self._last_frame, self._last_jpeg
+        frame_count = self._n
+        start_time = self.clip_start_time
+        end_time = self._last_timestamp
         current_index = self.clip_index
 
-        # Reset buffer for next clip
-        self.frames.clear()
-        self.clip_start_time = None
+        # Detach state before finalizing so the next clip can open its own writer
+        self._clear_clip()
         self.clip_index += 1
 
-        logger.info(
-            f"[Encoder] Clip {current_index}: {frame_count} frames, "
-            f"{len(video_bytes)} bytes, thumb {len(thumbnail_bytes)} bytes"
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _encode_pool,
+            _finish_clip,
+            writer,
+            thumbnail_frame,
+            thumbnail_jpeg,
+            frame_count,
+            start_time,
+            end_time,
+            current_index,
         )
 
-        return (video_bytes, start_time, end_time, current_index, thumbnail_bytes)
-
-    def flush(self) -> tuple[bytes, str, str, int, bytes] | None:
-        """Encode any remaining frames.
+    async def flush(self) -> tuple[bytes, str, str, int, bytes] | None:
+        """Finalize the current partial clip.
 
         Call this on disconnect to capture the final partial clip.
 
@@ -132,13 +339,27 @@ class ClipEncoder:
             Tuple of (video_bytes, start_time_iso, end_time_iso, clip_index, thumbnail_bytes)
             if frames exist, otherwise None.
         """
-        if len(self.frames) > 0:
-            logger.info(f"[Encoder] Flushing {len(self.frames)} remaining frames")
-            return self._encode_clip()
+        if self._n > 0:
+            logger.info(f"[Encoder] Flushing {self._n} remaining frames")
+            return await self._encode_clip()
         return None
 
-    def reset(self):
-        """Reset the encoder state."""
-        self.frames.clear()
+    def _clear_clip(self) -> None:
+        """Drop per-clip state without touching the clip index."""
+        self._writer = None
+        self._thumbnail_frame = None
+        self._thumbnail_jpeg = None
+        self._last_frame = None
+        self._last_jpeg = None
+        self._n = 0
         self.clip_start_time = None
+        self._last_timestamp = None
+        self._thumbnail_after = None
+        self._clip_end_after = None
+
+    def reset(self):
+        """Reset the encoder state, discarding any partial clip."""
+        if self._writer is not None:
+            self._writer.abort()
+        self._clear_clip()
         self.clip_index = 0
@@ -0,0 +1,82 @@
+"""Batched writer for video clip metadata.
+
+Upload tasks from every WebSocket session enqueue their clip rows here; a single
+background task writes them to PostgreSQL in multi-row INSERTs, flushing every
+``max_rows`` clips or ``flush_interval_sec`` seconds, whichever comes first.
+"""
+
+import asyncio
+
+from app.core.db import async_session_maker
+from app.core.log_config import logger
+from app.crud import create_video_clips
+
+
+class ClipMetadataWriter:
+    """Accumulates VideoClip rows and flushes them in batches.
+
+    The background task starts lazily on the first enqueue so it binds to the
+    running event loop, and close() drains whatever is still pending.
+    """
+
+    def __init__(self, max_rows: int = 50, flush_interval_sec: float = 2.0):
+        self.max_rows = max_rows
+        self.flush_interval_sec = flush_interval_sec
+        self._queue: asyncio.Queue[dict | None] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    def enqueue(self, clip: dict) -> None:
+        """Queue one clip row for the next batch.
+
+        Args:
+            clip: Column values, keyed like create_video_clip's arguments.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="clip-metadata-writer")
+        self._queue.put_nowait(clip)
+
+    async def close(self) -> None:
+        """Flush pending rows and stop the background task."""
+        if self._task is None or self._task.done():
+            return
+        self._queue.put_nowait(None)
+        await self._task
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            clip = await self._queue.get()
+            if clip is None:
+                return
+
+            batch = [clip]
+            stop = False
+            deadline = loop.time() + self.flush_interval_sec
+            while len(batch) < self.max_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    clip = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if clip is None:
+                    stop = True
+                    break
+                batch.append(clip)
+
+            await self._write(batch)
+            if stop:
+                return
+
+    async def _write(self, batch: list[dict]) -> None:
+        try:
+            async with async_session_maker() as db_session:
+                await create_video_clips(session=db_session, clips=batch)
+            logger.info(f"[DB] Stored {len(batch)} clip(s)")
+        except Exception as e:
+            logger.error(f"[DB] Failed to store {len(batch)} clip(s): {e}")
+
+
+# Singleton instance
+clip_metadata_writer = ClipMetadataWriter()
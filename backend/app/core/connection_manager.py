@@ -1,16 +1,18 @@
 import asyncio
-import json
 import time
-from datetime import datetime
-from io import BytesIO
-from pathlib import Path
+from collections import deque
 
+import orjson
 from fastapi import WebSocket
 from starlette.websockets import WebSocketDisconnect
 
 from app.core.grok_processor import GrokStreamManager
 from app.core.log_config import logger
 
+# Per-connection queue bounds
+AUDIO_QUEUE_MAXSIZE = 64
+IMAGE_QUEUE_MAXSIZE = 8
+
 
 def log_message(message: str, level: str = "INFO"):
     if level == "ERROR":
@@ -20,127 +22,135 @@ def log_message(message: str, level: str = "INFO"):
     else:
         logger.info(message)
 
-class AudioStreamRecorder:
-    """Handles recording of streaming audio chunks in memory and conversion to MP3"""
-    
-    def __init__(self, output_dir: str = "audio_recordings"):
-        self.output_dir = Path(output_dir)
-        self.output_dir.mkdir(exist_ok=True)
-        self.active_recordings = {}  # session_id -> recording_info
-        
-    def start_recording(self, session_id: str) -> str:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"audio_stream_{session_id}_{timestamp}.mp3"
-        filepath = self.output_dir / filename
-        
-        self.active_recordings[session_id] = {
-            'filepath': filepath,
-            'filename': filename,
-            'audio_buffer': BytesIO(),
-            'start_time': datetime.now(),
-            'chunk_count': 0,
-            'total_bytes': 0,
-        }
-        log_message(f"Started audio recording session {session_id}")
-        return str(filepath)
-    
-    def add_audio_chunk(self, session_id: str, audio_data: bytes) -> bool:
-        if session_id not in self.active_recordings:
-            return False
-        try:
-            recording = self.active_recordings[session_id]
-            recording['audio_buffer'].write(audio_data)
-            recording['chunk_count'] += 1
-            recording['total_bytes'] += len(audio_data)
-            return True
-        except Exception as e:
-            log_message(f"Error adding chunk: {e}", "ERROR")
-            return False
-    
-    def cleanup_session(self, session_id: str):
-        if session_id in self.active_recordings:
-            try:
-                self.active_recordings[session_id]['audio_buffer'].close()
-                del self.active_recordings[session_id]
-            except:
-                pass
+
+class _SingleConsumerQueue:
+    """Minimal FIFO for one producer and one consumer on the same event loop.
+
+    Skips asyncio.Queue's getter/putter bookkeeping: put_nowait appends and wakes
+    the consumer, get waits only when the deque is empty. Mirrors asyncio.Queue's
+    maxsize / QueueFull semantics so callers can choose back-pressure or dropping.
+    """
+
+    def __init__(self, maxsize: int = 0):
+        self.maxsize = maxsize
+        self._items = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= len(self._items)
+
+    def put_nowait(self, item) -> None:
+        if self.full():
+            raise asyncio.QueueFull
+        self._items.append(item)
+        self._not_empty.set()
+        if self.full():
+            self._not_full.clear()
+
+    async def put(self, item) -> None:
+        while self.full():
+            await self._not_full.wait()
+        self.put_nowait(item)
+
+    def get_nowait(self):
+        if not self._items:
+            raise asyncio.QueueEmpty
+        item = self._items.popleft()
+        self._not_full.set()
+        return item
+
+    async def get(self):
+        while not self._items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self.get_nowait()
+
+    def qsize(self) -> int:
+        return len(self._items)
+
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
-        self.audio_recorder = AudioStreamRecorder()
-        self.grok_manager = GrokStreamManager(self.audio_recorder, self)
+        self.active_connections: set[WebSocket] = set()
+        self.grok_manager = GrokStreamManager(self)
         self.active_audio_sessions = {}  # websocket -> session_id
         self.audio_queues = {}
         self.image_queues = {}
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        self.active_connections.discard(websocket)
         self.stop_audio_recording(websocket)
 
     async def handle_websocket_with_parallel_processing(self, websocket: WebSocket):
-        audio_queue = asyncio.Queue()
-        image_queue = asyncio.Queue()
+        # Audio back-pressures the router; stale video frames are dropped instead
+        audio_queue = _SingleConsumerQueue(maxsize=AUDIO_QUEUE_MAXSIZE)
+        image_queue = _SingleConsumerQueue(maxsize=IMAGE_QUEUE_MAXSIZE)
         self.audio_queues[websocket] = audio_queue
         self.image_queues[websocket] = image_queue
         
-        audio_task = asyncio.create_task(self.audio_processor_task(websocket, audio_queue))
-        image_task = asyncio.create_task(self.image_processor_task(websocket, image_queue))
-        router_task = asyncio.create_task(self.message_router(websocket, audio_queue, image_queue))
-        
+        tasks = [
+            asyncio.create_task(self.audio_processor_task(websocket, audio_queue), name="audio_task"),
+            asyncio.create_task(self.image_processor_task(websocket, image_queue), name="image_task"),
+            asyncio.create_task(self.message_router(websocket, audio_queue, image_queue), name="router_task"),
+        ]
+
         try:
-            done, pending = await asyncio.wait(
-                [audio_task, image_task, router_task],
-                return_when=asyncio.FIRST_COMPLETED
-            )
-            
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+
             # Retrieve results to avoid "Task exception never retrieved" warnings
             for task in done:
-                task_name = "unknown"
-                if task == audio_task: task_name = "audio_task"
-                elif task == image_task: task_name = "image_task"
-                elif task == router_task: task_name = "router_task"
-                
                 try:
                     task.result()
                 except WebSocketDisconnect:
                     pass  # Normal client disconnect
                 except Exception as e:
-                    log_message(f"Task {task_name} error: {e}", "ERROR")
-
-            for task in pending: task.cancel()
+                    log_message(f"Task {task.get_name()} error: {e}", "ERROR")
         finally:
-            if websocket in self.audio_queues: del self.audio_queues[websocket]
-            if websocket in self.image_queues: del self.image_queues[websocket]
-
-    async def message_router(self, websocket: WebSocket, audio_queue: asyncio.Queue, image_queue: asyncio.Queue):
+            # Cancel and await the rest so no task outlives the connection
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.audio_queues.pop(websocket, None)
+            self.image_queues.pop(websocket, None)
+
+    async def message_router(self, websocket: WebSocket, audio_queue: _SingleConsumerQueue, image_queue: _SingleConsumerQueue):
         try:
             while True:
                 data = await websocket.receive_text()
-                msg = json.loads(data)
+                msg = orjson.loads(data)
                 msg_type = msg.get('type', '')
                 
                 if msg_type.startswith('audio_stream'):
                     await audio_queue.put(msg)
                 else:
-                    await image_queue.put(msg)
+                    self._put_latest(image_queue, msg)
         except WebSocketDisconnect:
             await audio_queue.put(None)
-            await image_queue.put(None)
+            self._put_latest(image_queue, None)
             raise
 
-    async def audio_processor_task(self, websocket: WebSocket, queue: asyncio.Queue):
+    @staticmethod
+    def _put_latest(queue: _SingleConsumerQueue, item) -> None:
+        """Enqueue without blocking; a newer frame replaces the oldest stale one."""
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            queue.get_nowait()
+            queue.put_nowait(item)
+
+    async def audio_processor_task(self, websocket: WebSocket, queue: _SingleConsumerQueue):
         while True:
             msg = await queue.get()
             if msg is None: break
             await self.handle_audio_stream(websocket, msg)
 
-    async def image_processor_task(self, websocket: WebSocket, queue: asyncio.Queue):
+    async def image_processor_task(self, websocket: WebSocket, queue: _SingleConsumerQueue):
         while True:
             msg = await queue.get()
             if msg is None: break
@@ -166,12 +176,11 @@ class ConnectionManager:
             if not session_id:
                 session_id = f"ws_{id(websocket)}_{int(time.time())}"
                 self.active_audio_sessions[websocket] = session_id
-                self.audio_recorder.start_recording(session_id)
                 # Start Grok session (which connects to Deepgram)
                 asyncio.create_task(self.grok_manager.start_session(websocket, session_id))
-                await websocket.send_text(json.dumps({"status": "audio_recording_started", "session_id": session_id}))
+                await websocket.send_text(orjson.dumps({"status": "audio_recording_started", "session_id": session_id}).decode())
             
-            await self.grok_manager.handle_audio_chunk(websocket, chunk, session_id)
+            await self.grok_manager.handle_audio_chunk(websocket, chunk)
             
         elif msg_type == 'audio_stream_stop':
             self.stop_audio_recording(websocket)
@@ -180,7 +189,6 @@ class ConnectionManager:
         session_id = self.active_audio_sessions.get(websocket)
         if session_id:
             asyncio.create_task(self.grok_manager.cleanup_session(websocket))
-            self.audio_recorder.cleanup_session(session_id)
             del self.active_audio_sessions[websocket]
 
 manager = ConnectionManager()
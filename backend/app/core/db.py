@@ -22,6 +22,16 @@ if url.drivername == "postgresql":
 engine: AsyncEngine = create_async_engine(
     url,  # Use the SQLAlchemy URL object directly
     future=True,
+    # Compiled-statement cache; default 500 entries, sized up so CRUD and
+    # ORM-internal statements (loaders, flush INSERTs) all stay resident
+    query_cache_size=1200,
+    # Sized for concurrent WebSocket sessions each holding a connection briefly;
+    # pre-ping replaces connections the server or a proxy dropped while idle,
+    # and recycling retires them before typical idle timeouts kick in
+    pool_size=20,
+    max_overflow=10,
+    pool_recycle=3600,
+    pool_pre_ping=True,
 )
 
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -0,0 +1,37 @@
+"""Shared thread pool for blocking network I/O (S3, Mem0, Moondream).
+
+asyncio.to_thread copies the caller's contextvars and goes through the default
+executor, whose size depends on the host's CPU count. Blocking SDK calls on
+the hot path go through run_io instead, which uses one pool sized for I/O and
+skips the context copy.
+"""
+
+import asyncio
+import functools
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+# Threads mostly sit waiting on sockets, so size for concurrency rather than cores
+IO_MAX_WORKERS = 16
+
+io_executor = ThreadPoolExecutor(max_workers=IO_MAX_WORKERS, thread_name_prefix="io")
+
+
+async def run_io(fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+    """Run a blocking call in the shared I/O pool.
+
+    Args:
+        fn: Blocking callable.
+        *args: Positional arguments for ``fn``.
+        **kwargs: Keyword arguments for ``fn``.
+
+    Returns:
+        Whatever ``fn`` returns.
+    """
+    loop = asyncio.get_running_loop()
+    if kwargs:
+        return await loop.run_in_executor(io_executor, functools.partial(fn, *args, **kwargs))
+    return await loop.run_in_executor(io_executor, fn, *args)
@@ -1,11 +1,13 @@
 import asyncio
-import json
-import base64
+import heapq
 import os
 import time
+from contextlib import AsyncExitStack
 from dotenv import load_dotenv
 import httpx
 import logging
+import orjson
+import pybase64
 
 from deepgram import AsyncDeepgramClient
 from deepgram.core.events import EventType
@@ -17,6 +19,191 @@ load_dotenv()
 
 from app.core.log_config import logger
 
+# agent_token is the hottest outgoing message; splice the JSON-encoded text into a
+# fixed envelope instead of building and serializing a dict each time. Tokens are
+# coalesced until either limit below is reached.
+_AGENT_TOKEN_PREFIX = b'{"type":"agent_token","text":'
+_AGENT_TOKEN_SUFFIX = b'}'
+TOKEN_FLUSH_INTERVAL_SEC = 0.015
+TOKEN_FLUSH_CHARS = 64
+
+# Per-service timeout when opening the Deepgram and Hume sockets
+CONNECT_TIMEOUT_SEC = 5.0
+
+# Minimum spacing between video frames sent to Hume's face model, per session
+HUME_FACE_INTERVAL_SEC = 0.2
+
+# Static request parts, built once rather than on every final transcript
+_SYSTEM_MSG = {
+    "role": "system",
+    "content": "You are JARVIS, an AI assistant for due diligence meetings. You can store and search memories about companies, founders, and past investments. Use tools to remember important information and recall relevant context."
+}
+
+_MEM0_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "store_memory",
+            "description": "Store important information or observations for future reference",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "content": {
+                        "type": "string",
+                        "description": "The information to remember"
+                    },
+                    "category": {
+                        "type": "string",
+                        "description": "Category of memory (e.g., company_info, red_flag, green_flag, funding)"
+                    }
+                },
+                "required": ["content"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_memories",
+            "description": "Search past memories and observations for relevant context",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "What to search for in past memories"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of results to return",
+                        "default": 5
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+    }
+]
+
+# Pre-serialized so orjson copies the bytes instead of re-encoding the schema
+_MEM0_TOOLS_FRAGMENT = orjson.Fragment(orjson.dumps(_MEM0_TOOLS))
+
+async def _iter_sse_data(response):
+    """Yield the raw bytes of each ``data:`` line in a streamed SSE response.
+
+    Works on bytes end to end so lines are never decoded to str; orjson parses
+    the yielded payloads directly.
+    """
+    buffer = bytearray()
+    async for chunk in response.aiter_bytes():
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", start)) != -1:
+            if buffer.startswith(b"data: ", start, end):
+                yield bytes(buffer[start + 6:end]).strip()
+            start = end + 1
+        del buffer[:start]
+    if buffer.startswith(b"data: "):
+        yield bytes(buffer[6:]).strip()
+
+async def _gather_or_raise(*aws):
+    """Like asyncio.gather, but waits for every awaitable before raising the first error.
+
+    Lets an AsyncExitStack unwind every context that was entered, even when a
+    sibling connect fails.
+    """
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+def _tool_call_slot(tool_calls: dict[int, dict], tc: dict) -> int:
+    """Pick the slot a streamed tool-call fragment belongs to.
+
+    A fragment without an index continues the last call, unless it carries a
+    different call id; only then does it open a slot of its own.
+    """
+    index = tc.get("index")
+    if index is not None:
+        return index
+    if not tool_calls:
+        return 0
+    last = next(reversed(tool_calls))
+    call_id, last_id = tc.get("id"), tool_calls[last].get("id")
+    if call_id and last_id and call_id != last_id:
+        return max(tool_calls) + 1
+    return last
+
+def _merge_tool_call_deltas(tool_calls: dict[int, dict], deltas: list[dict]) -> None:
+    """Fold streamed tool-call fragments into ``tool_calls``, keyed by their index."""
+    for tc in deltas:
+        slot = tool_calls.setdefault(_tool_call_slot(tool_calls, tc), {"name": "", "arguments": ""})
+        if tc.get("id"):
+            slot["id"] = tc["id"]
+        func = tc.get("function") or {}
+        if func.get("name"):
+            slot["name"] = func["name"]
+        slot["arguments"] += func.get("arguments") or ""
+
+async def _send_quietly(websocket, payload: str) -> None:
+    """Send a text frame, ignoring a client that has already gone away."""
+    try:
+        await websocket.send_text(payload)
+    except Exception:
+        pass
+
+class _TokenCoalescer:
+    """Batches streamed Grok tokens into fewer agent_token frames.
+
+    A batch goes out once it holds TOKEN_FLUSH_CHARS, or TOKEN_FLUSH_INTERVAL_SEC
+    after its first token. The second case runs on a timer, so text that arrives
+    just before a model pause isn't held until the next token.
+    """
+
+    def __init__(self, websocket):
+        self._websocket = websocket
+        self._loop = asyncio.get_running_loop()
+        self._tokens: list[str] = []
+        self._chars = 0
+        self._timer: asyncio.TimerHandle | None = None
+        # Batch sent by the timer; later sends wait on it so frames stay in order
+        self._timer_send: asyncio.Task | None = None
+
+    async def add(self, text: str) -> None:
+        self._tokens.append(text)
+        self._chars += len(text)
+        if self._chars >= TOKEN_FLUSH_CHARS:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = self._loop.call_later(TOKEN_FLUSH_INTERVAL_SEC, self._on_timer)
+
+    async def flush(self) -> None:
+        """Send whatever is buffered, after any batch the timer already took."""
+        previous, self._timer_send = self._timer_send, None
+        await self._send_after(previous, self._take())
+
+    def _take(self) -> str:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        text = "".join(self._tokens)
+        self._tokens.clear()
+        self._chars = 0
+        return text
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._timer_send = asyncio.create_task(self._send_after(self._timer_send, self._take()))
+
+    async def _send_after(self, previous: asyncio.Task | None, text: str) -> None:
+        if previous is not None:
+            await previous
+        if text:
+            await self._websocket.send_text(
+                (_AGENT_TOKEN_PREFIX + orjson.dumps(text) + _AGENT_TOKEN_SUFFIX).decode()
+            )
+
 def log_message(message: str, level: str = "INFO"):
     if level == "ERROR":
         logger.error(message)
@@ -26,16 +213,25 @@ def log_message(message: str, level: str = "INFO"):
         logger.info(message)
 
 class GrokStreamManager:
-    def __init__(self, audio_recorder=None, connection_manager=None):
+    def __init__(self, connection_manager=None):
         """Initialize the Grok Stream Manager (Deepgram STT + Grok LLM + TTS)."""
-        self.audio_recorder = audio_recorder
         self.connection_manager = connection_manager
         self.active_sessions = {}
         self.last_frame_by_websocket = {}
         
         self.xai_api_key = os.environ.get("XAI_API_KEY")
         self.deepgram_api_key = os.environ.get("DEEPGRAM_API_KEY")
-        self.http_client = httpx.AsyncClient(timeout=30.0)
+        # One pooled HTTP/2 client: concurrent Grok streams multiplex over a kept-alive
+        # connection instead of each paying a TLS handshake
+        self.http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=64,
+                max_keepalive_connections=32,
+                keepalive_expiry=60.0,
+            ),
+        )
         self.hume_manager = HumeStreamManager()
 
     async def start_session(self, websocket, session_id: str):
@@ -45,96 +241,41 @@ class GrokStreamManager:
                 'socket_client': None,
                 'hume_socket': None,
                 'stop_event': asyncio.Event(),
-                'transcript_buffer': []
+                'transcript_buffer': [],
+                'last_hume_face_ts': 0.0,
+                # Emotion scores last sent to this client; the manager only keeps the latest
+                'reported_emotions': {},
             }
-            
-            deepgram = AsyncDeepgramClient(api_key=self.deepgram_api_key)
-            
+
             async def on_message(result, **kwargs):
                 try:
-                    if hasattr(result, 'channel'):
-                        alternatives = result.channel.alternatives
-                        if alternatives:
-                            sentence = alternatives[0].transcript
-                            
-                            # Extract speaker info if available
-                            speaker = "Unknown"
-                            if alternatives[0].words:
-                                # Simple heuristic: take speaker of the first word
-                                first_word = alternatives[0].words[0]
-                                if hasattr(first_word, 'speaker'):
-                                    speaker = f"Speaker {first_word.speaker}"
-
-                            if len(sentence) > 0:
-                                is_final = result.is_final
-                                log_message(f"STT [{speaker}]: {sentence} (Final: {is_final})")
-                                
-                                # Send live transcript back to client immediately
-                                await websocket.send_text(json.dumps({
-                                    "type": "transcript",
-                                    "text": sentence,
-                                    "is_final": is_final,
-                                    "speaker": speaker
-                                }))
-                                
-                                if is_final:
-                                    await self.process_with_grok(websocket, sentence, speaker)
+                    await self._handle_transcript(websocket, result)
                 except Exception as e:
                     log_message(f"Error processing message: {e}", level="ERROR")
 
             async def on_error(error, **kwargs):
                  log_message(f"Deepgram Error: {error}", level="ERROR")
 
-            options = {
-                "model": "nova-3", 
-                "language": "en-US", 
-                "smart_format": "true", 
-                "interim_results": "true",
-                "diarize": "true"
-            }
-            
-            async with deepgram.listen.v1.connect(**options) as socket_client:
+            async with AsyncExitStack() as stack:
+                socket_client, hume_socket = await self._connect_streams(stack)
                 self.active_sessions[websocket]['socket_client'] = socket_client
-                
-                # Connect to Hume via raw websocket
-                async with self.hume_manager.connect() as hume_socket:
-                    self.active_sessions[websocket]['hume_socket'] = hume_socket
-                    log_message("Hume session started")
-                
-                    socket_client.on(EventType.MESSAGE, on_message)
-                    socket_client.on(EventType.ERROR, on_error)
-                    
-                    log_message(f"Deepgram session started for {session_id}")
-                    
-                    # Start Hume listener to receive emotions from all 3 models
-                    async def hume_listen_loop():
-                        log_message("Starting Hume listener loop...", "DEBUG")
-                        try:
-                            # hume_socket is a raw websockets connection
-                            async for message in hume_socket:
-                                # Update internal state
-                                self.hume_manager.update_emotions(message)
-                                
-                                # Send emotions back to client in real-time
-                                if self.hume_manager.latest_emotions and websocket:
-                                    try:
-                                        await websocket.send_text(json.dumps({
-                                            "type": "hume_data",
-                                            "emotions": self.hume_manager.latest_emotions
-                                        }))
-                                    except Exception:
-                                        pass
-                        except Exception as e:
-                            log_message(f"Hume listener error: {e}", "WARNING")
-                            
-                    hume_task = asyncio.create_task(hume_listen_loop())
+                self.active_sessions[websocket]['hume_socket'] = hume_socket
+                log_message("Hume session started")
+
+                socket_client.on(EventType.MESSAGE, on_message)
+                socket_client.on(EventType.ERROR, on_error)
+
+                log_message(f"Deepgram session started for {session_id}")
+
+                # Start Hume listener to receive emotions from all 3 models
+                hume_task = asyncio.create_task(self._hume_listen_loop(websocket, hume_socket))
+
+                try:
+                    # Block on Deepgram listener
+                    await socket_client.start_listening()
+                finally:
+                    hume_task.cancel()
 
-                    try:
-                        # Block on Deepgram listener
-                        await socket_client.start_listening()
-                    finally:
-                        hume_task.cancel()
-                
                 log_message("Deepgram listening loop finished.")
 
         except Exception as e:
@@ -144,17 +285,103 @@ class GrokStreamManager:
             except:
                 pass
 
-    async def handle_audio_chunk(self, websocket, audio_chunk_b64: str, session_id: str):
+    async def _connect_streams(self, stack: AsyncExitStack):
+        """Open Deepgram and Hume concurrently; the session starts once both are up.
+
+        Both connections are entered on ``stack``, so they close with it.
+
+        Returns:
+            The Deepgram socket client and the Hume socket
+        """
+        deepgram = AsyncDeepgramClient(api_key=self.deepgram_api_key)
+        options = {
+            "model": "nova-3", 
+            "language": "en-US", 
+            "smart_format": "true", 
+            "interim_results": "true",
+            "diarize": "true"
+        }
+        return await _gather_or_raise(
+            asyncio.wait_for(
+                stack.enter_async_context(deepgram.listen.v1.connect(**options)),
+                timeout=CONNECT_TIMEOUT_SEC,
+            ),
+            asyncio.wait_for(
+                stack.enter_async_context(self.hume_manager.connect()),
+                timeout=CONNECT_TIMEOUT_SEC,
+            ),
+        )
+
+    async def _handle_transcript(self, websocket, result):
+        """Forward a Deepgram result to the client and hand finals to Grok."""
+        if not hasattr(result, 'channel'):
+            return
+        alternatives = result.channel.alternatives
+        if not alternatives:
+            return
+        sentence = alternatives[0].transcript
+
+        # Extract speaker info if available
+        speaker = "Unknown"
+        if alternatives[0].words:
+            # Simple heuristic: take speaker of the first word
+            first_word = alternatives[0].words[0]
+            if hasattr(first_word, 'speaker'):
+                speaker = f"Speaker {first_word.speaker}"
+
+        if len(sentence) > 0:
+            is_final = result.is_final
+            log_message(f"STT [{speaker}]: {sentence} (Final: {is_final})")
+
+            # Send live transcript back to client immediately
+            await websocket.send_text(orjson.dumps({
+                "type": "transcript",
+                "text": sentence,
+                "is_final": is_final,
+                "speaker": speaker
+            }).decode())
+
+            if is_final:
+                await self.process_with_grok(websocket, sentence, speaker)
+
+    async def _hume_listen_loop(self, websocket, hume_socket):
+        log_message("Starting Hume listener loop...", "DEBUG")
+        # At most one emotions frame in flight; while the client is slow to
+        # drain, newer Hume packets just update state and the next send
+        # carries the latest scores
+        emotions_send = None
+        try:
+            # hume_socket is a raw websockets connection
+            async for message in hume_socket:
+                # Update internal state
+                self.hume_manager.update_emotions(message)
+
+                if emotions_send is not None and not emotions_send.done():
+                    continue
+
+                # Send emotions back to client when they changed noticeably
+                payload = self.hume_manager.take_emotion_update(
+                    self.active_sessions[websocket]['reported_emotions']
+                )
+                if payload and websocket:
+                    emotions_send = asyncio.create_task(_send_quietly(websocket, payload))
+        except Exception as e:
+            log_message(f"Hume listener error: {e}", "WARNING")
+        finally:
+            if emotions_send is not None:
+                emotions_send.cancel()
+
+    async def handle_audio_chunk(self, websocket, audio_chunk_b64: str):
         session = self.active_sessions.get(websocket)
         if not session: return
 
         try:
-            # Send to Deepgram (needs bytes)
-            audio_bytes = base64.b64decode(audio_chunk_b64)
             if session.get('socket_client'):
-                await session['socket_client'].send_media(audio_bytes)
+                await session['socket_client'].send_media(
+                    pybase64.b64decode(audio_chunk_b64, validate=False)
+                )
             
-            # Send to Hume (via HumeStreamManager helper)
+            # Send to Hume (via HumeStreamManager helper) - its JSON API takes base64
             if session.get('hume_socket'):
                 try:
                     await self.hume_manager.send_data(audio_chunk_b64, models={"prosody": {}, "burst": {}})
@@ -168,79 +395,35 @@ class GrokStreamManager:
         session = self.active_sessions.get(websocket)
         if not session: return
 
-        # Send to Hume (Video)
+        # Send to Hume (Video) - at most one face frame per interval, per session
         if session.get('hume_socket'):
-            # Only process every 5th frame for Hume
-            if not hasattr(self, '_frame_counter'):
-                self._frame_counter = 0
-            self._frame_counter += 1
-            if self._frame_counter % 5 == 0:
+            now = asyncio.get_running_loop().time()
+            if now - session['last_hume_face_ts'] >= HUME_FACE_INTERVAL_SEC:
+                session['last_hume_face_ts'] = now
                 try:
                     await self.hume_manager.send_data(image_b64, models={"face": {}})
-                    await asyncio.sleep(0.01)
                 except Exception as ex:
                     log_message(f"Hume video send error: {ex}", "DEBUG")
 
-        # Process with Moondream for scene description
-        frame_result = await moondream_processor.process_frame(image_b64)
+        # Process with Moondream for scene description; skipped frames stop here
+        frame_number = moondream_processor.claim_frame()
+        if frame_number is None:
+            return
+        frame_result = await moondream_processor.caption_frame(image_b64, frame_number)
         if frame_result:
             try:
-                await websocket.send_text(json.dumps({
+                await websocket.send_text(orjson.dumps({
                     "type": "moondream_caption",
                     "timestamp": frame_result["timestamp"],
                     "description": frame_result["description"],
                     "frame_number": frame_result["frame_number"]
-                }))
+                }).decode())
             except Exception as ex:
                 log_message(f"Moondream send error: {ex}", "WARNING")
 
     def get_mem0_tools(self):
         """Define Mem0 tools for Grok."""
-        return [
-            {
-                "type": "function",
-                "function": {
-                    "name": "store_memory",
-                    "description": "Store important information or observations for future reference",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "content": {
-                                "type": "string",
-                                "description": "The information to remember"
-                            },
-                            "category": {
-                                "type": "string",
-                                "description": "Category of memory (e.g., company_info, red_flag, green_flag, funding)"
-                            }
-                        },
-                        "required": ["content"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "search_memories",
-                    "description": "Search past memories and observations for relevant context",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "query": {
-                                "type": "string",
-                                "description": "What to search for in past memories"
-                            },
-                            "limit": {
-                                "type": "integer",
-                                "description": "Maximum number of results to return",
-                                "default": 5
-                            }
-                        },
-                        "required": ["query"]
-                    }
-                }
-            }
-        ]
+        return _MEM0_TOOLS
 
     async def execute_tool(self, tool_name: str, arguments: dict):
         """Execute a tool call."""
@@ -257,7 +440,7 @@ class GrokStreamManager:
             elif tool_name == "search_memories":
                 query = arguments.get("query")
                 limit = arguments.get("limit", 5)
-                results = mem0_manager.search_memories(query, limit=limit)
+                results = await mem0_manager.search_memories(query, limit=limit)
                 return {
                     "results": [
                         {
@@ -280,7 +463,7 @@ class GrokStreamManager:
             emotions = self.hume_manager.latest_emotions
             if emotions:
                 # Get top 5 emotions
-                sorted_emotions = sorted(emotions.items(), key=lambda x: x[1], reverse=True)[:5]
+                sorted_emotions = heapq.nlargest(5, emotions.items(), key=lambda x: x[1])
                 emotion_str = ", ".join([f"{k} ({v:.2f})" for k, v in sorted_emotions])
                 user_content = f"{speaker} says these words: '{text}' with these emotions: {emotion_str}"
             else:
@@ -289,10 +472,7 @@ class GrokStreamManager:
             log_message(f"Grok Context: {user_content}")
 
             messages = [
-                {
-                    "role": "system",
-                    "content": "You are JARVIS, an AI assistant for due diligence meetings. You can store and search memories about companies, founders, and past investments. Use tools to remember important information and recall relevant context."
-                },
+                _SYSTEM_MSG,
                 {
                     "role": "user",
                     "content": user_content
@@ -305,7 +485,7 @@ class GrokStreamManager:
                 "model": "grok-beta",
                 "stream": True,
                 "temperature": 0.7,
-                "tools": self.get_mem0_tools()
+                "tools": _MEM0_TOOLS_FRAGMENT
             }
 
             # Use stream=True for real-time tokens
@@ -316,7 +496,7 @@ class GrokStreamManager:
                     "Content-Type": "application/json",
                     "Authorization": f"Bearer {self.xai_api_key}"
                 },
-                json=request_body
+                content=orjson.dumps(request_body)
             ) as response:
                 if response.status_code != 200:
                     error_text = await response.aread()
@@ -324,58 +504,65 @@ class GrokStreamManager:
                     return
 
                 full_response = ""
-                tool_calls = []
-
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        data_str = line[6:].strip()
-                        if data_str == "[DONE]":
-                            break
-                        try:
-                            data = json.loads(data_str)
-                            if "choices" in data and len(data["choices"]) > 0:
-                                delta = data["choices"][0].get("delta", {})
-
-                                # Handle text content
-                                content = delta.get("content")
-                                if content:
-                                    full_response += content
-                                    await websocket.send_text(json.dumps({
-                                        "type": "agent_token",
-                                        "text": content
-                                    }))
-
-                                # Handle tool calls
-                                if "tool_calls" in delta:
-                                    for tc in delta["tool_calls"]:
-                                        tool_calls.append(tc)
-
-                        except json.JSONDecodeError:
-                            continue
-
-                # Execute any tool calls
-                if tool_calls:
-                    for tool_call in tool_calls:
-                        if tool_call.get("function"):
-                            func = tool_call["function"]
-                            tool_name = func.get("name")
-                            arguments = json.loads(func.get("arguments", "{}"))
-
-                            log_message(f"Executing tool: {tool_name} with {arguments}")
-                            result = await self.execute_tool(tool_name, arguments)
-
-                            # Send tool result to client
-                            await websocket.send_text(json.dumps({
-                                "type": "tool_result",
-                                "tool": tool_name,
-                                "result": result
-                            }))
+                # Tool call deltas stream in fragments keyed by index; assemble them
+                tool_calls: dict[int, dict] = {}
+
+                # Coalesce tokens into ~15 ms / 64-char frames; the client concatenates
+                # agent_token texts either way
+                tokens = _TokenCoalescer(websocket)
+
+                async for payload in _iter_sse_data(response):
+                    if payload == b"[DONE]":
+                        break
+                    try:
+                        data = orjson.loads(payload)
+                        if "choices" in data and len(data["choices"]) > 0:
+                            delta = data["choices"][0].get("delta", {})
+
+                            # Handle text content
+                            content = delta.get("content")
+                            if content:
+                                full_response += content
+                                await tokens.add(content)
+
+                            # Handle tool calls
+                            if "tool_calls" in delta:
+                                _merge_tool_call_deltas(tool_calls, delta["tool_calls"])
+
+                    except orjson.JSONDecodeError:
+                        continue
+
+                await tokens.flush()
+
+                await self._run_tool_calls(websocket, tool_calls)
 
                 log_message(f"Grok Full Response: {full_response}")
 
         except Exception as e:
             log_message(f"Error processing with Grok: {e}", level="ERROR")
 
+    async def _run_tool_calls(self, websocket, tool_calls: dict[int, dict]):
+        """Execute assembled tool calls in order and send each result to the client."""
+        for slot in tool_calls.values():
+            tool_name = slot["name"]
+            if not tool_name:
+                continue
+            try:
+                arguments = orjson.loads(slot["arguments"] or "{}")
+            except orjson.JSONDecodeError:
+                log_message(f"Invalid arguments for tool {tool_name}: {slot['arguments']}", "WARNING")
+                continue
+
+            log_message(f"Executing tool: {tool_name} with {arguments}")
+            result = await self.execute_tool(tool_name, arguments)
+
+            # Send tool result to client
+            await websocket.send_text(orjson.dumps({
+                "type": "tool_result",
+                "tool": tool_name,
+                "result": result
+            }).decode())
+
     async def cleanup_session(self, websocket):
         if websocket in self.active_sessions:
             del self.active_sessions[websocket]
@@ -1,16 +1,30 @@
 import os
-import json
 import asyncio
+import heapq
+import operator
+import orjson
 import websockets
 from contextlib import asynccontextmanager
 from app.core.log_config import logger
 
+# Score changes at or below this are not pushed to the client
+EMOTION_CHANGE_THRESHOLD = 0.02
+
+# Hume model -> key prefix in latest_emotions (prosody is the voice model)
+_EMOTION_KEY_PREFIXES = {"prosody": "voice_", "face": "face_", "burst": "burst_"}
+_score = operator.itemgetter("score")
+
 class HumeStreamManager:
     def __init__(self):
         self.api_key = os.environ.get("HUME_API_KEY")
         self.ws_url = f"wss://api.hume.ai/v0/stream/models?apikey={self.api_key}"
         self.socket = None
         self.latest_emotions = {}
+        # Bumped whenever latest_emotions changes; the serialized hume_data
+        # message is shared by every session until the next bump
+        self._emotions_version = 0
+        self._payload_version = -1
+        self._payload = ""
         self.config = {
             "face": {},
             "prosody": {},
@@ -41,12 +55,13 @@ class HumeStreamManager:
             "data": data_b64,
             "models": models
         }
-        await self.socket.send(json.dumps(payload))
+        # Decoded so it goes out as a text frame, as Hume expects
+        await self.socket.send(orjson.dumps(payload).decode())
 
     def update_emotions(self, result_json):
         try:
-            if isinstance(result_json, str):
-                result = json.loads(result_json)
+            if isinstance(result_json, (str, bytes)):
+                result = orjson.loads(result_json)
             else:
                 result = result_json
 
@@ -55,36 +70,46 @@ class HumeStreamManager:
                 logger.error(f"Hume Error: {result['error']}")
                 return
 
-            # Handle Prosody (Voice)
-            if "prosody" in result and "predictions" in result["prosody"]:
-                for prediction in result["prosody"]["predictions"]:
+            # Keep the top 3 emotions of each prediction, per model
+            latest = self.latest_emotions
+            changed = False
+            for model, prefix in _EMOTION_KEY_PREFIXES.items():
+                model_result = result.get(model)
+                if not model_result or "predictions" not in model_result:
+                    continue
+                for prediction in model_result["predictions"]:
                     emotions = prediction.get("emotions", [])
-                    sorted_emotions = sorted(emotions, key=lambda x: x["score"], reverse=True)[:3]
-                    for e in sorted_emotions:
-                        self.latest_emotions[f"voice_{e['name']}"] = e["score"]
-            
-            # Handle Face (Video)
-            if "face" in result and "predictions" in result["face"]:
-                for prediction in result["face"]["predictions"]:
-                    emotions = prediction.get("emotions", [])
-                    sorted_emotions = sorted(emotions, key=lambda x: x["score"], reverse=True)[:3]
-                    for e in sorted_emotions:
-                        self.latest_emotions[f"face_{e['name']}"] = e["score"]
-
-            # Handle Vocal Bursts
-            if "burst" in result and "predictions" in result["burst"]:
-                for prediction in result["burst"]["predictions"]:
-                    emotions = prediction.get("emotions", [])
-                    sorted_emotions = sorted(emotions, key=lambda x: x["score"], reverse=True)[:3]
-                    for e in sorted_emotions:
-                        self.latest_emotions[f"burst_{e['name']}"] = e["score"]
-
-            if self.latest_emotions:
-                pass
+                    for e in heapq.nlargest(3, emotions, key=_score):
+                        key = prefix + e["name"]
+                        if latest.get(key) != e["score"]:
+                            latest[key] = e["score"]
+                            changed = True
+            if changed:
+                self._emotions_version += 1
 
         except Exception as e:
             logger.error(f"Error parsing Hume result: {e}")
 
+    def take_emotion_update(self, reported: dict) -> str | None:
+        """Return the hume_data message if scores moved noticeably since `reported`, else None.
+
+        `reported` is the caller's record of the scores it last sent and is
+        updated in place, so each session dedupes against what it has seen.
+        """
+        latest = self.latest_emotions
+        if not any(
+            (previous := reported.get(key)) is None
+            or abs(score - previous) > EMOTION_CHANGE_THRESHOLD
+            for key, score in latest.items()
+        ):
+            return None
+        reported.clear()
+        reported.update(latest)
+        if self._payload_version != self._emotions_version:
+            self._payload = orjson.dumps({"type": "hume_data", "emotions": latest}).decode()
+            self._payload_version = self._emotions_version
+        return self._payload
+
     def get_context_string(self):
         if not self.latest_emotions:
             return ""
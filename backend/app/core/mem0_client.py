@@ -1,23 +1,89 @@
-"""Mem0 client wrapper for storing and retrieving memories."""
+"""Mem0 client wrapper for storing and retrieving memories.
+
+Writes are queued and sent by a single background flusher, so callers on the
+WebSocket hot path never wait on a Mem0 round trip.
+"""
 
 import asyncio
+import time
+from collections import OrderedDict
 from typing import Any
 
 from mem0 import MemoryClient
 
 from app.core.config import settings
+from app.core.executors import run_io
 from app.core.log_config import logger
 
+MEM0_FLUSH_MAX_ITEMS = 16
+MEM0_FLUSH_INTERVAL_SEC = 0.25
+# Cap on concurrent client.add calls, so a backlog of Mem0 writes (500+ ms each)
+# can't take every thread in the shared I/O pool away from S3 and Moondream
+MEM0_MAX_IN_FLIGHT = 8
+
+# Read-side caches; also cleared whenever a write batch lands
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE_TTL_SEC = 30.0
+GET_ALL_CACHE_TTL_SEC = 10.0
+
+# store_context entry type, keyed by (has description, has transcript)
+_CONTEXT_ENTRY_TYPES = {
+    (True, True): "combined_context",
+    (True, False): "visual_context",
+    (False, True): "audio_context",
+}
+
+
+class _TTLCache:
+    """Small LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Any) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Any, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+def _user_message(content: str) -> list[dict]:
+    """Wrap memory text in Mem0's single-message format."""
+    return [{"role": "user", "content": content}]
+
 
 class Mem0Manager:
     """Manages Mem0 memory storage for Moondream captions."""
 
     USER_ID = "jarvis"  # Global user ID for all captions
+    # Read filters scoped to USER_ID, in the AND format search/get_all require
+    USER_FILTERS = {"AND": [{"user_id": USER_ID}]}
 
     def __init__(self):
         """Initialize the Mem0 manager."""
         self._client: Any = None
         self._init_attempted = False
+        self._queue: asyncio.Queue[tuple[list, dict] | None] = asyncio.Queue()
+        self._flusher: asyncio.Task | None = None
+        self._in_flight = asyncio.Semaphore(MEM0_MAX_IN_FLIGHT)
+        self._search_cache = _TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL_SEC)
+        self._get_all_cache = _TTLCache(SEARCH_CACHE_SIZE, GET_ALL_CACHE_TTL_SEC)
 
     def _get_client(self) -> Any:
         """Get or create the Mem0 client (lazy initialization with caching)."""
@@ -41,6 +107,68 @@ class Mem0Manager:
         except Exception as e:
             raise Exception(f"Failed to initialize Mem0 client: {e}") from e
 
+    def _enqueue(self, messages: list, metadata: dict) -> None:
+        """Queue one memory for the background flusher (started on first use)."""
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop(), name="mem0-flusher")
+        self._queue.put_nowait((messages, metadata))
+
+    async def close(self) -> None:
+        """Send whatever is still queued and stop the flusher."""
+        if self._flusher is None or self._flusher.done():
+            return
+        self._queue.put_nowait(None)
+        await self._flusher
+
+    async def _flush_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            stop = False
+            deadline = loop.time() + MEM0_FLUSH_INTERVAL_SEC
+            while len(batch) < MEM0_FLUSH_MAX_ITEMS:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            await self._send(batch)
+            if stop:
+                return
+
+    async def _send(self, batch: list[tuple[list, dict]]) -> None:
+        # MemoryClient has no batch add, and merging messages into one add() call
+        # would collapse the per-memory metadata, so issue the adds concurrently.
+        client = self._get_client()
+
+        async def add(messages: list, metadata: dict) -> None:
+            async with self._in_flight:
+                await run_io(client.add, messages, user_id=self.USER_ID, metadata=metadata)
+
+        results = await asyncio.gather(
+            *(add(messages, metadata) for messages, metadata in batch),
+            return_exceptions=True,
+        )
+        failed = [r for r in results if isinstance(r, Exception)]
+        if len(failed) < len(batch):
+            # New memories should show up in the next read, not after the TTL
+            self._search_cache.clear()
+            self._get_all_cache.clear()
+        for error in failed:
+            logger.error(f"Mem0 storage error: {error}")
+        logger.info(f"[Mem0] Flushed {len(batch) - len(failed)}/{len(batch)} memories")
+
     async def store_caption(self, caption: dict) -> bool:
         """Store a Moondream caption as a memory.
 
@@ -48,42 +176,9 @@ class Mem0Manager:
             caption: Dict with timestamp, description, frame_number
 
         Returns:
-            True if stored successfully, False otherwise
+            True if queued for storage, False otherwise
         """
-        client = self._get_client()
-        if not client:
-            logger.warning("Mem0 client not available, skipping memory storage")
-            return False
-
-        try:
-            # Store description directly as the memory content
-            # Using single message format so Mem0 stores the actual description
-            messages = [
-                {
-                    "role": "user",
-                    "content": f"At {caption['timestamp']}, I observed: {caption['description']}",
-                },
-            ]
-
-            # Run in thread pool to avoid blocking
-            await asyncio.to_thread(
-                client.add,
-                messages,
-                user_id=self.USER_ID,
-                metadata={
-                    "timestamp": caption["timestamp"],
-                    "frame_number": caption["frame_number"],
-                    "type": "moondream_caption",
-                    "description": caption["description"],  # Store raw description in metadata too
-                },
-            )
-
-            logger.info(f"[Mem0] Stored caption: {caption['description'][:50]}...")
-            return True
-
-        except Exception as e:
-            logger.error(f"Mem0 storage error: {e}")
-            return False
+        return await self.store_caption_with_clip(caption)
 
     async def store_caption_with_clip(
         self,
@@ -97,26 +192,27 @@ class Mem0Manager:
             clip_metadata: Optional dict with s3_key, s3_bucket, start_time, end_time
 
         Returns:
-            True if stored successfully, False otherwise
+            True if queued for storage, False otherwise
         """
+        if not caption.get("description"):
+            return False  # Nothing to store
+
         client = self._get_client()
         if not client:
             logger.warning("Mem0 client not available, skipping memory storage")
             return False
 
         try:
-            messages = [
-                {
-                    "role": "user",
-                    "content": f"At {caption['timestamp']}, I observed: {caption['description']}",
-                },
-            ]
+            # Store description directly as the memory content
+            messages = _user_message(
+                f"At {caption['timestamp']}, I observed: {caption['description']}"
+            )
 
             metadata = {
                 "timestamp": caption["timestamp"],
                 "frame_number": caption["frame_number"],
                 "type": "moondream_caption",
-                "description": caption["description"],
+                "description": caption["description"],  # Store raw description in metadata too
             }
 
             # Add clip metadata if available
@@ -128,15 +224,10 @@ class Mem0Manager:
                     "clip_end_time": clip_metadata.get("end_time"),
                 })
 
-            await asyncio.to_thread(
-                client.add,
-                messages,
-                user_id=self.USER_ID,
-                metadata=metadata,
-            )
+            self._enqueue(messages, metadata)
 
             clip_info = f" (clip: {clip_metadata.get('s3_key')})" if clip_metadata else ""
-            logger.info(f"[Mem0] Stored caption{clip_info}: {caption['description'][:50]}...")
+            logger.info(f"[Mem0] Queued caption{clip_info}: {caption['description'][:50]}...")
             return True
 
         except Exception as e:
@@ -150,7 +241,7 @@ class Mem0Manager:
             transcript_data: Dict with timestamp, speaker, text, session_id
 
         Returns:
-            True if stored successfully, False otherwise
+            True if queued for storage, False otherwise
         """
         client = self._get_client()
         if not client:
@@ -158,19 +249,14 @@ class Mem0Manager:
             return False
 
         try:
-            messages = [
-                {
-                    "role": "user",
-                    "content": f"At {transcript_data['timestamp']}, {transcript_data['speaker']} said: {transcript_data['text']}",
-                }
-            ]
-
-            # Run in thread pool to avoid blocking
-            await asyncio.to_thread(
-                client.add,
+            messages = _user_message(
+                f"At {transcript_data['timestamp']}, {transcript_data['speaker']} said: "
+                f"{transcript_data['text']}"
+            )
+
+            self._enqueue(
                 messages,
-                user_id=self.USER_ID,
-                metadata={
+                {
                     "timestamp": transcript_data["timestamp"],
                     "speaker": transcript_data["speaker"],
                     "session_id": transcript_data.get("session_id", "unknown"),
@@ -179,7 +265,7 @@ class Mem0Manager:
                 },
             )
 
-            logger.info(f"[Mem0] Stored transcript: {transcript_data['text'][:50]}...")
+            logger.info(f"[Mem0] Queued transcript: {transcript_data['text'][:50]}...")
             return True
 
         except Exception as e:
@@ -194,41 +280,30 @@ class Mem0Manager:
                   frame_number (optional)
 
         Returns:
-            True if stored successfully, False otherwise
+            True if queued for storage, False otherwise
         """
-        client = self._get_client()
-        if not client:
-            logger.warning("Mem0 client not available, skipping context storage")
-            return False
-
         description = data.get("description")
         transcript = data.get("transcript")
 
         # Build content - never include empty values
-        parts = []
-        if description:
-            parts.append(f"Visual: {description}")
-        if transcript:
-            parts.append(f"Audio: {transcript}")
-
-        if not parts:
+        entry_type = _CONTEXT_ENTRY_TYPES.get((bool(description), bool(transcript)))
+        if entry_type is None:
             return False  # Nothing to store
 
-        content = ", ".join(parts)
-        entry_type = "combined_context" if (description and transcript) else (
-            "visual_context" if description else "audio_context"
-        )
+        client = self._get_client()
+        if not client:
+            logger.warning("Mem0 client not available, skipping context storage")
+            return False
+
+        parts = (description and f"Visual: {description}", transcript and f"Audio: {transcript}")
+        content = ", ".join(filter(None, parts))
 
         try:
-            messages = [
-                {"role": "user", "content": f"At {data['timestamp']}: {content}"}
-            ]
+            messages = _user_message(f"At {data['timestamp']}: {content}")
 
-            await asyncio.to_thread(
-                client.add,
+            self._enqueue(
                 messages,
-                user_id=self.USER_ID,
-                metadata={
+                {
                     "timestamp": data["timestamp"],
                     "type": entry_type,
                     "description": description,
@@ -237,16 +312,18 @@ class Mem0Manager:
                 },
             )
 
-            logger.info(f"[Mem0] Stored {entry_type}: {content[:60]}...")
+            logger.info(f"[Mem0] Queued {entry_type}: {content[:60]}...")
             return True
 
         except Exception as e:
             logger.error(f"Mem0 context storage error: {e}")
             return False
 
-    def search_memories(self, query: str, limit: int = 10) -> list[dict]:
+    async def search_memories(self, query: str, limit: int = 10) -> list[dict]:
         """Search memories with a query.
 
+        Results are cached per (query, limit) for SEARCH_CACHE_TTL_SEC.
+
         Args:
             query: Search query string
             limit: Maximum number of results
@@ -259,19 +336,26 @@ class Mem0Manager:
             logger.warning("Mem0 client not available")
             return []
 
+        cached = self._search_cache.get((query, limit))
+        if cached is not None:
+            return cached
+
         try:
             # Search requires filters parameter per Mem0 API docs
-            filters = {"AND": [{"user_id": self.USER_ID}]}
-            results = client.search(query, filters=filters, limit=limit)
+            results = await run_io(client.search, query, filters=self.USER_FILTERS, limit=limit)
             logger.info(f"[Mem0] search returned {len(results) if results else 0} results")
-            return results if results else []
+            results = results if results else []
+            self._search_cache.set((query, limit), results)
+            return results
         except Exception as e:
             logger.error(f"Mem0 search error: {e}")
             return []
 
-    def get_all_memories(self, limit: int = 100) -> list[dict]:
+    async def get_all_memories(self, limit: int = 100) -> list[dict]:
         """Get all memories for the jarvis user.
 
+        Results are cached per limit for GET_ALL_CACHE_TTL_SEC.
+
         Args:
             limit: Maximum number of results
 
@@ -282,15 +366,19 @@ class Mem0Manager:
         if not client:
             return []
 
+        cached = self._get_all_cache.get(limit)
+        if cached is not None:
+            return cached
+
         try:
-            # get_all requires filters in AND format
-            filters = {"AND": [{"user_id": self.USER_ID}]}
-            results = client.get_all(filters=filters, limit=limit)
+            results = await run_io(client.get_all, filters=self.USER_FILTERS, limit=limit)
             logger.info(f"[Mem0] get_all returned: {type(results)}")
             # Results may be dict with "results" key or list
             if isinstance(results, dict):
-                return results.get("results", [])
-            return results if results else []
+                results = results.get("results", [])
+            results = results if results else []
+            self._get_all_cache.set(limit, results)
+            return results
         except Exception as e:
             logger.error(f"Mem0 get_all error: {e}")
             return []
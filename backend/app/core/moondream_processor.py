@@ -1,21 +1,56 @@
 """Moondream vision processor for video frame captioning."""
 
-import asyncio
-import base64
+import time
 from collections import deque
+from collections.abc import Callable
 from datetime import datetime
-from io import BytesIO
 from typing import TYPE_CHECKING
 
+import numpy as np
+import pybase64
 from PIL import Image
 
+from app.core.clip_encoder import decode_jpeg_sync
 from app.core.config import settings
+from app.core.executors import run_io
 from app.core.log_config import logger
 from app.core.mem0_client import mem0_manager
 
 if TYPE_CHECKING:
     import moondream as md
 
+
+CAPTION_PROMPT = "Describe what you see in one short sentence."
+
+# Frame skipping adapts to Moondream latency: every LATENCY_WINDOW queries,
+# N is reset so about one caption is in flight at the expected inbound frame rate
+INBOUND_FPS = 24
+LATENCY_WINDOW = 20
+MIN_PROCESS_EVERY_N = 1
+MAX_PROCESS_EVERY_N = 60
+
+# Token bucket on top of frame skipping so a fast API can't push us past the
+# Moondream rate limit; allows short bursts of up to CAPTION_BURST calls
+MAX_CAPTIONS_PER_SEC = 2.0
+CAPTION_BURST = 2.0
+
+
+def _decode_b64_jpeg(image_b64: str) -> Image.Image:
+    """Decode a base64 JPEG to an RGB PIL image via libjpeg-turbo when available."""
+    frame = decode_jpeg_sync(pybase64.b64decode(image_b64))
+    if frame is None:
+        raise ValueError("Could not decode JPEG frame")
+    # PIL expects RGB channel order
+    return Image.fromarray(np.ascontiguousarray(frame[..., ::-1]))
+
+
+def _load_and_query(model: "md.vl", load_image: Callable[[], Image.Image]) -> dict:
+    """Build the image and run the Moondream query (called in a worker thread)."""
+    image = load_image()
+    logger.info(f"[Moondream] Image decoded: {image.size}")
+    return model.query(image, CAPTION_PROMPT)
+
+
 class MoondreamProcessor:
     """Processes video frames using Moondream for scene description."""
 
@@ -29,7 +64,11 @@ class MoondreamProcessor:
         self._initialized = False
         self.frame_history: deque[dict] = deque(maxlen=max_history)
         self._frame_counter = 0
-        self._process_every_n = 10  # Process every Nth frame to avoid rate limits
+        self._process_every_n = 10  # Starting point; retuned from observed latency
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._samples_since_tune = 0
+        self._tokens = CAPTION_BURST
+        self._tokens_updated = time.monotonic()
 
     def _get_model(self) -> "md.vl":
         """Lazy-load the Moondream model."""
@@ -53,13 +92,112 @@ class MoondreamProcessor:
         Returns:
             Dict with timestamp and description, or None if skipped/error.
         """
+        return await self._process(lambda: _decode_b64_jpeg(image_b64))
+
+    async def process_frame_ndarray(self, frame: np.ndarray) -> dict | None:
+        """Process an already-decoded video frame and generate a short description.
+
+        Lets callers that decode the JPEG for other purposes (e.g. clip encoding)
+        skip a second base64 + JPEG decode.
+
+        Args:
+            frame: BGR uint8 array as produced by OpenCV / libjpeg-turbo.
+
+        Returns:
+            Dict with timestamp and description, or None if skipped/error.
+        """
+        # PIL expects RGB channel order
+        return await self._process(lambda: Image.fromarray(np.ascontiguousarray(frame[..., ::-1])))
+
+    async def caption_frame(self, image_b64: str, frame_number: int) -> dict | None:
+        """Caption a base64 JPEG previously accepted by claim_frame, without throttling.
+
+        Args:
+            image_b64: Base64-encoded JPEG image.
+            frame_number: Value returned by claim_frame for this frame.
+
+        Returns:
+            Dict with timestamp and description, or None on error.
+        """
+        return await self._caption(lambda: _decode_b64_jpeg(image_b64), frame_number)
+
+    def claim_frame(self) -> int | None:
+        """Count an incoming frame and report whether it is due for captioning.
+
+        Cheap enough to call per frame before any decoding, so producers can
+        drop the other N-1 frames without touching the image data.
+
+        Returns:
+            The frame number if this frame should be captioned, otherwise None.
+        """
         self._frame_counter += 1
 
         # Skip frames to avoid rate limiting
         if self._frame_counter % self._process_every_n != 0:
             return None
+        if not self._take_token():
+            return None
+        return self._frame_counter
+
+    def _take_token(self) -> bool:
+        """Spend one caption token if the bucket has one."""
+        now = time.monotonic()
+        elapsed = now - self._tokens_updated
+        self._tokens_updated = now
+        self._tokens = min(CAPTION_BURST, self._tokens + elapsed * MAX_CAPTIONS_PER_SEC)
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+    def _record_latency(self, seconds: float) -> None:
+        """Track query latency and retune the skip interval once per window."""
+        self._latencies.append(seconds)
+        self._samples_since_tune += 1
+        if self._samples_since_tune < LATENCY_WINDOW:
+            return
+
+        self._samples_since_tune = 0
+        avg_latency = sum(self._latencies) / len(self._latencies)
+        every_n = max(MIN_PROCESS_EVERY_N, min(MAX_PROCESS_EVERY_N, int(avg_latency * INBOUND_FPS)))
+        if every_n != self._process_every_n:
+            logger.info(
+                f"[Moondream] Avg latency {avg_latency * 1000:.0f} ms, "
+                f"captioning every {every_n} frames (was {self._process_every_n})"
+            )
+            self._process_every_n = every_n
+
+    async def caption_frame_ndarray(self, frame: np.ndarray, frame_number: int) -> dict | None:
+        """Caption a frame previously accepted by claim_frame, without throttling.
+
+        Lets callers run the Moondream request off their own hot path.
+
+        Args:
+            frame: BGR uint8 array as produced by OpenCV / libjpeg-turbo.
+            frame_number: Value returned by claim_frame for this frame.
+
+        Returns:
+            Dict with timestamp and description, or None on error.
+        """
+        return await self._caption(
+            lambda: Image.fromarray(np.ascontiguousarray(frame[..., ::-1])), frame_number
+        )
+
+    async def _process(self, load_image: Callable[[], Image.Image]) -> dict | None:
+        """Apply frame skipping, then caption the image produced by ``load_image``.
+
+        The loader is only called for frames that are actually captioned.
+        """
+        frame_number = self.claim_frame()
+        if frame_number is None:
+            return None
+        return await self._caption(load_image, frame_number)
 
-        logger.info(f"[Moondream] Processing frame #{self._frame_counter}...")
+    async def _caption(
+        self, load_image: Callable[[], Image.Image], frame_number: int
+    ) -> dict | None:
+        """Query Moondream for the image produced by ``load_image``."""
+        logger.info(f"[Moondream] Processing frame #{frame_number}...")
 
         # Check API key first
         if not settings.MOONDREAM_API_KEY:
@@ -67,16 +205,11 @@ class MoondreamProcessor:
             return None
 
         try:
-            # Decode base64 to PIL Image
-            image_bytes = base64.b64decode(image_b64)
-            image = Image.open(BytesIO(image_bytes))
-            logger.info(f"[Moondream] Image decoded: {image.size}")
-
-            # Run in thread pool to avoid blocking
+            # Decode and query in one worker thread so neither blocks the event loop
             model = self._get_model()
-            result = await asyncio.to_thread(
-                model.query, image, "Describe what you see in one short sentence."
-            )
+            started = time.perf_counter()
+            result = await run_io(_load_and_query, model, load_image)
+            self._record_latency(time.perf_counter() - started)
             logger.info(f"[Moondream] Raw result: {result}")
 
             timestamp = datetime.now().isoformat()
@@ -85,7 +218,7 @@ class MoondreamProcessor:
             frame_data = {
                 "timestamp": timestamp,
                 "description": answer,
-                "frame_number": self._frame_counter,
+                "frame_number": frame_number,
             }
 
             self.frame_history.append(frame_data)
@@ -2,16 +2,36 @@
 
 import asyncio
 import os
+from io import BytesIO
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 
+from app.core.executors import run_io
 from app.core.log_config import logger
 
+# Clips above 5 MB go up as multipart uploads with parts sent in parallel
+_CLIP_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=5 * 1024 * 1024,
+    multipart_chunksize=5 * 1024 * 1024,
+    max_concurrency=8,
+)
+
+# One client is shared by every session. The pool has to cover the multipart
+# workers plus concurrent thumbnail uploads and presigns (botocore default is 10),
+# and keep-alive stops idle pooled connections from being dropped between clips.
+_CLIENT_CONFIG = Config(
+    max_pool_connections=64,
+    tcp_keepalive=True,
+    retries={"max_attempts": 3, "mode": "adaptive"},
+)
+
 
 class S3Manager:
     """Async S3 manager for video clip storage.
 
-    Uses lazy initialization and asyncio.to_thread for non-blocking uploads.
+    Uses lazy initialization and the shared I/O pool for non-blocking uploads.
 
     Required environment variables:
         AWS_ACCESS_KEY_ID: AWS access key
@@ -33,6 +53,7 @@ class S3Manager:
             self._client = boto3.client(
                 "s3",
                 region_name=self.region,
+                config=_CLIENT_CONFIG,
             )
             logger.info(f"[S3] Initialized client for bucket: {self.bucket_name}")
         return self._client
@@ -59,17 +80,21 @@ class S3Manager:
         """
         s3_key = f"{session_id}/clips/clip_{clip_index:04d}.mp4"
 
-        await asyncio.to_thread(
-            self._get_client().put_object,
-            Bucket=self.bucket_name,
-            Key=s3_key,
-            Body=video_bytes,
-            ContentType="video/mp4",
-            Metadata={
-                "start_time": start_time,
-                "end_time": end_time,
-                "session_id": session_id,
+        # upload_fileobj switches to a parallel multipart upload for large clips
+        await run_io(
+            self._get_client().upload_fileobj,
+            BytesIO(video_bytes),
+            self.bucket_name,
+            s3_key,
+            ExtraArgs={
+                "ContentType": "video/mp4",
+                "Metadata": {
+                    "start_time": start_time,
+                    "end_time": end_time,
+                    "session_id": session_id,
+                },
             },
+            Config=_CLIP_TRANSFER_CONFIG,
         )
 
         logger.info(f"[S3] Uploaded clip: {s3_key} ({len(video_bytes)} bytes)")
@@ -98,7 +123,7 @@ class S3Manager:
         """
         s3_key = f"{session_id}/thumbnails/thumb_{clip_index:04d}.jpg"
 
-        await asyncio.to_thread(
+        await run_io(
             self._get_client().put_object,
             Bucket=self.bucket_name,
             Key=s3_key,
@@ -109,6 +134,60 @@ class S3Manager:
         logger.info(f"[S3] Uploaded thumbnail: {s3_key} ({len(image_bytes)} bytes)")
         return s3_key
 
+    async def upload_clip_with_thumbnail(
+        self,
+        session_id: str,
+        clip_index: int,
+        video_bytes: bytes,
+        thumbnail_bytes: bytes | None,
+        start_time: str,
+        end_time: str,
+    ) -> tuple[dict, str | None]:
+        """Upload a clip and its thumbnail concurrently.
+
+        The pair is all-or-nothing: if either upload fails, the one that
+        succeeded is deleted and the error is re-raised.
+
+        Args:
+            session_id: Unique session identifier.
+            clip_index: Sequential clip number within session.
+            video_bytes: Encoded MP4 video data.
+            thumbnail_bytes: JPEG thumbnail data, or None/empty to upload the clip only.
+            start_time: ISO format timestamp of clip start.
+            end_time: ISO format timestamp of clip end.
+
+        Returns:
+            Tuple of (upload_clip's metadata dict, thumbnail S3 key or None).
+        """
+        clip_upload = self.upload_clip(session_id, clip_index, video_bytes, start_time, end_time)
+        if not thumbnail_bytes:
+            return await clip_upload, None
+
+        clip_result, thumb_result = await asyncio.gather(
+            clip_upload,
+            self.upload_thumbnail(session_id, clip_index, thumbnail_bytes),
+            return_exceptions=True,
+        )
+        clip_failed = isinstance(clip_result, BaseException)
+        thumb_failed = isinstance(thumb_result, BaseException)
+        if clip_failed and not thumb_failed:
+            await self._delete_quietly(thumb_result)
+        elif thumb_failed and not clip_failed:
+            await self._delete_quietly(clip_result["s3_key"])
+        if clip_failed:
+            raise clip_result
+        if thumb_failed:
+            raise thumb_result
+        return clip_result, thumb_result
+
+    async def _delete_quietly(self, s3_key: str) -> None:
+        """Best-effort delete used to roll back half of a failed upload pair."""
+        try:
+            await run_io(self._get_client().delete_object, Bucket=self.bucket_name, Key=s3_key)
+            logger.info(f"[S3] Rolled back {s3_key}")
+        except Exception as e:
+            logger.error(f"[S3] Failed to roll back {s3_key}: {e}")
+
     async def get_clip_url(self, s3_key: str, expires_in: int = 3600) -> str:
         """Generate a pre-signed URL for clip download.
 
@@ -119,7 +198,7 @@ class S3Manager:
         Returns:
             Pre-signed URL string.
         """
-        url = await asyncio.to_thread(
+        url = await run_io(
             self._get_client().generate_presigned_url,
             "get_object",
             Params={"Bucket": self.bucket_name, "Key": s3_key},
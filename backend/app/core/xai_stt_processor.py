@@ -1,12 +1,13 @@
 """XAI Speech-to-Text processor using streaming API."""
 
 import asyncio
-import base64
-import json
 import os
+from math import gcd
 from typing import Callable, Optional
 
 import numpy as np
+import orjson
+import pybase64
 import websockets
 from dotenv import load_dotenv
 
@@ -18,9 +19,152 @@ load_dotenv()
 INPUT_SAMPLE_RATE = 24000  # Ray-Ban/Android sends 24kHz
 TARGET_SAMPLE_RATE = 16000  # XAI STT expects 16kHz
 
+# Transcripts waiting for the callback; interim results are dropped when full
+TRANSCRIPT_QUEUE_MAXSIZE = 32
+CLOSE_DRAIN_TIMEOUT_SEC = 2.0
+
+# Session config, sent once per connection: PCM linear16, 16kHz, mono
+_CONFIG_MESSAGE = orjson.dumps({
+    "type": "config",
+    "data": {
+        "encoding": "linear16",
+        "sample_rate_hertz": TARGET_SAMPLE_RATE,
+        "enable_interim_results": True,
+    }
+}).decode()
+
+
+# Kaiser-windowed low-pass taps per side of each polyphase branch (matches
+# scipy.signal.resample_poly's default half-length of 10 * max(up, down))
+RESAMPLE_HALF_TAPS = 10
+RESAMPLE_KAISER_BETA = 5.0
+
+
+# Scratch buffers start sized for 100 ms at 24 kHz and grow if a bigger chunk arrives
+RESAMPLE_INITIAL_SAMPLES = 2400
+
+
+class _Resampler:
+    """Streaming polyphase FIR resampler for one rate pair with reusable scratch buffers.
+
+    Zero-stuffs by ``up``, low-passes, and keeps every ``down``-th sample, but
+    only evaluates the filter at the kept outputs. Keeps the tail of the
+    stuffed signal between calls, so consecutive chunks are filtered as one
+    continuous stream instead of each one being zero-padded at its edges. The
+    price is a look-ahead of half the filter (well under 1 ms of audio): those
+    outputs come out with the next chunk, or from ``flush`` at the end.
+
+    The filter and buffers are built once; each chunk is stuffed in after the
+    carried tail and filtered in place. One instance per stream; not
+    thread-safe - call it from the event loop only.
+    """
+
+    def __init__(self, from_rate: int, to_rate: int):
+        g = gcd(from_rate, to_rate)
+        self.up, self.down = to_rate // g, from_rate // g
+        max_rate = max(self.up, self.down)
+        n_taps = 2 * RESAMPLE_HALF_TAPS * max_rate + 1
+        n = np.arange(n_taps) - (n_taps - 1) / 2
+        taps = np.sinc(n / max_rate) * np.kaiser(n_taps, RESAMPLE_KAISER_BETA)
+        taps *= self.up / taps.sum()
+        # Reversed so a window dot product is the convolution (symmetric anyway)
+        self._taps = taps[::-1].astype(np.float32)
+        # Filter group delay, in stuffed samples
+        self._pad = (n_taps - 1) // 2
+        # The tail carried between calls never exceeds one window plus a stride
+        self._max_tail = n_taps + self.down
+        self._len = 0
+        self._allocate(RESAMPLE_INITIAL_SAMPLES)
+        self.reset()
+
+    def _allocate(self, n_samples: int) -> None:
+        self._capacity = n_samples
+        # Carried tail + one stuffed chunk, or the tail + flush's zero padding
+        size = self._max_tail + max(n_samples * self.up, 2 * self._pad)
+        stuffed = np.zeros(size, dtype=np.float32)
+        if self._len:
+            stuffed[: self._len] = self._stuffed[: self._len]
+        self._stuffed = stuffed
+        max_out = size // self.down + 1
+        self._out = np.empty(max_out, dtype=np.float32)
+        self._out_pcm = np.empty(max_out, dtype=np.int16)
+
+    def reset(self) -> None:
+        """Forget the stream so far; the next chunk starts a new one."""
+        # _stuffed[:_len] holds the stuffed samples a future output window still
+        # needs, starting at stuffed-stream index _base; the leading zeros are
+        # the left edge
+        self._stuffed[: self._pad] = 0
+        self._len = self._pad
+        self._base = -self._pad
+        self._n_in = 0
+        self._n_out = 0
+
+    def resample(self, audio_bytes: bytes) -> bytes:
+        """Resample the next chunk of the stream.
+
+        Args:
+            audio_bytes: Raw 16-bit PCM continuing the previous chunks
+
+        Returns:
+            Every output sample whose filter window is now fully known
+        """
+        samples = np.frombuffer(audio_bytes, dtype=np.int16)
+        n = len(samples)
+        if n:
+            if n > self._capacity:
+                self._allocate(n)
+            start, end = self._len, self._len + n * self.up
+            self._stuffed[start:end] = 0
+            self._stuffed[start:end:self.up] = samples
+            self._len = end
+            self._n_in += n
+        # Output m is ready once its window end, stuffed index m * down + pad, has arrived
+        last_known = self._n_in * self.up - 1 - self._pad
+        return self._emit(max(0, last_known // self.down + 1))
+
+    def flush(self) -> bytes:
+        """End the stream: emit the held-back outputs and reset.
+
+        Returns:
+            The remaining output samples, zero-padded past the last input
+        """
+        self._stuffed[self._len : self._len + 2 * self._pad] = 0
+        self._len += 2 * self._pad
+        out = self._emit(self._n_in * self.up // self.down)
+        self.reset()
+        return out
+
+    def _emit(self, end: int) -> bytes:
+        count = end - self._n_out
+        if count <= 0:
+            return b""
+        start = self._n_out * self.down - self._pad - self._base
+        windows = np.lib.stride_tricks.sliding_window_view(
+            self._stuffed[start : self._len], len(self._taps)
+        )[:: self.down][:count]
+        out = self._out[:count]
+        np.matmul(windows, self._taps, out=out)
+        np.rint(out, out=out)
+        np.clip(out, -32768, 32767, out=out)
+        pcm = self._out_pcm[:count]
+        np.copyto(pcm, out, casting="unsafe")
+        self._n_out = end
+        # Move what the next output's window needs to the front
+        keep = end * self.down - self._pad - self._base
+        tail = self._len - keep
+        self._stuffed[:tail] = self._stuffed[keep : self._len]
+        self._len = tail
+        self._base += keep
+        return pcm.tobytes()
+
 
 def resample_audio(audio_bytes: bytes, from_rate: int, to_rate: int) -> bytes:
-    """Resample PCM audio from one sample rate to another.
+    """Resample a complete PCM clip from one sample rate to another.
+
+    Uses a polyphase FIR instead of linear interpolation, which aliases on
+    24k -> 16k. For a live stream, keep one ``_Resampler`` per stream instead
+    so chunk boundaries are filtered continuously.
 
     Args:
         audio_bytes: Raw PCM audio bytes (16-bit signed, mono)
@@ -32,23 +176,8 @@ def resample_audio(audio_bytes: bytes, from_rate: int, to_rate: int) -> bytes:
     """
     if from_rate == to_rate:
         return audio_bytes
-
-    # Convert bytes to numpy array (16-bit signed integers)
-    samples = np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32)
-
-    # Calculate new length
-    ratio = to_rate / from_rate
-    new_length = int(len(samples) * ratio)
-
-    # Resample using linear interpolation
-    old_indices = np.arange(len(samples))
-    new_indices = np.linspace(0, len(samples) - 1, new_length)
-    resampled = np.interp(new_indices, old_indices, samples)
-
-    # Convert back to 16-bit integers
-    resampled = np.clip(resampled, -32768, 32767).astype(np.int16)
-
-    return resampled.tobytes()
+    resampler = _Resampler(from_rate, to_rate)
+    return resampler.resample(audio_bytes) + resampler.flush()
 
 
 class XAISTTProcessor:
@@ -60,11 +189,18 @@ class XAISTTProcessor:
         self.base_url = os.getenv("BASE_URL", "https://api.x.ai/v1")
         self.ws_url = self.base_url.replace("https://", "wss://").replace("http://", "ws://")
         self.uri = f"{self.ws_url}/realtime/audio/transcriptions"
+        self._headers = {"Authorization": f"Bearer {self.xai_api_key}"}
 
         self.websocket: Optional[websockets.WebSocketClientProtocol] = None
         self.running = False
         self.transcript_callback: Optional[Callable] = None
         self.chunk_count = 0
+        self._transcript_queue: asyncio.Queue[tuple[str, bool, str] | None] = asyncio.Queue(
+            maxsize=TRANSCRIPT_QUEUE_MAXSIZE
+        )
+        self._receive_task: asyncio.Task | None = None
+        self._dispatch_task: asyncio.Task | None = None
+        self._resampler = _Resampler(INPUT_SAMPLE_RATE, TARGET_SAMPLE_RATE)
 
     async def connect(self, transcript_callback: Callable):
         """Connect to XAI STT WebSocket.
@@ -74,68 +210,61 @@ class XAISTTProcessor:
                                  signature: async def callback(text, is_final, speaker)
         """
         self.transcript_callback = transcript_callback
-
-        headers = {"Authorization": f"Bearer {self.xai_api_key}"}
+        # New connection, new audio stream
+        self._resampler.reset()
 
         logger.info(f"[XAI STT] Connecting to {self.uri}")
 
         try:
             self.websocket = await websockets.connect(
                 self.uri,
-                extra_headers=headers,
+                extra_headers=self._headers,
                 ping_interval=30,
                 ping_timeout=10
             )
 
-            # Send config message
-            # XAI STT expects: PCM linear16, 16kHz, mono
-            config_message = {
-                "type": "config",
-                "data": {
-                    "encoding": "linear16",
-                    "sample_rate_hertz": 16000,
-                    "enable_interim_results": True,
-                }
-            }
-            await self.websocket.send(json.dumps(config_message))
+            await self.websocket.send(_CONFIG_MESSAGE)
             logger.info("[XAI STT] Config sent, connection established")
 
             self.running = True
 
-            # Start listening for responses
-            asyncio.create_task(self._receive_transcripts())
+            # Receive and dispatch separately so a slow callback doesn't stall recv()
+            self._receive_task = asyncio.create_task(
+                self._receive_transcripts(), name="xai-stt-receive"
+            )
+            self._dispatch_task = asyncio.create_task(
+                self._dispatch_transcripts(), name="xai-stt-dispatch"
+            )
 
         except Exception as e:
             logger.error(f"[XAI STT] Connection error: {e}")
             raise
 
-    async def send_audio_chunk(self, audio_chunk_b64: str):
+    async def send_audio_chunk(self, audio_bytes: bytes):
         """Send audio chunk to XAI STT.
 
+        Takes raw PCM so callers that already decoded the client's base64 don't
+        hand over a string that gets decoded a second time here.
+
         Args:
-            audio_chunk_b64: Base64-encoded PCM audio chunk (24kHz from Ray-Ban)
+            audio_bytes: Raw 16-bit PCM audio chunk (24kHz from Ray-Ban)
         """
         if not self.websocket or not self.running:
             logger.warning("[XAI STT] Not connected, skipping audio chunk")
             return
 
         try:
-            # Decode base64 to raw bytes
-            audio_bytes = base64.b64decode(audio_chunk_b64)
-
             # Resample from 24kHz to 16kHz (XAI requirement)
-            resampled_bytes = resample_audio(
-                audio_bytes, INPUT_SAMPLE_RATE, TARGET_SAMPLE_RATE
-            )
-
-            # Re-encode to base64
-            resampled_b64 = base64.b64encode(resampled_bytes).decode("utf-8")
+            resampled_bytes = self._resampler.resample(audio_bytes)
+            if not resampled_bytes:
+                return
 
+            # The endpoint takes JSON text frames, so base64 once on the way out
             audio_message = {
                 "type": "audio",
-                "data": {"audio": resampled_b64}
+                "data": {"audio": pybase64.b64encode(resampled_bytes).decode("ascii")}
             }
-            await self.websocket.send(json.dumps(audio_message))
+            await self.websocket.send(orjson.dumps(audio_message).decode())
             self.chunk_count += 1
 
             # Log every 10 chunks to reduce clutter
@@ -151,7 +280,7 @@ class XAISTTProcessor:
         try:
             while self.running and self.websocket:
                 response = await self.websocket.recv()
-                data = json.loads(response)
+                data = orjson.loads(response)
 
                 # Parse XAI STT response format
                 if data.get("data", {}).get("type") == "speech_recognized":
@@ -164,8 +293,16 @@ class XAISTTProcessor:
                     speaker = "Speaker 0"
 
                     if transcript and self.transcript_callback:
-                        # Call the callback with transcript
-                        await self.transcript_callback(transcript, is_final, speaker)
+                        item = (transcript, is_final, speaker)
+                        if is_final:
+                            # Never drop finals; wait for room instead
+                            await self._transcript_queue.put(item)
+                        else:
+                            try:
+                                self._transcript_queue.put_nowait(item)
+                            except asyncio.QueueFull:
+                                logger.debug("[XAI STT] Callback backed up, dropping interim")
+                                continue
 
                         # Highlight transcripts in logs
                         if is_final:
@@ -182,9 +319,32 @@ class XAISTTProcessor:
         finally:
             self.running = False
 
+    async def _dispatch_transcripts(self):
+        """Hand queued transcripts to the callback, one at a time and in order."""
+        while True:
+            item = await self._transcript_queue.get()
+            if item is None:
+                return
+            transcript, is_final, speaker = item
+            try:
+                await self.transcript_callback(transcript, is_final, speaker)
+            except Exception as e:
+                logger.error(f"[XAI STT] Transcript callback error: {e}")
+
     async def close(self):
         """Close the XAI STT connection."""
         self.running = False
+        if self._receive_task:
+            self._receive_task.cancel()
+            await asyncio.gather(self._receive_task, return_exceptions=True)
+        if self._dispatch_task:
+            # Let finals already queued reach the callback before shutting down
+            await self._transcript_queue.put(None)
+            try:
+                await asyncio.wait_for(self._dispatch_task, timeout=CLOSE_DRAIN_TIMEOUT_SEC)
+            except asyncio.TimeoutError:
+                logger.warning("[XAI STT] Transcript callback still busy, dropping the rest")
+        self._receive_task = self._dispatch_task = None
         if self.websocket:
             try:
                 await self.websocket.close()
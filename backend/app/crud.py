@@ -4,14 +4,31 @@ Provides Create, Read, Update, Delete functionality for database models.
 Follows a functional-first approach with pure functions as specified in the architecture guidelines.
 """
 
+import asyncio
+from collections.abc import AsyncIterator
 from datetime import datetime
+from typing import TYPE_CHECKING, NamedTuple
 
 from pydantic import BaseModel
+from sqlalchemy import bindparam, insert, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import and_, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.models import Page, VideoClip
 
+if TYPE_CHECKING:
+    from app.core.s3_utils import S3Manager
+
+# Rows per multi-row INSERT; keeps each statement well under PostgreSQL's
+# 65535 bind-parameter limit for the widest model (VideoClip, 8 columns)
+BULK_INSERT_CHUNK_SIZE = 500
+
+# List queries stream rows from a server-side cursor in batches of this size
+# instead of buffering the entire result before building any objects
+STREAM_BATCH_SIZE = 200
+
 
 # Pydantic models for Page operations
 class PageCreate(BaseModel):
@@ -43,6 +60,28 @@ async def create_page(*, session: AsyncSession, page_in: PageCreate) -> Page:
     return db_page
 
 
+async def create_pages_bulk(*, session: AsyncSession, pages_in: list[PageCreate]) -> list[Page]:
+    """Create many pages in a single transaction.
+
+    Rows are inserted with INSERT ... RETURNING, so no per-row refresh is needed.
+
+    Args:
+        session: Database session
+        pages_in: Page creation data, one entry per page
+
+    Returns:
+        The created pages, in input order
+    """
+    pages: list[Page] = []
+    stmt = insert(Page).returning(Page.id, Page.name, sort_by_parameter_order=True)
+    for start in range(0, len(pages_in), BULK_INSERT_CHUNK_SIZE):
+        chunk = pages_in[start : start + BULK_INSERT_CHUNK_SIZE]
+        result = await session.exec(stmt, params=[page_in.model_dump() for page_in in chunk])
+        pages.extend(Page(id=row.id, name=row.name) for row in result)
+    await session.commit()
+    return pages
+
+
 async def get_page(*, session: AsyncSession, page_id: int) -> Page | None:
     """Get a page by ID.
 
@@ -67,11 +106,9 @@ async def get_pages(*, session: AsyncSession, skip: int = 0, limit: int = 100) -
     Returns:
         List of pages
     """
-    query = select(Page)
-    # Convert Sequence[Page] to list[Page] explicitly for type safety
-    result = await session.exec(query.offset(skip).limit(limit))
-    pages = result.all()
-    return list(pages)
+    query = select(Page).offset(skip).limit(limit).execution_options(yield_per=STREAM_BATCH_SIZE)
+    result = await session.stream_scalars(query)
+    return [page async for page in result]
 
 
 async def update_page(*, session: AsyncSession, db_page: Page, page_in: PageUpdate) -> Page:
@@ -111,6 +148,84 @@ async def delete_page(*, session: AsyncSession, page_id: int) -> None:
 # VideoClip CRUD operations
 # ============================================================================
 
+# Read queries are built once with bind parameters; each call only supplies
+# values, skipping expression construction and cache-key generation
+_CLIP_AT_TIME = (
+    select(VideoClip)
+    .where(
+        and_(
+            VideoClip.session_id == bindparam("session_id"),
+            VideoClip.start_time <= bindparam("target_time"),
+        )
+    )
+    .order_by(VideoClip.start_time.desc())
+    .limit(1)
+)
+
+_CLIPS_IN_RANGE = (
+    select(VideoClip)
+    .where(
+        and_(
+            VideoClip.session_id == bindparam("session_id"),
+            VideoClip.start_time <= bindparam("range_end"),
+            VideoClip.end_time >= bindparam("range_start"),
+        )
+    )
+    .order_by(VideoClip.start_time)
+    .execution_options(yield_per=STREAM_BATCH_SIZE)
+)
+
+_CLIP_BY_INDEX = select(VideoClip).where(
+    and_(
+        VideoClip.session_id == bindparam("session_id"),
+        VideoClip.clip_index == bindparam("clip_index"),
+    )
+)
+
+# Only the columns needed to sign a clip's URLs, all covered by
+# ix_video_clips_session_start, so PostgreSQL can answer from the index alone
+# and no ORM objects are built
+_CLIP_REFS_IN_RANGE = (
+    select(
+        VideoClip.clip_index,
+        VideoClip.s3_key,
+        VideoClip.start_time,
+        VideoClip.end_time,
+        VideoClip.thumbnail_s3_key,
+    )
+    .where(
+        and_(
+            VideoClip.session_id == bindparam("session_id"),
+            VideoClip.start_time <= bindparam("range_end"),
+            VideoClip.end_time >= bindparam("range_start"),
+        )
+    )
+    .order_by(VideoClip.start_time)
+)
+
+_SESSION_CLIPS = (
+    select(VideoClip)
+    .where(VideoClip.session_id == bindparam("session_id"))
+    .order_by(VideoClip.start_time)
+    .execution_options(yield_per=STREAM_BATCH_SIZE)
+)
+
+# Both backends we run on (PostgreSQL, and SQLite in tests) accept ON CONFLICT
+_DIALECT_INSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+
+def _insert_clips_skipping_duplicates(session: AsyncSession):
+    """Build an INSERT into video_clips that ignores rows already stored.
+
+    A retried write carries the same (session_id, clip_index) as the one that
+    already landed, so the unique constraint makes the retry a no-op instead
+    of an error, without a SELECT beforehand.
+    """
+    dialect_insert = _DIALECT_INSERTS[session.get_bind().dialect.name]
+    return dialect_insert(VideoClip).on_conflict_do_nothing(
+        index_elements=["session_id", "clip_index"]
+    )
+
 
 async def create_video_clip(
     *,
@@ -136,23 +251,71 @@ async def create_video_clip(
         thumbnail_s3_key: S3 key for the thumbnail image (optional).
 
     Returns:
-        The created VideoClip record.
+        The created VideoClip record, or the one already stored for this
+        session_id and clip_index.
     """
-    clip = VideoClip(
-        session_id=session_id,
-        clip_index=clip_index,
-        s3_key=s3_key,
-        s3_bucket=s3_bucket,
-        start_time=start_time,
-        end_time=end_time,
-        thumbnail_s3_key=thumbnail_s3_key,
-    )
-    session.add(clip)
+    row = {
+        "session_id": session_id,
+        "clip_index": clip_index,
+        "s3_key": s3_key,
+        "s3_bucket": s3_bucket,
+        "start_time": start_time,
+        "end_time": end_time,
+        "thumbnail_s3_key": thumbnail_s3_key,
+    }
+    stmt = _insert_clips_skipping_duplicates(session).returning(VideoClip)
+    clip = (await session.exec(stmt, params=row)).scalar_one_or_none()
+    if clip is None:
+        # Retry of a write that already landed; hand back the stored row
+        clip = (
+            await session.exec(
+                _CLIP_BY_INDEX, params={"session_id": session_id, "clip_index": clip_index}
+            )
+        ).one()
     await session.commit()
-    await session.refresh(clip)
     return clip
 
 
+async def create_video_clips(*, session: AsyncSession, clips: list[dict]) -> list[int | None]:
+    """Insert many video clip records in one transaction.
+
+    Rows go out as multi-row INSERT ... RETURNING statements of up to
+    BULK_INSERT_CHUNK_SIZE rows. Unlike create_video_clip, no ORM objects are
+    built or refreshed. Used by the batched clip metadata writer. On PostgreSQL
+    the transaction commits with synchronous_commit off. Clips whose
+    (session_id, clip_index) is already stored are skipped, so a retried
+    batch is safe to resend.
+
+    Args:
+        session: Database session.
+        clips: Column values for each clip, keyed like create_video_clip's arguments.
+
+    Returns:
+        IDs of the inserted clips in input order, None for each skipped clip.
+    """
+    if not clips:
+        return []
+    if session.get_bind().dialect.name == "postgresql":
+        # Clip metadata can tolerate losing the last few commits on a crash;
+        # skip waiting on the WAL fsync for this transaction only
+        await session.exec(text("SET LOCAL synchronous_commit = OFF"))
+
+    # created_at is left to the column's server default
+    rows = [{"thumbnail_s3_key": None, **clip} for clip in clips]
+
+    # Skipped rows are missing from RETURNING, so match ids back by their key
+    # rather than relying on row position
+    inserted: dict[tuple[str, int], int] = {}
+    stmt = _insert_clips_skipping_duplicates(session).returning(
+        VideoClip.id, VideoClip.session_id, VideoClip.clip_index
+    )
+    for start in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+        result = await session.exec(stmt, params=rows[start : start + BULK_INSERT_CHUNK_SIZE])
+        inserted.update(((sid, idx), clip_id) for clip_id, sid, idx in result)
+    await session.commit()
+    return [inserted.get((row["session_id"], row["clip_index"])) for row in rows]
+
+
 async def get_clip_at_time(
     *,
     session: AsyncSession,
@@ -161,6 +324,10 @@ async def get_clip_at_time(
 ) -> VideoClip | None:
     """Get the clip containing a specific timestamp.
 
+    A session's clips are sequential and non-overlapping, so the containing clip
+    is the last one starting at or before the target. That is a single backward
+    seek on (session_id, start_time); its end_time is then checked in Python.
+
     Args:
         session: Database session.
         session_id: Session to search within.
@@ -169,15 +336,13 @@ async def get_clip_at_time(
     Returns:
         The VideoClip containing the timestamp, or None if not found.
     """
-    query = select(VideoClip).where(
-        and_(
-            VideoClip.session_id == session_id,
-            VideoClip.start_time <= target_time,
-            VideoClip.end_time >= target_time,
-        )
+    result = await session.exec(
+        _CLIP_AT_TIME, params={"session_id": session_id, "target_time": target_time}
     )
-    result = await session.exec(query)
-    return result.first()
+    clip = result.first()
+    if clip is None or clip.end_time < target_time:
+        return None
+    return clip
 
 
 async def get_clips_in_range(
@@ -198,19 +363,96 @@ async def get_clips_in_range(
     Returns:
         List of VideoClips overlapping the range, ordered by start_time.
     """
-    query = (
-        select(VideoClip)
-        .where(
-            and_(
-                VideoClip.session_id == session_id,
-                VideoClip.start_time <= range_end,
-                VideoClip.end_time >= range_start,
-            )
-        )
-        .order_by(VideoClip.start_time)
+    result = await session.stream_scalars(
+        _CLIPS_IN_RANGE,
+        {"session_id": session_id, "range_start": range_start, "range_end": range_end},
     )
-    result = await session.exec(query)
-    return list(result.all())
+    return [clip async for clip in result]
+
+
+class ClipRef(NamedTuple):
+    """The columns of a clip needed to locate and serve its objects."""
+
+    clip_index: int
+    s3_key: str
+    start_time: datetime
+    end_time: datetime
+    thumbnail_s3_key: str | None
+
+
+class ClipWithUrls(BaseModel):
+    """A clip together with pre-signed download URLs for its objects."""
+
+    clip: ClipRef
+    clip_url: str
+    thumbnail_url: str | None = None
+
+
+async def get_clips_in_range_with_urls(
+    *,
+    session: AsyncSession,
+    session_id: str,
+    range_start: datetime,
+    range_end: datetime,
+    s3: "S3Manager",
+    expires_in: int = 3600,
+) -> list[ClipWithUrls]:
+    """Get clips overlapping a time range along with pre-signed URLs.
+
+    The clips come from one query; every clip and thumbnail URL is then
+    signed concurrently instead of one clip at a time.
+
+    Args:
+        session: Database session.
+        session_id: Session to search within.
+        range_start: Start of time range.
+        range_end: End of time range.
+        s3: S3 manager used to sign the URLs.
+        expires_in: URL expiration time in seconds (default 1 hour).
+
+    Returns:
+        Clips overlapping the range with their URLs, ordered by start_time.
+    """
+    result = await session.exec(
+        _CLIP_REFS_IN_RANGE,
+        params={"session_id": session_id, "range_start": range_start, "range_end": range_end},
+    )
+    clips = [ClipRef(*row) for row in result]
+    keys = [clip.s3_key for clip in clips]
+    keys += [clip.thumbnail_s3_key for clip in clips if clip.thumbnail_s3_key]
+    urls = await asyncio.gather(*(s3.get_clip_url(key, expires_in=expires_in) for key in keys))
+    clip_urls, thumbnail_urls = iter(urls[: len(clips)]), iter(urls[len(clips) :])
+    return [
+        ClipWithUrls(
+            clip=clip,
+            clip_url=next(clip_urls),
+            thumbnail_url=next(thumbnail_urls) if clip.thumbnail_s3_key else None,
+        )
+        for clip in clips
+    ]
+
+
+async def iter_session_clips(
+    *,
+    session: AsyncSession,
+    session_id: str,
+) -> AsyncIterator[VideoClip]:
+    """Yield a session's clips in time order without loading them all at once.
+
+    Rows arrive from a server-side cursor STREAM_BATCH_SIZE at a time, so
+    memory stays flat however long the session ran. The session must stay
+    open until iteration finishes.
+
+    Args:
+        session: Database session.
+        session_id: Session to get clips for.
+
+    Yields:
+        VideoClips for the session, ordered by start_time.
+    """
+    result = await session.stream_scalars(_SESSION_CLIPS, {"session_id": session_id})
+    async for clip in result:
+        yield clip
 
 
 async def get_session_clips(
@@ -220,6 +462,8 @@ async def get_session_clips(
 ) -> list[VideoClip]:
     """Get all clips for a session, ordered by time.
 
+    Prefer iter_session_clips when the clips can be consumed one at a time.
+
     Args:
         session: Database session.
         session_id: Session to get clips for.
@@ -227,10 +471,4 @@ async def get_session_clips(
     Returns:
         List of all VideoClips for the session, ordered by start_time.
     """
-    query = (
-        select(VideoClip)
-        .where(VideoClip.session_id == session_id)
-        .order_by(VideoClip.start_time)
-    )
-    result = await session.exec(query)
-    return list(result.all())
+    return [clip async for clip in iter_session_clips(session=session, session_id=session_id)]
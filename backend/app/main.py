@@ -10,7 +10,11 @@ and routers. Entry point for the backend service.
 Uses SQLModel metadata to create tables directly instead of Alembic migrations.
 """
 
+import asyncio
+import os
+from collections.abc import Mapping
 from contextlib import asynccontextmanager
+from types import MappingProxyType
 
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
@@ -48,45 +52,68 @@ async def lifespan(_app: FastAPI):
     try:
         logger.info("FastAPI application starting up")
 
-        # Warm-up database connection to fail fast if unreachable
-        # Skip in local/dev mode if database is not available
-        try:
-            from sqlalchemy import text
-
-            from app.core.db import engine
+        # Warm up the database pool while the API keys are checked on a worker
+        # thread, so neither waits on the other
+        db_error, key_error = await asyncio.gather(
+            _warm_db_pool(),
+            asyncio.to_thread(_validate_ai_services),
+            return_exceptions=True,
+        )
+        if key_error is not None:
+            raise key_error
 
-            async with engine.connect() as conn:
-                await conn.execute(text("SELECT 1"))
+        # Fail fast if the database is unreachable
+        # Skip in local/dev mode if database is not available
+        if db_error is None:
             logger.info("Database connection verified")
-        except Exception as db_error:
-            if settings.ENVIRONMENT == "local":
-                logger.warning(f"Database connection failed (skipping in local mode): {db_error}")
-            else:
-                raise
-
-        # Validate AI service API keys
-        _validate_ai_services()
+        elif settings.ENVIRONMENT == "local":
+            logger.warning(f"Database connection failed (skipping in local mode): {db_error}")
+        else:
+            raise db_error
 
         yield
     finally:
         # Shutdown tasks
         logger.info("FastAPI application shutting down")
+        from app.core.clip_store import clip_metadata_writer
+        from app.core.mem0_client import mem0_manager
+
+        await clip_metadata_writer.close()
+        await mem0_manager.close()
     # Cleanup on shutdown is handled in the finally block above
 
 
-def _validate_ai_services() -> None:
-    """Validate that required AI service API keys are configured."""
-    import os
+async def _warm_db_pool() -> None:
+    """Open the pool's connections in parallel so early requests skip the connect.
 
-    services = {
+    Connecting is itself the reachability check; each connection goes straight
+    back to the pool, where ``pool_pre_ping`` validates it on later checkouts.
+    """
+    from app.core.db import engine
+
+    async def ping() -> None:
+        async with engine.connect():
+            pass
+
+    pool_size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    await asyncio.gather(*(ping() for _ in range(pool_size)))
+
+
+# Service keys are fixed for the life of the process, so they are read once at import
+_AI_SERVICE_KEYS: Mapping[str, str | None] = MappingProxyType(
+    {
         "Moondream": settings.MOONDREAM_API_KEY,
         "Mem0": settings.MEM0_API_KEY,
         "Deepgram": os.environ.get("DEEPGRAM_API_KEY"),
         "Hume": os.environ.get("HUME_API_KEY"),
         "xAI (Grok)": os.environ.get("XAI_API_KEY"),
     }
+)
+
 
-    for name, key in services.items():
+def _validate_ai_services() -> None:
+    """Validate that required AI service API keys are configured."""
+    for name, key in _AI_SERVICE_KEYS.items():
         if key:
             # Mask the key for logging (show first 4 chars)
             masked = f"{key[:4]}...{key[-4:]}" if len(key) > 8 else "****"
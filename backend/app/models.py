@@ -1,10 +1,43 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import Column, DateTime, Index, Integer, PrimaryKeyConstraint, String, Text
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    PrimaryKeyConstraint,
+    String,
+    Text,
+    UniqueConstraint,
+)
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
 from sqlmodel import Field, SQLModel
 
 
+class _utcnow(FunctionElement):
+    """Current UTC time as a naive timestamp, for server defaults.
+
+    Plain now() on a timezone-naive column stores the PostgreSQL session's
+    local time; the old client-side default was datetime.utcnow.
+    """
+
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(_utcnow, "postgresql")
+def _pg_utcnow(element, compiler, **kw):
+    return "timezone('utc', now())"
+
+
+@compiles(_utcnow)
+def _default_utcnow(element, compiler, **kw):
+    # SQLite's CURRENT_TIMESTAMP is already UTC (the test database)
+    return "CURRENT_TIMESTAMP"
+
+
 class Page(SQLModel, table=True):
     __tablename__ = "Page"
     __table_args__ = (PrimaryKeyConstraint("id", name="Page_pkey"),)
@@ -18,7 +51,22 @@ class VideoClip(SQLModel, table=True):
 
     __tablename__ = "video_clips"
     __table_args__ = (
-        Index("ix_video_clips_session_time", "session_id", "start_time", "end_time"),
+        # Serves every clip lookup (session_id equality, ordered by start_time).
+        # On PostgreSQL the INCLUDE columns make range reads index-only scans.
+        Index(
+            "ix_video_clips_session_start",
+            "session_id",
+            "start_time",
+            postgresql_include=[
+                "end_time",
+                "clip_index",
+                "s3_key",
+                "s3_bucket",
+                "thumbnail_s3_key",
+            ],
+        ),
+        # One row per clip; lets retried writes use ON CONFLICT DO NOTHING
+        UniqueConstraint("session_id", "clip_index", name="uq_video_clips_session_clip"),
     )
 
     id: Optional[int] = Field(
@@ -26,7 +74,7 @@ class VideoClip(SQLModel, table=True):
         sa_column=Column("id", Integer, primary_key=True, autoincrement=True),
     )
     session_id: str = Field(
-        sa_column=Column("session_id", String(100), nullable=False, index=True),
+        sa_column=Column("session_id", String(100), nullable=False),
     )
     clip_index: int = Field(
         sa_column=Column("clip_index", Integer, nullable=False),
@@ -38,14 +86,15 @@ class VideoClip(SQLModel, table=True):
         sa_column=Column("s3_bucket", String(100), nullable=False),
     )
     start_time: datetime = Field(
-        sa_column=Column("start_time", DateTime, nullable=False, index=True),
+        sa_column=Column("start_time", DateTime, nullable=False),
     )
     end_time: datetime = Field(
-        sa_column=Column("end_time", DateTime, nullable=False, index=True),
+        sa_column=Column("end_time", DateTime, nullable=False),
     )
-    created_at: datetime = Field(
-        default_factory=datetime.utcnow,
-        sa_column=Column("created_at", DateTime, nullable=False),
+    # Stamped by the database on insert and read back through RETURNING
+    created_at: datetime | None = Field(
+        default=None,
+        sa_column=Column("created_at", DateTime, nullable=False, server_default=_utcnow()),
     )
     thumbnail_s3_key: str | None = Field(
         default=None,
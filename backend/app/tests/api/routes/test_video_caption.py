@@ -0,0 +1,47 @@
+"""Unit tests for the video-caption WebSocket message router."""
+
+import pytest
+
+from app.api.routes import video_caption as vc
+
+
+class _FakeWebSocket:
+    def __init__(self, messages: list[dict]) -> None:
+        self._messages = list(messages)
+
+    async def receive(self) -> dict:
+        if not self._messages:
+            raise RuntimeError("socket broke")
+        return self._messages.pop(0)
+
+
+def _drain(queue) -> list:
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+
+def test_malformed_json_frame_is_dropped() -> None:
+    """A bad text frame is logged and skipped instead of raising."""
+    session = vc._CaptionSession(_FakeWebSocket([]))
+
+    vc._route_text(session, "{not json", 1)
+    vc._route_text(session, '"just a string"', 2)
+    vc._route_text(session, '{"type": "audio", "audio": "AAAA"}', 3)
+
+    assert _drain(session.audio_queue) == [{"type": "audio", "audio": "AAAA"}]
+    assert session.image_queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_router_sends_poison_pills_when_it_fails() -> None:
+    """The processors are told to shut down even if the router dies unexpectedly."""
+    # receive() fails once the list runs out - not a WebSocketDisconnect
+    session = vc._CaptionSession(_FakeWebSocket([{"type": "websocket.receive", "text": "{}"}]))
+
+    with pytest.raises(RuntimeError):
+        await vc._message_router(session)
+
+    assert _drain(session.audio_queue) == [None]
+    assert _drain(session.image_queue) == [None]
@@ -0,0 +1,4 @@
+"""Core module tests package.
+
+Contains unit tests for the processors and encoders in app.core.
+"""
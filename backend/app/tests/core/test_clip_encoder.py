@@ -0,0 +1,97 @@
+"""Unit tests for the streaming clip encoder.
+
+Feeds synthetic JPEG frames through ClipEncoder and checks clip boundaries,
+timestamps, and the encoded MP4 and thumbnail payloads.
+"""
+
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+import pytest
+
+from app.core.clip_encoder import THUMBNAIL_WIDTH, ClipEncoder, _encode_thumbnail
+
+
+def _jpeg_frame(width: int = 64, height: int = 48) -> bytes:
+    """Encode a random BGR image as JPEG."""
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    _, buffer = cv2.imencode(".jpg", image)
+    return buffer.tobytes()
+
+
+@pytest.mark.asyncio
+async def test_clip_emitted_when_duration_reached() -> None:
+    """A clip is returned on the first frame at or past the clip duration."""
+    encoder = ClipEncoder(clip_duration_sec=1.0, fps=10)
+    frame = _jpeg_frame()
+    start = datetime(2025, 1, 1, 12, 0, 0)
+
+    results = [
+        await encoder.add_frame(frame, start + timedelta(seconds=i / 10)) for i in range(11)
+    ]
+
+    assert all(result is None for result in results[:-1])
+    clip = results[-1]
+    assert clip is not None
+    video_bytes, start_iso, end_iso, clip_index, thumbnail_bytes = clip
+    assert video_bytes[4:8] == b"ftyp"  # MP4 container
+    assert thumbnail_bytes[:2] == b"\xff\xd8"  # JPEG SOI marker
+    assert start_iso == start.isoformat()
+    assert end_iso == (start + timedelta(seconds=1)).isoformat()
+    assert clip_index == 0
+    assert encoder.frame_count == 0
+
+
+@pytest.mark.asyncio
+async def test_flush_returns_partial_clip() -> None:
+    """Flush encodes buffered frames and advances the clip index."""
+    encoder = ClipEncoder(clip_duration_sec=10.0, fps=10)
+    frame = _jpeg_frame(width=65, height=49)  # Odd size must still encode
+    start = datetime(2025, 1, 1, 12, 0, 0)
+
+    for i in range(3):
+        assert await encoder.add_frame(frame, start + timedelta(seconds=i / 10)) is None
+    assert encoder.frame_count == 3
+
+    clip = await encoder.flush()
+    assert clip is not None
+    assert clip[0][4:8] == b"ftyp"
+    assert clip[3] == 0
+    assert encoder.clip_index == 1
+    assert await encoder.flush() is None
+
+
+@pytest.mark.asyncio
+async def test_undecodable_frame_is_skipped() -> None:
+    """Corrupt JPEG data is dropped without starting a clip."""
+    encoder = ClipEncoder(clip_duration_sec=1.0, fps=10)
+
+    assert await encoder.add_frame(b"not a jpeg", datetime(2025, 1, 1)) is None
+    assert encoder.frame_count == 0
+
+
+@pytest.mark.asyncio
+async def test_small_thumbnail_reuses_inbound_jpeg() -> None:
+    """The chosen frame's original JPEG is stored as the thumbnail unchanged."""
+    encoder = ClipEncoder(clip_duration_sec=1.0, fps=10)
+    frame = _jpeg_frame()
+    start = datetime(2025, 1, 1, 12, 0, 0)
+
+    for i in range(10):
+        await encoder.add_frame(frame, start + timedelta(seconds=i / 10))
+    clip = await encoder.flush()
+
+    assert clip is not None
+    assert clip[4] == frame
+
+
+def test_large_thumbnail_is_downscaled() -> None:
+    """Frames without a reusable JPEG are shrunk to the thumbnail width."""
+    image = np.zeros((720, 1280, 3), dtype=np.uint8)
+
+    thumbnail = _encode_thumbnail(image, None)
+
+    decoded = cv2.imdecode(np.frombuffer(thumbnail, np.uint8), cv2.IMREAD_COLOR)
+    assert decoded.shape[:2] == (180, THUMBNAIL_WIDTH)
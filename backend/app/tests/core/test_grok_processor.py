@@ -0,0 +1,122 @@
+"""Unit tests for agent_token coalescing, SSE parsing and tool-call assembly."""
+
+import asyncio
+
+import orjson
+import pytest
+
+from app.core import grok_processor as gp
+
+
+class _FakeWebSocket:
+    def __init__(self) -> None:
+        self.texts: list[str] = []
+
+    async def send_text(self, data: str) -> None:
+        await asyncio.sleep(0)
+        self.texts.append(orjson.loads(data)["text"])
+
+
+@pytest.mark.asyncio
+async def test_tokens_flush_after_interval_without_another_token() -> None:
+    """A token followed by a model pause goes out once the interval passes."""
+    websocket = _FakeWebSocket()
+    tokens = gp._TokenCoalescer(websocket)
+
+    await tokens.add("Hel")
+    await tokens.add("lo")
+    assert websocket.texts == []
+
+    await asyncio.sleep(gp.TOKEN_FLUSH_INTERVAL_SEC * 3)
+    assert websocket.texts == ["Hello"]
+
+
+@pytest.mark.asyncio
+async def test_batches_stay_in_order() -> None:
+    """Timer, size and final flushes deliver text in arrival order."""
+    websocket = _FakeWebSocket()
+    tokens = gp._TokenCoalescer(websocket)
+
+    await tokens.add("a")
+    await asyncio.sleep(gp.TOKEN_FLUSH_INTERVAL_SEC * 1.5)
+    big = "b" * gp.TOKEN_FLUSH_CHARS
+    await tokens.add(big)
+    await tokens.add("c")
+    await tokens.flush()
+
+    assert websocket.texts == ["a", big, "c"]
+
+
+class _FakeResponse:
+    def __init__(self, chunks: list[bytes]) -> None:
+        self._chunks = chunks
+
+    async def aiter_bytes(self):
+        for chunk in self._chunks:
+            yield chunk
+
+
+async def _sse_payloads(chunks: list[bytes]) -> list[bytes]:
+    return [payload async for payload in gp._iter_sse_data(_FakeResponse(chunks))]
+
+
+@pytest.mark.asyncio
+async def test_sse_lines_split_across_chunks() -> None:
+    """A data line cut anywhere by the network is reassembled before it is yielded."""
+    stream = b'data: {"a": 1}\n\n: keep-alive\ndata: {"b": 2}\n\ndata: [DONE]'
+    expected = [b'{"a": 1}', b'{"b": 2}', b"[DONE]"]
+
+    assert await _sse_payloads([stream]) == expected
+    for cut in range(1, len(stream)):
+        assert await _sse_payloads([stream[:cut], stream[cut:]]) == expected
+    assert await _sse_payloads([stream[i : i + 1] for i in range(len(stream))]) == expected
+
+
+def _merged(*deltas: list[dict]) -> dict[int, dict]:
+    tool_calls: dict[int, dict] = {}
+    for delta in deltas:
+        gp._merge_tool_call_deltas(tool_calls, delta)
+    return tool_calls
+
+
+def test_tool_call_arguments_split_across_deltas() -> None:
+    """Argument fragments for one index concatenate into a single call."""
+    tool_calls = _merged(
+        [{"index": 0, "id": "call_1", "function": {"name": "search_memories", "arguments": ""}}],
+        [{"index": 0, "function": {"arguments": '{"query": "fund'}}],
+        [{"index": 0, "function": {"arguments": 'ing"}'}}],
+    )
+
+    assert list(tool_calls) == [0]
+    assert tool_calls[0]["name"] == "search_memories"
+    assert orjson.loads(tool_calls[0]["arguments"]) == {"query": "funding"}
+
+
+def test_multiple_indexed_tool_calls_stay_separate() -> None:
+    """Interleaved fragments for different indexes go to their own calls, in order."""
+    tool_calls = _merged(
+        [
+            {"index": 0, "function": {"name": "store_memory", "arguments": '{"content"'}},
+            {"index": 1, "function": {"name": "search_memories", "arguments": '{"query"'}},
+        ],
+        [{"index": 1, "function": {"arguments": ': "x"}'}}],
+        [{"index": 0, "function": {"arguments": ': "y"}'}}],
+    )
+
+    assert [c["name"] for c in tool_calls.values()] == ["store_memory", "search_memories"]
+    assert orjson.loads(tool_calls[0]["arguments"]) == {"content": "y"}
+    assert orjson.loads(tool_calls[1]["arguments"]) == {"query": "x"}
+
+
+def test_index_less_fragments_continue_the_last_call() -> None:
+    """Fragments without an index append to the open call instead of opening new ones."""
+    tool_calls = _merged(
+        [{"id": "call_1", "function": {"name": "search_memories", "arguments": '{"qu'}}],
+        [{"function": {"arguments": 'ery": "a"'}}],
+        [{"function": {"arguments": "}"}}],
+        [{"id": "call_2", "function": {"name": "store_memory", "arguments": "{}"}}],
+    )
+
+    assert [c["name"] for c in tool_calls.values()] == ["search_memories", "store_memory"]
+    assert orjson.loads(tool_calls[0]["arguments"]) == {"query": "a"}
+    assert tool_calls[1]["arguments"] == "{}"
@@ -0,0 +1,50 @@
+"""Unit tests for Hume emotion update dedupe."""
+
+import orjson
+
+from app.core.hume_processor import EMOTION_CHANGE_THRESHOLD, HumeStreamManager
+
+
+def _result(score: float) -> dict:
+    return {"prosody": {"predictions": [{"emotions": [{"name": "Calmness", "score": score}]}]}}
+
+
+def test_each_session_gets_its_own_update() -> None:
+    """One session taking an update doesn't consume it for another."""
+    manager = HumeStreamManager()
+    first: dict = {}
+    second: dict = {}
+    manager.update_emotions(_result(0.5))
+
+    message = manager.take_emotion_update(first)
+    assert orjson.loads(message) == {"type": "hume_data", "emotions": {"voice_Calmness": 0.5}}
+    assert manager.take_emotion_update(second) == message
+    assert manager.take_emotion_update(first) is None
+
+
+def test_small_changes_are_not_reported() -> None:
+    """Scores within the threshold of what a session last saw are skipped."""
+    manager = HumeStreamManager()
+    reported: dict = {}
+    manager.update_emotions(_result(0.5))
+    manager.take_emotion_update(reported)
+
+    manager.update_emotions(_result(0.5 + EMOTION_CHANGE_THRESHOLD / 2))
+    assert manager.take_emotion_update(reported) is None
+
+    manager.update_emotions(_result(0.5 + EMOTION_CHANGE_THRESHOLD * 2))
+    assert manager.take_emotion_update(reported) is not None
+
+
+def test_sessions_share_one_serialized_message() -> None:
+    """The hume_data message is built once per change, not once per session."""
+    manager = HumeStreamManager()
+    manager.update_emotions(_result(0.5))
+
+    first = manager.take_emotion_update({})
+    assert manager.take_emotion_update({}) is first
+
+    manager.update_emotions(_result(0.9))
+    updated = manager.take_emotion_update({})
+    assert updated is not first
+    assert orjson.loads(updated)["emotions"] == {"voice_Calmness": 0.9}
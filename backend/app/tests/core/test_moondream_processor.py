@@ -0,0 +1,44 @@
+"""Unit tests for Moondream frame skipping."""
+
+import pytest
+
+from app.core import moondream_processor as mp
+from app.core.moondream_processor import MoondreamProcessor
+
+
+def _claimed(processor: MoondreamProcessor, frames: int) -> list[int]:
+    return [n for n in (processor.claim_frame() for _ in range(frames)) if n is not None]
+
+
+def test_claim_frame_takes_every_nth(monkeypatch: pytest.MonkeyPatch) -> None:
+    """With frames a second apart the bucket never runs dry; every Nth is claimed."""
+    clock = iter(range(1, 1000))
+    monkeypatch.setattr(mp.time, "monotonic", lambda: float(next(clock)))
+    processor = MoondreamProcessor()
+
+    assert _claimed(processor, 30) == [10, 20, 30]
+
+
+def test_token_bucket_caps_bursts(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Due frames are dropped once the bucket is empty."""
+    monkeypatch.setattr(mp.time, "monotonic", lambda: 0.0)
+    processor = MoondreamProcessor()
+    processor._tokens_updated = 0.0
+    processor._process_every_n = 1
+
+    assert len(_claimed(processor, 10)) == int(mp.CAPTION_BURST)
+
+
+@pytest.mark.parametrize(
+    ("latency", "expected"),
+    [(0.5, 12), (0.001, mp.MIN_PROCESS_EVERY_N), (30.0, mp.MAX_PROCESS_EVERY_N)],
+)
+def test_latency_window_retunes_interval(latency: float, expected: int) -> None:
+    """A full latency window sets N from the average latency, within bounds."""
+    processor = MoondreamProcessor()
+    for _ in range(mp.LATENCY_WINDOW - 1):
+        processor._record_latency(latency)
+    assert processor._process_every_n == 10
+
+    processor._record_latency(latency)
+    assert processor._process_every_n == expected
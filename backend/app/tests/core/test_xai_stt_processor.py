@@ -0,0 +1,76 @@
+"""Unit tests for the XAI STT audio resampler."""
+
+from itertools import pairwise
+
+import numpy as np
+
+from app.core.xai_stt_processor import _Resampler, resample_audio
+
+
+def _tone(freq: float, rate: int, seconds: float = 0.1) -> np.ndarray:
+    t = np.arange(int(rate * seconds)) / rate
+    return (10000 * np.sin(2 * np.pi * freq * t)).astype(np.int16)
+
+
+def test_resample_length_and_passband() -> None:
+    """A 1 kHz tone keeps its amplitude and lands on the 16 kHz grid."""
+    out = np.frombuffer(resample_audio(_tone(1000, 24000).tobytes(), 24000, 16000), np.int16)
+
+    assert len(out) == 1600
+    expected = _tone(1000, 16000)
+    # Ignore the filter's edge transients at either end of the chunk
+    np.testing.assert_allclose(out[50:-50], expected[50:-50], atol=300)
+
+
+def test_resample_rejects_aliasing_tone() -> None:
+    """A tone above the 8 kHz target Nyquist is filtered out, not folded back."""
+    out = np.frombuffer(resample_audio(_tone(10000, 24000).tobytes(), 24000, 16000), np.int16)
+
+    assert np.abs(out[50:-50]).max() < 500
+
+
+def test_resample_same_rate_is_passthrough() -> None:
+    """Matching rates return the input untouched."""
+    audio = _tone(1000, 16000).tobytes()
+    assert resample_audio(audio, 16000, 16000) is audio
+
+
+def test_streamed_chunks_match_one_shot() -> None:
+    """Resampling 100 ms chunks in a stream gives the one-shot result, edges included."""
+    audio = _tone(1000, 24000, seconds=1.0) // 2 + _tone(3100, 24000, seconds=1.0) // 2
+    expected = np.frombuffer(resample_audio(audio.tobytes(), 24000, 16000), np.int16)
+
+    resampler = _Resampler(24000, 16000)
+    chunks = [resampler.resample(audio[i : i + 2400].tobytes()) for i in range(0, len(audio), 2400)]
+    out = np.frombuffer(b"".join(chunks) + resampler.flush(), np.int16)
+
+    assert len(out) == len(expected) == 16000
+    np.testing.assert_allclose(out, expected, atol=1)
+
+
+def test_resampler_handles_uneven_chunks() -> None:
+    """Chunk sizes that don't divide the rate ratio still line up with one-shot."""
+    audio = _tone(1000, 24000, seconds=0.5)
+    expected = np.frombuffer(resample_audio(audio.tobytes(), 24000, 16000), np.int16)
+
+    resampler = _Resampler(24000, 16000)
+    bounds = [0, 1, 7, 500, 501, 2900, 6000, len(audio)]
+    chunks = [resampler.resample(audio[a:b].tobytes()) for a, b in pairwise(bounds)]
+    out = np.frombuffer(b"".join(chunks) + resampler.flush(), np.int16)
+
+    np.testing.assert_allclose(out, expected, atol=1)
+
+
+def test_resampler_reuses_its_buffers() -> None:
+    """Steady 100 ms chunks are filtered in the preallocated scratch buffers."""
+    audio = _tone(1000, 24000, seconds=1.0)
+    resampler = _Resampler(24000, 16000)
+    resampler.resample(audio[:2400].tobytes())
+    stuffed, out = resampler._stuffed, resampler._out
+
+    for i in range(2400, len(audio), 2400):
+        resampler.resample(audio[i : i + 2400].tobytes())
+    resampler.flush()
+
+    assert resampler._stuffed is stuffed
+    assert resampler._out is out
@@ -0,0 +1,22 @@
+"""Tests for Page CRUD operations."""
+
+import uuid
+
+import pytest
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.crud import PageCreate, create_pages_bulk, get_page
+
+
+@pytest.mark.asyncio
+async def test_create_pages_bulk_returns_rows_in_order(db: AsyncSession) -> None:
+    """Bulk-created pages come back with IDs, in input order."""
+    names = [f"bulk-{uuid.uuid4().hex}" for _ in range(3)]
+
+    pages = await create_pages_bulk(session=db, pages_in=[PageCreate(name=n) for n in names])
+
+    assert [p.name for p in pages] == names
+    for page in pages:
+        stored = await get_page(session=db, page_id=page.id)
+        assert stored is not None
+        assert stored.name == page.name
@@ -0,0 +1,238 @@
+"""Tests for VideoClip CRUD operations."""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.crud import (
+    create_video_clip,
+    create_video_clips,
+    get_clip_at_time,
+    get_clips_in_range,
+    get_clips_in_range_with_urls,
+    iter_session_clips,
+)
+
+
+@pytest.mark.asyncio
+async def test_create_video_clip_populates_id(db: AsyncSession) -> None:
+    """A single insert comes back with its database ID without a refresh."""
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    clip = await create_video_clip(
+        session=db,
+        session_id=f"single-{uuid.uuid4().hex}",
+        clip_index=0,
+        s3_key="clips/clip_0000.mp4",
+        s3_bucket="bucket",
+        start_time=start,
+        end_time=start + timedelta(seconds=10),
+    )
+
+    assert clip.id is not None
+    assert clip.created_at is not None
+
+
+@pytest.mark.asyncio
+async def test_create_video_clips_inserts_batch(db: AsyncSession) -> None:
+    """A batch insert stores every clip and returns their IDs in order."""
+    session_id = f"batch-{uuid.uuid4().hex}"
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    clips = [
+        {
+            "session_id": session_id,
+            "clip_index": i,
+            "s3_key": f"{session_id}/clips/clip_{i:04d}.mp4",
+            "s3_bucket": "bucket",
+            "start_time": start + timedelta(seconds=10 * i),
+            "end_time": start + timedelta(seconds=10 * (i + 1)),
+            "thumbnail_s3_key": None,
+        }
+        for i in range(3)
+    ]
+
+    ids = await create_video_clips(session=db, clips=clips)
+
+    stored = await get_clips_in_range(
+        session=db,
+        session_id=session_id,
+        range_start=start,
+        range_end=start + timedelta(seconds=30),
+    )
+    assert [c.clip_index for c in stored] == [0, 1, 2]
+    assert [c.id for c in stored] == ids
+    assert all(c.created_at is not None for c in stored)
+
+
+@pytest.mark.asyncio
+async def test_create_video_clip_retry_returns_stored_row(db: AsyncSession) -> None:
+    """Writing the same session_id and clip_index twice keeps the first row."""
+    session_id = f"retry-{uuid.uuid4().hex}"
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    kwargs = {
+        "session": db,
+        "session_id": session_id,
+        "clip_index": 0,
+        "s3_bucket": "bucket",
+        "start_time": start,
+        "end_time": start + timedelta(seconds=10),
+    }
+
+    first = await create_video_clip(s3_key="clips/first.mp4", **kwargs)
+    second = await create_video_clip(s3_key="clips/second.mp4", **kwargs)
+
+    assert second.id == first.id
+    assert second.s3_key == "clips/first.mp4"
+
+
+@pytest.mark.asyncio
+async def test_create_video_clips_skips_stored_clips(db: AsyncSession) -> None:
+    """A resent batch only inserts the clips that are new, reporting None for the rest."""
+    session_id = f"resend-{uuid.uuid4().hex}"
+    start = datetime(2026, 1, 1, 12, 0, 0)
+
+    def clip(i: int) -> dict:
+        return {
+            "session_id": session_id,
+            "clip_index": i,
+            "s3_key": f"{session_id}/clips/clip_{i:04d}.mp4",
+            "s3_bucket": "bucket",
+            "start_time": start + timedelta(seconds=10 * i),
+            "end_time": start + timedelta(seconds=10 * (i + 1)),
+        }
+
+    [first_id] = await create_video_clips(session=db, clips=[clip(1)])
+    ids = await create_video_clips(session=db, clips=[clip(0), clip(1), clip(2)])
+
+    assert ids[1] is None
+    assert None not in (ids[0], ids[2])
+    stored = await get_clips_in_range(
+        session=db,
+        session_id=session_id,
+        range_start=start,
+        range_end=start + timedelta(seconds=30),
+    )
+    assert [c.id for c in stored] == [ids[0], first_id, ids[2]]
+
+
+@pytest.mark.asyncio
+async def test_get_clip_at_time_finds_containing_clip(db: AsyncSession) -> None:
+    """The clip containing the timestamp is returned; gaps and the future are None."""
+    session_id = f"at-{uuid.uuid4().hex}"
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    # Clips 0 and 1 are back to back; clip 2 starts after a 5 s gap
+    spans = [(0, 10), (10, 20), (25, 35)]
+    await create_video_clips(
+        session=db,
+        clips=[
+            {
+                "session_id": session_id,
+                "clip_index": i,
+                "s3_key": f"{session_id}/clips/clip_{i:04d}.mp4",
+                "s3_bucket": "bucket",
+                "start_time": start + timedelta(seconds=lo),
+                "end_time": start + timedelta(seconds=hi),
+            }
+            for i, (lo, hi) in enumerate(spans)
+        ],
+    )
+
+    async def index_at(seconds: float) -> int | None:
+        clip = await get_clip_at_time(
+            session=db, session_id=session_id, target_time=start + timedelta(seconds=seconds)
+        )
+        return clip.clip_index if clip else None
+
+    assert await index_at(5) == 0
+    assert await index_at(15) == 1
+    assert await index_at(22) is None
+    assert await index_at(30) == 2
+    assert await index_at(40) is None
+    assert await index_at(-1) is None
+
+
+@pytest.mark.asyncio
+async def test_iter_session_clips_yields_in_time_order(db: AsyncSession) -> None:
+    """Streaming a session returns only its clips, ordered by start_time."""
+    session_id = f"iter-{uuid.uuid4().hex}"
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    # Inserted out of order so the ordering comes from the query
+    await create_video_clips(
+        session=db,
+        clips=[
+            {
+                "session_id": sid,
+                "clip_index": i,
+                "s3_key": f"{sid}/clips/clip_{i:04d}.mp4",
+                "s3_bucket": "bucket",
+                "start_time": start + timedelta(seconds=10 * i),
+                "end_time": start + timedelta(seconds=10 * (i + 1)),
+            }
+            for sid, i in [
+                (session_id, 2),
+                (session_id, 0),
+                (f"other-{session_id}", 1),
+                (session_id, 1),
+            ]
+        ],
+    )
+
+    indexes = [c.clip_index async for c in iter_session_clips(session=db, session_id=session_id)]
+
+    assert indexes == [0, 1, 2]
+
+
+class _FakeS3:
+    """Signs URLs by echoing the key back, recording each call."""
+
+    def __init__(self) -> None:
+        self.signed: list[str] = []
+
+    async def get_clip_url(self, s3_key: str, expires_in: int = 3600) -> str:
+        self.signed.append(s3_key)
+        return f"https://signed/{s3_key}?expires={expires_in}"
+
+
+@pytest.mark.asyncio
+async def test_get_clips_in_range_with_urls_pairs_urls_with_clips(db: AsyncSession) -> None:
+    """Each clip gets its own clip URL, and a thumbnail URL only when it has one."""
+    session_id = f"urls-{uuid.uuid4().hex}"
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    await create_video_clips(
+        session=db,
+        clips=[
+            {
+                "session_id": session_id,
+                "clip_index": i,
+                "s3_key": f"{session_id}/clips/clip_{i:04d}.mp4",
+                "s3_bucket": "bucket",
+                "start_time": start + timedelta(seconds=10 * i),
+                "end_time": start + timedelta(seconds=10 * (i + 1)),
+                "thumbnail_s3_key": f"{session_id}/thumbs/clip_{i:04d}.jpg" if i != 1 else None,
+            }
+            for i in range(3)
+        ],
+    )
+    s3 = _FakeS3()
+
+    results = await get_clips_in_range_with_urls(
+        session=db,
+        session_id=session_id,
+        range_start=start,
+        range_end=start + timedelta(seconds=30),
+        s3=s3,  # type: ignore[arg-type]
+        expires_in=60,
+    )
+
+    assert [r.clip.clip_index for r in results] == [0, 1, 2]
+    for r in results:
+        assert r.clip_url == f"https://signed/{r.clip.s3_key}?expires=60"
+    assert (
+        results[0].thumbnail_url == f"https://signed/{session_id}/thumbs/clip_0000.jpg?expires=60"
+    )
+    assert results[1].thumbnail_url is None
+    assert (
+        results[2].thumbnail_url == f"https://signed/{session_id}/thumbs/clip_0002.jpg?expires=60"
+    )
+    assert len(s3.signed) == 5
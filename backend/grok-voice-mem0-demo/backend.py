@@ -5,12 +5,16 @@ Backend server with Grok Voice API function calling for Mem0 memory search
 
 import asyncio
 import base64
-import json
+import hashlib
 import os
+import re
+from contextlib import asynccontextmanager
 from typing import Dict, Any
+from cachetools import TTLCache
 from dotenv import load_dotenv
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+import orjson
 import websockets
 from mem0 import MemoryClient
 
@@ -21,8 +25,22 @@ XAI_API_KEY = os.getenv("XAI_API_KEY")
 MEM0_API_KEY = os.getenv("MEM0_API_KEY")
 PORT = int(os.getenv("PORT", 8000))
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    grok_pool.start()
+    flusher = asyncio.create_task(_flush_adds())
+    yield
+    flusher.cancel()
+    # Whatever arrived since the last tick still has to reach Mem0
+    await _send_pending_adds()
+    if _pending_adds:
+        print(f"❌ Shutting down with {len(_pending_adds)} memories not stored: "
+              f"{[m['content'] for m in _pending_adds]}")
+    await grok_pool.close()
+
+
 # Initialize FastAPI
-app = FastAPI(title="Voice Mem0 Assistant")
+app = FastAPI(title="Voice Mem0 Assistant", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -36,13 +54,58 @@ app.add_middleware(
 # Initialize Mem0 client
 mem0_client = MemoryClient(api_key=MEM0_API_KEY)
 
+# Recent read results, keyed on the call's arguments. Voice turns often repeat
+# the same question within seconds; add_memories clears it so writes show up.
+_read_cache: TTLCache = TTLCache(maxsize=512, ttl=30)
+
 
 # ========================================
 # MEM0 FUNCTION HANDLERS
 # ========================================
 
+# Memories wait here and go to Mem0 as one conversation per flush, instead of
+# one request per utterance
+MEM0_FLUSH_INTERVAL_SEC = 0.5
+# A failed add goes back in the queue for the next flush; past this many
+# waiting memories the oldest are dropped (and logged) instead
+MEM0_PENDING_MAX = 256
+_pending_adds: list = []
+
+
+async def _send_pending_adds() -> None:
+    """Send everything buffered so far to Mem0 in a single add."""
+    if not _pending_adds:
+        return
+    batch = _pending_adds[:]
+    _pending_adds.clear()
+    try:
+        await asyncio.to_thread(mem0_client.add, user_id='jarvis', messages=batch)
+    except Exception as e:
+        print(f"❌ Mem0 add error, will retry {len(batch)} memories: {e}")
+        # Put the batch back ahead of anything queued meanwhile, keeping order
+        _pending_adds[:0] = batch
+        overflow = len(_pending_adds) - MEM0_PENDING_MAX
+        if overflow > 0:
+            dropped = _pending_adds[:overflow]
+            del _pending_adds[:overflow]
+            print(f"❌ Mem0 queue full, dropped {overflow} memories: "
+                  f"{[m['content'] for m in dropped]}")
+        return
+    # Drop cached reads only once the new memories are actually searchable
+    _read_cache.clear()
+
+
+async def _flush_adds() -> None:
+    """Flush buffered memories every MEM0_FLUSH_INTERVAL_SEC until cancelled."""
+    while True:
+        await asyncio.sleep(MEM0_FLUSH_INTERVAL_SEC)
+        await _send_pending_adds()
+
+
 async def add_memories(args: Dict[str, Any]) -> Dict[str, Any]:
-    mem0_client.add(user_id='jarvis', messages=args['data'])
+    """Queue a memory for the next batched write; Grok doesn't wait on it."""
+    _pending_adds.append({"role": "user", "content": args['data']})
+    return {"status": "queued"}
 
 async def search_memories(args: Dict[str, Any]) -> Dict[str, Any]:
     """Search Mem0 memories by query."""
@@ -51,9 +114,13 @@ async def search_memories(args: Dict[str, Any]) -> Dict[str, Any]:
 
     print(f"🔍 Searching Mem0: query='{query}', limit={limit}")
 
+    cache_key = ("search", query, limit)
+    if cache_key in _read_cache:
+        return _read_cache[cache_key]
+
     try:
         filters = {"AND": [{"user_id": "jarvis"}]}
-        results = mem0_client.search(query, filters=filters, limit=limit)
+        results = await asyncio.to_thread(mem0_client.search, query, filters=filters, limit=limit)
 
         # Extract memories
         if isinstance(results, dict):
@@ -71,12 +138,14 @@ async def search_memories(args: Dict[str, Any]) -> Dict[str, Any]:
                     "metadata": mem.get("metadata", {})
                 })
 
-        return {
+        result = {
             "status": "success",
             "query": query,
             "count": len(formatted),
             "memories": formatted
         }
+        _read_cache[cache_key] = result
+        return result
     except Exception as e:
         print(f"❌ Mem0 search error: {e}")
         return {
@@ -91,9 +160,13 @@ async def get_recent_memories(args: Dict[str, Any]) -> Dict[str, Any]:
 
     print(f"📝 Getting recent memories: limit={limit}")
 
+    cache_key = ("recent", limit)
+    if cache_key in _read_cache:
+        return _read_cache[cache_key]
+
     try:
         filters = {"AND": [{"user_id": "jarvis"}]}
-        results = mem0_client.get_all(filters=filters, limit=limit)
+        results = await asyncio.to_thread(mem0_client.get_all, filters=filters, limit=limit)
 
         # Extract memories
         if isinstance(results, dict):
@@ -111,11 +184,13 @@ async def get_recent_memories(args: Dict[str, Any]) -> Dict[str, Any]:
                     "metadata": mem.get("metadata", {})
                 })
 
-        return {
+        result = {
             "status": "success",
             "count": len(formatted),
             "memories": formatted
         }
+        _read_cache[cache_key] = result
+        return result
     except Exception as e:
         print(f"❌ Mem0 get_all error: {e}")
         return {
@@ -176,53 +251,124 @@ TOOLS = [
 ]
 
 
+SESSION_CONFIG = {
+    "type": "session.update",
+    "session": {
+        "voice": "Ara",
+        "instructions": "You are a helpful memory assistant. You can search through the user's stored memories and recall past events. When the user asks about their memories, use the search_memories or get_recent_memories functions to help them find what they're looking for." + str(TOOLS),
+        "turn_detection": {"type": "server_vad"},
+        "audio": {
+            "input": {
+                "format": {"type": "audio/pcm", "rate": 24000}
+            },
+            "output": {
+                "format": {"type": "audio/pcm", "rate": 24000}
+            }
+        },
+        "tools": TOOLS
+    }
+}
+
+# Serialized once; sent as a text frame since the realtime API takes JSON text
+SESSION_CONFIG_JSON = orjson.dumps(SESSION_CONFIG).decode()
+
+# Substring test that lets the forwarder skip parsing all other events
+FUNCTION_CALL_EVENT = '"response.function_call_arguments.done"'
+# Audio deltas are forwarded as binary frames of raw PCM; the pattern pulls the
+# base64 payload out without parsing the rest of the event
+AUDIO_DELTA_EVENT = '"response.output_audio.delta"'
+AUDIO_DELTA_RE = re.compile(r'"delta"\s*:\s*"([^"]*)"')
+RESPONSE_CREATE_JSON = orjson.dumps({"type": "response.create"}).decode()
+
+# Warm Grok sessions kept ready for the next clients
+GROK_POOL_SIZE = int(os.getenv("GROK_POOL_SIZE", 2))
+
+
+async def open_grok_session():
+    """Connect to the Grok Voice API and send the session configuration."""
+    grok_ws = await websockets.connect(
+        GROK_WSS_URL,
+        extra_headers={
+            "Authorization": f"Bearer {XAI_API_KEY}",
+            "Content-Type": "application/json"
+        }
+    )
+    await grok_ws.send(SESSION_CONFIG_JSON)
+    print("✅ Connected to Grok Voice API, sent session config with Mem0 tools")
+    return grok_ws
+
+
+class GrokSessionPool:
+    """Keeps a few Grok sessions connected and configured ahead of clients.
+
+    A client gets a warm socket instead of paying the TLS handshake and
+    session.update on connect. Realtime sessions carry conversation state, so
+    each socket is used by one client and closed; the pool refills behind it.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._warm: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self._taken = asyncio.Event()
+        self._refill_task = None
+
+    def start(self):
+        if self.size > 0:
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def _refill(self):
+        while True:
+            while not self._warm.full():
+                await self._warm_one()
+            self._taken.clear()
+            await self._taken.wait()
+
+    async def _warm_one(self):
+        """Open one session into the pool, backing off for 5 s if it fails."""
+        try:
+            self._warm.put_nowait(await open_grok_session())
+        except Exception as e:
+            print(f"❌ Grok pre-connect failed: {e}")
+            await asyncio.sleep(5)
+
+    async def acquire(self):
+        """Return a warm session, or open one if none is ready."""
+        while not self._warm.empty():
+            grok_ws = self._warm.get_nowait()
+            self._taken.set()
+            if grok_ws.open:
+                return grok_ws
+            # Dropped by the server while idle
+        return await open_grok_session()
+
+    async def close(self):
+        if self._refill_task:
+            self._refill_task.cancel()
+        while not self._warm.empty():
+            await self._warm.get_nowait().close()
+
+
+grok_pool = GrokSessionPool(GROK_POOL_SIZE)
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for client connection."""
     await websocket.accept()
     print("✅ Client connected")
 
-    # Connect to Grok API
+    # Take an already connected and configured Grok session from the pool
     try:
-        async with websockets.connect(
-            GROK_WSS_URL,
-            extra_headers={
-                "Authorization": f"Bearer {XAI_API_KEY}",
-                "Content-Type": "application/json"
-            }
-        ) as grok_ws:
-            print("✅ Connected to Grok Voice API")
-
-            # Send session configuration with tools
-            session_config = {
-                "type": "session.update",
-                "session": {
-                    "voice": "Ara",
-                    "instructions": "You are a helpful memory assistant. You can search through the user's stored memories and recall past events. When the user asks about their memories, use the search_memories or get_recent_memories functions to help them find what they're looking for.",
-                    "turn_detection": {"type": "server_vad"},
-                    "audio": {
-                        "input": {
-                            "format": {"type": "audio/pcm", "rate": 24000}
-                        },
-                        "output": {
-                            "format": {"type": "audio/pcm", "rate": 24000}
-                        }
-                    },
-                    "tools": TOOLS
-                }
-            }
-            session_config['instructions'] += str(TOOLS)
-            await grok_ws.send(json.dumps(session_config))
-            print("📤 Sent session config with Mem0 tools")
-
+        grok_ws = await grok_pool.acquire()
+        try:
             # Create tasks for bidirectional communication
             async def client_to_grok():
-                """Forward client messages to Grok."""
+                """Forward client messages to Grok unchanged."""
                 try:
                     while True:
-                        data = await websocket.receive_text()
-                        message = json.loads(data)
-                        await grok_ws.send(json.dumps(message))
+                        # Clients already send Grok-format JSON text; pass it through
+                        # without a parse/re-serialize round trip
+                        await grok_ws.send(await websocket.receive_text())
                 except Exception as e:
                     print(f"❌ Client → Grok error: {e}")
 
@@ -230,13 +376,23 @@ async def websocket_endpoint(websocket: WebSocket):
                 """Forward Grok messages to client and handle function calls."""
                 try:
                     async for message in grok_ws:
-                        event = json.loads(message)
+                        # Audio deltas dominate this stream: send their PCM as a
+                        # binary frame instead of the base64 JSON wrapper
+                        if AUDIO_DELTA_EVENT in message:
+                            match = AUDIO_DELTA_RE.search(message)
+                            if match:
+                                if match.group(1):
+                                    await websocket.send_bytes(base64.b64decode(match.group(1)))
+                                continue
+
+                        # Only parse events that can be function calls
+                        event = orjson.loads(message) if FUNCTION_CALL_EVENT in message else None
 
                         # Handle function calls
-                        if event.get("type") == "response.function_call_arguments.done":
+                        if event and event.get("type") == "response.function_call_arguments.done":
                             function_name = event.get("name")
                             call_id = event.get("call_id")
-                            arguments = json.loads(event.get("arguments", "{}"))
+                            arguments = orjson.loads(event.get("arguments", "{}"))
 
                             print(f"📞 Function call: {function_name}({arguments})")
 
@@ -247,19 +403,17 @@ async def websocket_endpoint(websocket: WebSocket):
                                 print(f"✅ Function result: {result}")
 
                                 # Send result back to Grok
-                                await grok_ws.send(json.dumps({
+                                await grok_ws.send(orjson.dumps({
                                     "type": "conversation.item.create",
                                     "item": {
                                         "type": "function_call_output",
                                         "call_id": call_id,
-                                        "output": json.dumps(result)
+                                        "output": orjson.dumps(result).decode()
                                     }
-                                }))
+                                }).decode())
 
                                 # Request continuation
-                                await grok_ws.send(json.dumps({
-                                    "type": "response.create"
-                                }))
+                                await grok_ws.send(RESPONSE_CREATE_JSON)
 
                         # Forward all events to client
                         await websocket.send_text(message)
@@ -273,34 +427,56 @@ async def websocket_endpoint(websocket: WebSocket):
                 grok_to_client()
             )
 
+        finally:
+            # Sessions keep conversation state, so they are never handed to another client
+            await grok_ws.close()
+
     except Exception as e:
         print(f"❌ WebSocket error: {e}")
         await websocket.close()
 
 
+# Both bodies depend only on import-time settings, so they are serialized once and
+# served with an ETag; probes that send If-None-Match get an empty 304 back.
+def _static_json(payload: Dict[str, Any]) -> tuple[bytes, str]:
+    body = orjson.dumps(payload)
+    return body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def _static_response(request: Request, body: bytes, etag: str) -> Response:
+    headers = {"ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+_ROOT_RESPONSE, _ROOT_ETAG = _static_json({
+    "service": "Voice Mem0 Assistant",
+    "status": "running",
+    "endpoints": {
+        "websocket": "/ws",
+        "health": "/health"
+    },
+    "tools": [tool["name"] for tool in TOOLS]
+})
+
+_HEALTH_RESPONSE, _HEALTH_ETAG = _static_json({
+    "status": "healthy",
+    "mem0_connected": bool(MEM0_API_KEY),
+    "grok_connected": bool(XAI_API_KEY)
+})
+
+
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Root endpoint."""
-    return {
-        "service": "Voice Mem0 Assistant",
-        "status": "running",
-        "endpoints": {
-            "websocket": "/ws",
-            "health": "/health"
-        },
-        "tools": [tool["name"] for tool in TOOLS]
-    }
+    return _static_response(request, _ROOT_RESPONSE, _ROOT_ETAG)
 
 
 @app.get("/health")
-async def health():
+async def health(request: Request):
     """Health check."""
-    return {
-        "status": "healthy",
-        "mem0_connected": bool(MEM0_API_KEY),
-        "grok_connected": bool(XAI_API_KEY)
-    }
-
+    return _static_response(request, _HEALTH_RESPONSE, _HEALTH_ETAG)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,97 @@
+"""Helpers shared by the streaming simulators and test clients in this directory.
+
+Covers the timestamped logger, JPEG encoding off the event loop, the idle-aware
+receive loop and the uvloop fallback, so each script only holds its own
+streaming logic. The scripts import this as a sibling module, so run them from
+anywhere as ``python backend/<script>.py``.
+"""
+
+import asyncio
+import time
+from collections.abc import Coroutine
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+try:
+    import uvloop
+except ImportError:
+    # uvloop has no Windows build - fall back to the default event loop
+    uvloop = None
+
+try:
+    from turbojpeg import TJSAMP_420, TurboJPEG
+
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, RuntimeError, OSError):
+    # Native libturbojpeg not installed - fall back to OpenCV's encoder
+    _turbo_jpeg = None
+
+# HH:MM:SS only changes once a second, so it is formatted once per second
+_log_second = -1
+_log_stamp = ""
+
+
+def log(msg: str):
+    """Print ``msg`` behind an HH:MM:SS.mmm timestamp."""
+    global _log_second, _log_stamp
+    now = time.time()
+    second = int(now)
+    if second != _log_second:
+        _log_second = second
+        _log_stamp = time.strftime("%H:%M:%S", time.localtime(second))
+    print(f"[{_log_stamp}.{int((now - second) * 1000):03d}] {msg}")
+
+
+def encode_jpeg(frame, quality: int) -> bytes:
+    """Encode a BGR frame to JPEG, using libjpeg-turbo's SIMD encoder when available."""
+    if _turbo_jpeg is not None:
+        return _turbo_jpeg.encode(frame, quality=quality, jpeg_subsample=TJSAMP_420)
+    # Imported here so the audio-only simulator doesn't need OpenCV
+    import cv2
+
+    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+
+# Resize/encode runs here so the event loop keeps receiving while a frame
+# encodes; OpenCV and libjpeg-turbo release the GIL. Frames are sent in order
+# one at a time, so a single worker is enough
+encode_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jpeg-encode")
+
+
+async def iter_messages(websocket, idle_timeout: float):
+    """Yield inbound messages until the server closes or goes quiet.
+
+    Raises asyncio.TimeoutError once idle_timeout seconds pass without a
+    message. One timer watches a deadline that each message pushes back and
+    only re-arms when it fires, instead of a wait_for per message.
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.current_task()
+    deadline = loop.time() + idle_timeout
+    timed_out = False
+
+    def check_idle():
+        nonlocal timer, timed_out
+        if loop.time() >= deadline:
+            timed_out = True
+            reader.cancel()
+        else:
+            timer = loop.call_at(deadline, check_idle)
+
+    timer = loop.call_at(deadline, check_idle)
+    try:
+        async for message in websocket:
+            deadline = loop.time() + idle_timeout
+            yield message
+    except asyncio.CancelledError:
+        if timed_out:
+            raise asyncio.TimeoutError from None
+        raise
+    finally:
+        timer.cancel()
+
+
+def run(main: Coroutine) -> Any:
+    """Run ``main`` on uvloop when it is installed, else on asyncio's default loop."""
+    return (asyncio.run if uvloop is None else uvloop.run)(main)
@@ -1,8 +1,11 @@
 """Simulate audio streaming for XAI STT testing.
 
 This script sends audio chunks to the video-caption WebSocket endpoint
-to test the XAI STT integration. Uses the same message format as the
-Android/Ray-Ban app:
+to test the XAI STT integration. By default chunks go out as binary
+frames (1 type byte + raw PCM, no base64):
+  - 0x01 + <PCM 24kHz linear16>
+  - 0x02 (audio stream stop)
+With --json it uses the same message format as the Android/Ray-Ban app:
   - {"type": "audio_stream", "audio_chunk": "<base64>"}
   - {"type": "audio_stream_stop"}
 
@@ -10,22 +13,22 @@ Usage:
     python simulate_audio_stream.py                    # Connect to production
     python simulate_audio_stream.py --local            # Connect to localhost
     python simulate_audio_stream.py --file audio.wav  # Use specific audio file
+    python simulate_audio_stream.py --json            # Send Android JSON messages
+    python simulate_audio_stream.py --batch 4         # Send 4 chunks per message
 """
 
 import argparse
 import asyncio
 import base64
-import json
 import os
 import wave
-from datetime import datetime
+from collections.abc import Iterable, Iterator
 
+import numpy as np
+import orjson
 import websockets
 
-
-def log(msg: str):
-    print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] {msg}")
-
+from sim_utils import iter_messages, log, run
 
 # Default test audio (you can replace with your own)
 DEFAULT_AUDIO_PATH = "tests/test_audio.wav"
@@ -35,21 +38,45 @@ SAMPLE_RATE = 24000
 CHUNK_DURATION_MS = 100  # Send chunks every 100ms
 CHUNK_SIZE = int(SAMPLE_RATE * (CHUNK_DURATION_MS / 1000) * 2)  # 2 bytes per sample (16-bit)
 
+# Binary frame types understood by the video-caption endpoint
+FRAME_AUDIO = b"\x01"
+FRAME_AUDIO_STOP = b"\x02"
+
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Simulate audio streaming for XAI STT")
     parser.add_argument("--local", action="store_true", help="Connect to localhost")
     parser.add_argument("--file", type=str, default=DEFAULT_AUDIO_PATH, help="Audio file path")
+    parser.add_argument("--json", action="store_true", help="Send base64 JSON instead of binary frames")
+    parser.add_argument(
+        "--batch", type=int, default=1, help="Chunks per message (fewer sends, more latency)"
+    )
     return parser.parse_args()
 
 
-def load_audio(file_path: str) -> bytes:
-    """Load audio file and return raw PCM bytes."""
+def load_audio(
+    file_path: str, block_size: int = CHUNK_SIZE
+) -> tuple[int, Iterator[bytes | memoryview]]:
+    """Open an audio file for streaming in blocks of block_size bytes.
+
+    The file is read one block at a time as the stream consumes it, so memory
+    stays at one block however long the recording is. The last block is padded
+    to a whole number of CHUNK_SIZE chunks.
+
+    Returns:
+        The number of blocks and an iterator over the raw PCM blocks.
+    """
     if not os.path.exists(file_path):
         log(f"Audio file not found: {file_path}")
         log("Generating synthetic audio for testing...")
-        return generate_synthetic_audio()
-
+        audio_data = generate_synthetic_audio()
+        # Slicing a memoryview shares the buffer; slicing bytes would copy each block
+        audio_view = memoryview(audio_data)
+        blocks = (audio_view[i:i + block_size] for i in range(0, len(audio_view), block_size))
+        return -(-len(audio_data) // block_size), (_pad_block(b) for b in blocks)
+
+    # Only the header is read here; _read_blocks reopens the file when the
+    # stream starts consuming it, so nothing stays open if it never does
     with wave.open(file_path, "rb") as wav:
         # Log audio properties
         channels = wav.getnchannels()
@@ -57,72 +84,111 @@ def load_audio(file_path: str) -> bytes:
         framerate = wav.getframerate()
         n_frames = wav.getnframes()
 
-        log(f"Audio: {channels}ch, {sample_width * 8}-bit, {framerate}Hz, {n_frames} frames")
+    log(f"Audio: {channels}ch, {sample_width * 8}-bit, {framerate}Hz, {n_frames} frames")
+
+    if framerate != SAMPLE_RATE:
+        log(f"Warning: Audio is {framerate}Hz, XAI STT expects {SAMPLE_RATE}Hz")
+
+    frame_size = channels * sample_width
+    return -(-n_frames * frame_size // block_size), _read_blocks(file_path, block_size // frame_size)
+
+
+def _read_blocks(file_path: str, frames_per_block: int) -> Iterator[bytes | memoryview]:
+    """Yield padded PCM blocks from a WAV file, opening it on first use."""
+    with wave.open(file_path, "rb") as wav:
+        while block := wav.readframes(frames_per_block):
+            yield _pad_block(block)
 
-        if framerate != SAMPLE_RATE:
-            log(f"Warning: Audio is {framerate}Hz, XAI STT expects {SAMPLE_RATE}Hz")
 
-        return wav.readframes(n_frames)
+def _pad_block(block: bytes | memoryview) -> bytes | memoryview:
+    """Pad a block with silence to a whole number of CHUNK_SIZE chunks.
+
+    Full blocks are returned as-is, so only the final partial block is copied.
+    """
+    remainder = len(block) % CHUNK_SIZE
+    if not remainder:
+        return block
+    return bytes(block) + bytes(CHUNK_SIZE - remainder)
 
 
 def generate_synthetic_audio(duration_sec: float = 5.0) -> bytes:
     """Generate silent audio with some noise for testing."""
-    import random
-
     num_samples = int(SAMPLE_RATE * duration_sec)
     # Generate low-level noise (simulates microphone background)
-    samples = bytes([random.randint(127, 129) for _ in range(num_samples * 2)])
+    samples = np.random.randint(127, 130, size=num_samples * 2, dtype=np.uint8).tobytes()
     log(f"Generated {duration_sec}s of synthetic audio ({len(samples)} bytes)")
     return samples
 
 
-async def stream_audio(ws_url: str, audio_path: str):
+def build_audio_frames(blocks: Iterable[bytes | memoryview], use_json: bool = False) -> Iterator:
+    """Wrap each PCM block in an outgoing audio message.
+
+    Each block carries one or more consecutive chunks - the server treats PCM
+    as a continuous stream, so chunk boundaries don't need to survive.
+    """
+    for block in blocks:
+        if use_json:
+            # Use Android/Ray-Ban format: {"type": "audio_stream", "audio_chunk": ...}
+            # orjson emits bytes; decoded so JSON still goes out as text frames
+            yield orjson.dumps({
+                "type": "audio_stream",
+                "audio_chunk": base64.b64encode(block).decode("ascii")
+            }).decode()
+        else:
+            yield FRAME_AUDIO + block
+
+
+def audio_stop_frame(use_json: bool = False):
+    """Message that signals the end of the audio stream."""
+    return orjson.dumps({"type": "audio_stream_stop"}).decode() if use_json else FRAME_AUDIO_STOP
+
+
+# Stop listening after this long without a message from the server
+IDLE_TIMEOUT_SEC = 30.0
+
+
+async def stream_audio(ws_url: str, audio_path: str, use_json: bool = False, batch: int = 1):
     """Stream audio chunks to WebSocket."""
     log(f"Loading audio: {audio_path}")
-    audio_data = load_audio(audio_path)
-    total_chunks = len(audio_data) // CHUNK_SIZE
+    total_chunks, blocks = load_audio(audio_path, CHUNK_SIZE * batch)
+    chunk_frames = build_audio_frames(blocks, use_json)
+    message_duration_sec = batch * CHUNK_DURATION_MS / 1000
 
     log(f"Connecting to {ws_url}...")
-    async with websockets.connect(ws_url) as websocket:
+    # JPEG and PCM payloads don't deflate, so skip per-message compression
+    async with websockets.connect(ws_url, compression=None) as websocket:
         log("Connected!")
 
         async def send_audio():
             """Send audio chunks."""
-            log(f"Starting audio stream ({total_chunks} chunks, {CHUNK_DURATION_MS}ms each)...")
+            log(f"Starting audio stream ({total_chunks} messages, {batch * CHUNK_DURATION_MS}ms each)...")
+            loop = asyncio.get_running_loop()
             chunk_count = 0
+            # Absolute deadlines, so send time doesn't accumulate into drift
+            next_send = loop.time()
 
-            for i in range(0, len(audio_data), CHUNK_SIZE):
-                chunk = audio_data[i:i + CHUNK_SIZE]
-                if len(chunk) < CHUNK_SIZE:
-                    # Pad last chunk if needed
-                    chunk = chunk + b'\x00' * (CHUNK_SIZE - len(chunk))
-
-                chunk_b64 = base64.b64encode(chunk).decode("utf-8")
-                # Use Android/Ray-Ban format: {"type": "audio_stream", "audio_chunk": ...}
-                msg = {
-                    "type": "audio_stream",
-                    "audio_chunk": chunk_b64
-                }
-                await websocket.send(json.dumps(msg))
+            for frame in chunk_frames:
+                await websocket.send(frame)
                 chunk_count += 1
 
                 if chunk_count % 10 == 0:
                     log(f"Sent chunk {chunk_count}/{total_chunks}")
 
                 # Simulate real-time streaming
-                await asyncio.sleep(CHUNK_DURATION_MS / 1000)
+                next_send += message_duration_sec
+                delay = next_send - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
 
-            # Send audio_stream_stop to signal end of stream
-            await websocket.send(json.dumps({"type": "audio_stream_stop"}))
+            await websocket.send(audio_stop_frame(use_json))
             log(f"Audio stream finished ({chunk_count} chunks sent)")
 
         async def receive_messages():
             """Receive transcripts and other messages."""
             log("Listening for transcripts...")
             try:
-                while True:
-                    response = await asyncio.wait_for(websocket.recv(), timeout=30.0)
-                    data = json.loads(response)
+                async for response in iter_messages(websocket, IDLE_TIMEOUT_SEC):
+                    data = orjson.loads(response)
                     msg_type = data.get("type")
 
                     if msg_type == "transcript":
@@ -139,6 +205,7 @@ async def stream_audio(ws_url: str, audio_path: str):
                     else:
                         log(f"[{msg_type}] {data}")
 
+                log("Connection closed")
             except websockets.exceptions.ConnectionClosed:
                 log("Connection closed")
             except asyncio.TimeoutError:
@@ -159,8 +226,8 @@ async def main():
     else:
         ws_url = "wss://jarvis.warpdev.cloud/api/v1/vision/ws/video-caption"
 
-    await stream_audio(ws_url, args.file)
+    await stream_audio(ws_url, args.file, args.json, max(1, args.batch))
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main())
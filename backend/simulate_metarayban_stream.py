@@ -1,35 +1,46 @@
 """Simulate Meta Ray-Ban glasses video streaming.
 
-This script mimics the exact message format sent by the Android app
-on Ray-Ban Meta glasses for testing the video-caption WebSocket endpoint.
+This script mimics the video stream sent by the Android app on Ray-Ban
+Meta glasses for testing the video-caption WebSocket endpoint. Frames go
+out as binary messages (0x00 + raw JPEG) unless --json is given, which
+sends the app's exact JSON message format.
 
 Usage:
     python simulate_metarayban_stream.py              # Connect to production
     python simulate_metarayban_stream.py --local      # Connect to localhost
-    python simulate_metarayban_stream.py --processor 1  # Set processor ID
+    python simulate_metarayban_stream.py --processor 1  # Set processor ID (JSON only)
+    python simulate_metarayban_stream.py --json       # Send Android JSON messages
+    python simulate_metarayban_stream.py --no-ffmpeg  # Decode with OpenCV instead of ffmpeg
 """
 
 import asyncio
-import base64
-import json
 import os
+import shutil
 import sys
 import time
-from datetime import datetime
 
 import cv2
+import orjson
+import pybase64
 import websockets
 
-def log(msg):
-    print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] {msg}")
+from sim_utils import encode_jpeg, encode_pool, iter_messages, log, run
 
 # Configuration
 VIDEO_PATH = "tests/test_video.webm"
 FPS_TARGET = 10  # Ray-Ban sends ~10 FPS (100ms delay)
 JPEG_QUALITY = 30  # Match Android app quality
+# Under congestion quality drops to JPEG_QUALITY_MIN; JPEG size is roughly
+# linear in quality here, so halving quality about halves the bytes queued
+JPEG_QUALITY_MIN = 15
+WRITE_BUFFER_HIGH = 256 * 1024
+WRITE_BUFFER_LOW = 16 * 1024
 
 # Parse command line args
 USE_LOCAL = "--local" in sys.argv
+USE_JSON = "--json" in sys.argv
+# ffmpeg scales, paces and JPEG-encodes the file itself; OpenCV is the fallback
+USE_FFMPEG = "--no-ffmpeg" not in sys.argv and shutil.which("ffmpeg") is not None
 PROCESSOR_ID = 0
 for i, arg in enumerate(sys.argv):
     if arg == "--processor" and i + 1 < len(sys.argv):
@@ -40,96 +51,212 @@ if USE_LOCAL:
 else:
     WS_URL = "wss://jarvis.warpdev.cloud/api/v1/vision/ws/video-caption"
 
+# Binary frame type for a JPEG frame on the video-caption endpoint
+FRAME_IMAGE = b"\x00"
+
+# JSON image messages are assembled by hand: base64 output never needs JSON
+# escaping, so json.dumps would only re-scan and re-copy the payload
+IMAGE_MESSAGE_PREFIX = '{"image": "data:image/jpeg;base64,'
+
+
+def build_video_message(frame, quality: int = JPEG_QUALITY):
+    """Resize and compress a frame into its outgoing message (runs in encode_pool)."""
+    # Match Android settings
+    return build_image_message(encode_jpeg(cv2.resize(frame, (640, 480)), quality))
+
+
+def next_jpeg_quality(quality: int, websocket) -> int:
+    """Step JPEG quality down while the socket's write buffer backs up.
+
+    Quality climbs back once the buffer drains, but never above
+    JPEG_QUALITY, so an idle link still sends what the Android app sends.
+    """
+    buffered = websocket.transport.get_write_buffer_size()
+    if buffered > WRITE_BUFFER_HIGH:
+        return max(JPEG_QUALITY_MIN, quality - 5)
+    if buffered < WRITE_BUFFER_LOW:
+        return min(JPEG_QUALITY, quality + 2)
+    return quality
+
+
+def build_image_message(jpeg: bytes):
+    """Wrap an encoded JPEG in its outgoing message."""
+    if not USE_JSON:
+        return FRAME_IMAGE + jpeg
+
+    # Ray-Ban format: data URL prefix, processor field, NO type field
+    # Encode straight to str: JSON goes out as a text frame, so bytes would need a decode copy
+    b64_image = pybase64.b64encode_as_string(jpeg)
+    return f'{IMAGE_MESSAGE_PREFIX}{b64_image}", "processor": {PROCESSOR_ID}}}'
+
+
+# ffmpeg's MJPEG qscale (2 best .. 31 worst); 8 lands near JPEG_QUALITY
+FFMPEG_QSCALE = 8
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+
+async def iter_ffmpeg_jpegs(video_path: str):
+    """Yield 640x480 JPEG frames that ffmpeg decodes, paces and encodes in real time.
+
+    ffmpeg writes a bare MJPEG stream to stdout, so frames are split on the
+    JPEG end-of-image marker; entropy-coded data byte-stuffs 0xFF, so the
+    marker can't appear inside a frame. Python never touches pixels.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-loglevel", "error", "-re", "-i", video_path,
+        "-vf", f"scale=640:480,fps={FPS_TARGET}",
+        "-f", "mjpeg", "-q:v", str(FFMPEG_QSCALE), "pipe:1",
+        stdout=asyncio.subprocess.PIPE,
+    )
+    buffer = bytearray()
+    scan_from = 0
+    try:
+        while chunk := await proc.stdout.read(1 << 16):
+            buffer += chunk
+            while (end := buffer.find(JPEG_EOI, scan_from)) != -1:
+                start = buffer.find(JPEG_SOI, 0, end)
+                yield bytes(buffer[start:end + 2])
+                del buffer[:end + 2]
+                scan_from = 0
+            # Resume one byte back in case a marker straddles two reads
+            scan_from = max(len(buffer) - 1, 0)
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+
+
+# Stop listening after this long without a message from the server
+IDLE_TIMEOUT_SEC = 30.0
+
+
+async def send_ffmpeg_video(websocket):
+    """Send the JPEGs ffmpeg encodes, as they arrive."""
+    log("Starting video stream (Ray-Ban format)...")
+    frame_count = 0
+    # ffmpeg's -re and fps filter already pace frames to FPS_TARGET
+    async for jpeg in iter_ffmpeg_jpegs(VIDEO_PATH):
+        frame_count += 1
+        await websocket.send(build_image_message(jpeg))
+        log(f"Sent frame #{frame_count}")
+
+    log("Video stream finished.")
+
+
+async def send_video(websocket, cap):
+    """Decode with OpenCV, then resize and encode each frame in encode_pool."""
+    log("Starting video stream (Ray-Ban format)...")
+    loop = asyncio.get_running_loop()
+    frame_interval = 1.0 / FPS_TARGET
+    # Play the file in real time: at each send, jump to the source frame
+    # for the elapsed wall-clock time. Skipped frames are only grabbed,
+    # never decoded
+    source_fps = cap.get(cv2.CAP_PROP_FPS) or FPS_TARGET
+    start_time = time.time()
+    next_send = start_time
+    next_index = 0  # Index of the frame the next grab() returns
+    frame_count = 0
+    quality = JPEG_QUALITY
+
+    while cap.isOpened():
+        # Control FPS; when behind, send right away rather than in a burst
+        delay = next_send - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        next_send = max(next_send + frame_interval, time.time())
+
+        target_index = int((time.time() - start_time) * source_fps)
+        grabbed = cap.grab()
+        while grabbed and next_index < target_index:
+            grabbed = cap.grab()
+            next_index += 1
+        if not grabbed:
+            break
+        next_index += 1
+
+        ret, frame = cap.retrieve()
+        if not ret:
+            break
+        frame_count += 1
+
+        # Resize/Compress frame off the event loop
+        quality = next_jpeg_quality(quality, websocket)
+        msg = await loop.run_in_executor(
+            encode_pool, build_video_message, frame, quality
+        )
+        await websocket.send(msg)
+        log(f"Sent frame #{frame_count}")
+
+    log("Video stream finished.")
+
+
+async def receive_messages(websocket):
+    """Log captions and transcripts until the server closes or goes quiet."""
+    log("Listening for Moondream captions and transcripts...")
+    try:
+        async for response in iter_messages(websocket, IDLE_TIMEOUT_SEC):
+            data = orjson.loads(response)
+            msg_type = data.get("type")
+
+            if msg_type == "moondream_caption":
+                timestamp = data.get('timestamp', '')
+                description = data.get('description', '')
+                frame_num = data.get('frame_number', 0)
+                log(f"[MOONDREAM] #{frame_num} | {timestamp} | {description}")
+
+            elif msg_type == "transcript":
+                text = data.get('text', '')
+                is_final = data.get('is_final', False)
+                speaker = data.get('speaker', 'Unknown')
+                status = "FINAL" if is_final else "interim"
+                log(f"[TRANSCRIPT] [{status}] [{speaker}] {text}")
+
+            else:
+                # Log other message types for debugging
+                log(f"[{msg_type}] {data}")
+
+        log("Connection closed.")
+    except websockets.exceptions.ConnectionClosed:
+        log("Connection closed.")
+    except asyncio.TimeoutError:
+        log("No messages received for 30s. Exiting.")
+        await websocket.close()
+
 
 async def stream_simulation():
     log(f"Loading video: {VIDEO_PATH}")
-    log(f"Using Ray-Ban message format (processor={PROCESSOR_ID})")
+    if USE_JSON:
+        log(f"Using Ray-Ban message format (processor={PROCESSOR_ID})")
+    else:
+        log("Using binary frames")
 
-    cap = cv2.VideoCapture(VIDEO_PATH)
-    if not cap.isOpened():
-        log("Error opening video file")
-        return
+    cap = None
+    if USE_FFMPEG:
+        log("Decoding with ffmpeg (MJPEG pipe)")
+    else:
+        cap = cv2.VideoCapture(VIDEO_PATH)
+        if not cap.isOpened():
+            log("Error opening video file")
+            return
 
     log(f"Connecting to {WS_URL}...")
-    async with websockets.connect(WS_URL) as websocket:
+    # JPEG and PCM payloads don't deflate, so skip per-message compression
+    async with websockets.connect(WS_URL, compression=None) as websocket:
         log("Connected!")
 
-        async def send_video():
-            log("Starting video stream (Ray-Ban format)...")
-            frame_interval = 1.0 / FPS_TARGET
-            last_time = time.time()
-            frame_count = 0
-
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                # Control FPS
-                current_time = time.time()
-                if current_time - last_time < frame_interval:
-                    await asyncio.sleep(0.01)
-                    continue
-                last_time = current_time
-                frame_count += 1
-
-                # Resize/Compress frame (match Android settings)
-                frame = cv2.resize(frame, (640, 480))
-                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
-                b64_image = base64.b64encode(buffer).decode('utf-8')
-
-                # Ray-Ban format: data URL prefix, processor field, NO type field
-                msg = {
-                    "image": f"data:image/jpeg;base64,{b64_image}",
-                    "processor": PROCESSOR_ID
-                }
-                await websocket.send(json.dumps(msg))
-                log(f"Sent frame #{frame_count} (processor={PROCESSOR_ID})")
-
-            log("Video stream finished.")
-
-        async def receive_messages():
-            log("Listening for Moondream captions and transcripts...")
-            try:
-                while True:
-                    response = await asyncio.wait_for(websocket.recv(), timeout=30.0)
-                    data = json.loads(response)
-                    msg_type = data.get("type")
-
-                    if msg_type == "moondream_caption":
-                        timestamp = data.get('timestamp', '')
-                        description = data.get('description', '')
-                        frame_num = data.get('frame_number', 0)
-                        log(f"[MOONDREAM] #{frame_num} | {timestamp} | {description}")
-
-                    elif msg_type == "transcript":
-                        text = data.get('text', '')
-                        is_final = data.get('is_final', False)
-                        speaker = data.get('speaker', 'Unknown')
-                        status = "FINAL" if is_final else "interim"
-                        log(f"[TRANSCRIPT] [{status}] [{speaker}] {text}")
-
-                    else:
-                        # Log other message types for debugging
-                        log(f"[{msg_type}] {data}")
-
-            except websockets.exceptions.ConnectionClosed:
-                log("Connection closed.")
-            except asyncio.TimeoutError:
-                log("No messages received for 30s. Exiting.")
-                await websocket.close()
-
         # Run video and receive concurrently
         await asyncio.gather(
-            send_video(),
-            receive_messages()
+            send_ffmpeg_video(websocket) if cap is None else send_video(websocket, cap),
+            receive_messages(websocket)
         )
 
-    cap.release()
+    if cap is not None:
+        cap.release()
 
 
 if __name__ == "__main__":
     if not os.path.exists(VIDEO_PATH):
         log(f"File not found: {VIDEO_PATH}")
     else:
-        asyncio.run(stream_simulation())
+        run(stream_simulation())
@@ -4,30 +4,32 @@ This script sends both audio chunks and video frames simultaneously
 to test the complete video-caption WebSocket endpoint with both
 Moondream (vision) and XAI STT (speech-to-text) processing.
 
+By default frames go out as binary WebSocket messages (1 type byte +
+raw JPEG/PCM, no base64 or JSON). --json sends the Android app's JSON
+messages instead.
+
 Usage:
     python simulate_rayban_full.py                     # Connect to production
     python simulate_rayban_full.py --local             # Connect to localhost
     python simulate_rayban_full.py --video test.webm   # Use specific video
     python simulate_rayban_full.py --audio test.wav    # Use specific audio
+    python simulate_rayban_full.py --json              # Send Android JSON messages
+    python simulate_rayban_full.py --batch 4           # Send 4 audio chunks per message
 """
 
 import argparse
 import asyncio
-import base64
-import json
 import os
-import random
-import time
 import wave
-from datetime import datetime
+from collections.abc import Iterable, Iterator
 
 import cv2
+import numpy as np
+import orjson
+import pybase64
 import websockets
 
-
-def log(msg: str):
-    print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] {msg}")
-
+from sim_utils import encode_jpeg, encode_pool, iter_messages, log, run
 
 # Default paths
 DEFAULT_VIDEO_PATH = "tests/test_video.webm"
@@ -36,58 +38,173 @@ DEFAULT_AUDIO_PATH = "tests/test_audio.wav"
 # Video settings (match Android app)
 VIDEO_FPS = 10
 JPEG_QUALITY = 30
+# Under congestion quality drops to JPEG_QUALITY_MIN; JPEG size is roughly
+# linear in quality here, so halving quality about halves the bytes queued
+JPEG_QUALITY_MIN = 15
+WRITE_BUFFER_HIGH = 256 * 1024
+WRITE_BUFFER_LOW = 16 * 1024
 
 # Audio settings (Ray-Ban sends 24kHz, server resamples to 16kHz for XAI)
 AUDIO_SAMPLE_RATE = 24000
 AUDIO_CHUNK_MS = 100
 AUDIO_CHUNK_SIZE = int(AUDIO_SAMPLE_RATE * (AUDIO_CHUNK_MS / 1000) * 2)
 
+# Binary frame types understood by the video-caption endpoint
+FRAME_IMAGE = b"\x00"
+FRAME_AUDIO = b"\x01"
+FRAME_AUDIO_STOP = b"\x02"
+
+# JSON image messages are assembled by hand: base64 output never needs JSON
+# escaping, so json.dumps would only re-scan and re-copy the payload
+IMAGE_MESSAGE_PREFIX = '{"image": "data:image/jpeg;base64,'
+
+
+def build_video_message(
+    frame, processor_id: int, use_json: bool = False, quality: int = JPEG_QUALITY
+):
+    """Resize and compress a frame into its outgoing message (runs in encode_pool)."""
+    jpeg = encode_jpeg(cv2.resize(frame, (640, 480)), quality)
+    if not use_json:
+        return FRAME_IMAGE + jpeg
+
+    # Ray-Ban format: {"image": "data:image/jpeg;base64,...", "processor": N}
+    # Encode straight to str: JSON goes out as a text frame, so bytes would need a decode copy
+    b64_image = pybase64.b64encode_as_string(jpeg)
+    return f'{IMAGE_MESSAGE_PREFIX}{b64_image}", "processor": {int(processor_id)}}}'
+
+
+def next_jpeg_quality(quality: int, websocket) -> int:
+    """Step JPEG quality down while the socket's write buffer backs up.
+
+    Quality climbs back once the buffer drains, but never above
+    JPEG_QUALITY, so an idle link still sends what the Android app sends.
+    """
+    buffered = websocket.transport.get_write_buffer_size()
+    if buffered > WRITE_BUFFER_HIGH:
+        return max(JPEG_QUALITY_MIN, quality - 5)
+    if buffered < WRITE_BUFFER_LOW:
+        return min(JPEG_QUALITY, quality + 2)
+    return quality
+
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Simulate Ray-Ban glasses (audio + video)")
     parser.add_argument("--local", action="store_true", help="Connect to localhost")
     parser.add_argument("--video", type=str, default=DEFAULT_VIDEO_PATH, help="Video file path")
     parser.add_argument("--audio", type=str, default=DEFAULT_AUDIO_PATH, help="Audio file path")
-    parser.add_argument("--processor", type=int, default=0, help="Processor ID for video")
+    parser.add_argument("--processor", type=int, default=0, help="Processor ID for video (JSON only)")
+    parser.add_argument("--json", action="store_true", help="Send base64 JSON instead of binary frames")
+    parser.add_argument(
+        "--batch", type=int, default=1, help="Audio chunks per message (fewer sends, more latency)"
+    )
     return parser.parse_args()
 
 
-def load_audio(file_path: str) -> bytes:
-    """Load audio file and return raw PCM bytes."""
+def load_audio(
+    file_path: str, block_size: int = AUDIO_CHUNK_SIZE
+) -> tuple[int, Iterator[bytes | memoryview]]:
+    """Open an audio file for streaming in blocks of block_size bytes.
+
+    The file is read one block at a time as the stream consumes it, so memory
+    stays at one block however long the recording is. The last block is padded
+    to a whole number of AUDIO_CHUNK_SIZE chunks.
+
+    Returns:
+        The number of blocks and an iterator over the raw PCM blocks.
+    """
     if not os.path.exists(file_path):
         log(f"Audio file not found: {file_path}")
         log("Generating synthetic audio for testing...")
-        return generate_synthetic_audio()
-
+        audio_data = generate_synthetic_audio()
+        # Slicing a memoryview shares the buffer; slicing bytes would copy each block
+        audio_view = memoryview(audio_data)
+        blocks = (audio_view[i:i + block_size] for i in range(0, len(audio_view), block_size))
+        return -(-len(audio_data) // block_size), (_pad_block(b) for b in blocks)
+
+    # Only the header is read here; _read_blocks reopens the file when the
+    # stream starts consuming it, so nothing stays open if it never does
     with wave.open(file_path, "rb") as wav:
         channels = wav.getnchannels()
         sample_width = wav.getsampwidth()
         framerate = wav.getframerate()
         n_frames = wav.getnframes()
 
-        log(f"Audio: {channels}ch, {sample_width * 8}-bit, {framerate}Hz, {n_frames} frames")
+    log(f"Audio: {channels}ch, {sample_width * 8}-bit, {framerate}Hz, {n_frames} frames")
+
+    if framerate != AUDIO_SAMPLE_RATE:
+        log(f"Warning: Audio is {framerate}Hz, XAI STT expects {AUDIO_SAMPLE_RATE}Hz")
+
+    frame_size = channels * sample_width
+    return -(-n_frames * frame_size // block_size), _read_blocks(file_path, block_size // frame_size)
+
+
+def _read_blocks(file_path: str, frames_per_block: int) -> Iterator[bytes | memoryview]:
+    """Yield padded PCM blocks from a WAV file, opening it on first use."""
+    with wave.open(file_path, "rb") as wav:
+        while block := wav.readframes(frames_per_block):
+            yield _pad_block(block)
+
 
-        if framerate != AUDIO_SAMPLE_RATE:
-            log(f"Warning: Audio is {framerate}Hz, XAI STT expects {AUDIO_SAMPLE_RATE}Hz")
+def _pad_block(block: bytes | memoryview) -> bytes | memoryview:
+    """Pad a block with silence to a whole number of AUDIO_CHUNK_SIZE chunks.
 
-        return wav.readframes(n_frames)
+    Full blocks are returned as-is, so only the final partial block is copied.
+    """
+    remainder = len(block) % AUDIO_CHUNK_SIZE
+    if not remainder:
+        return block
+    return bytes(block) + bytes(AUDIO_CHUNK_SIZE - remainder)
 
 
 def generate_synthetic_audio(duration_sec: float = 10.0) -> bytes:
     """Generate silent audio with some noise for testing."""
     num_samples = int(AUDIO_SAMPLE_RATE * duration_sec)
-    samples = bytes([random.randint(127, 129) for _ in range(num_samples * 2)])
+    samples = np.random.randint(127, 130, size=num_samples * 2, dtype=np.uint8).tobytes()
     log(f"Generated {duration_sec}s of synthetic audio ({len(samples)} bytes)")
     return samples
 
 
-async def stream_full(ws_url: str, video_path: str, audio_path: str, processor_id: int):
+def build_audio_frames(blocks: Iterable[bytes | memoryview], use_json: bool = False) -> Iterator:
+    """Wrap each PCM block in an outgoing audio message.
+
+    Each block carries one or more consecutive chunks - the server treats PCM
+    as a continuous stream, so chunk boundaries don't need to survive.
+    """
+    for block in blocks:
+        if use_json:
+            # orjson emits bytes; decoded so JSON still goes out as text frames
+            yield orjson.dumps({
+                "type": "audio_stream",
+                "audio_chunk": pybase64.b64encode_as_string(block)
+            }).decode()
+        else:
+            yield FRAME_AUDIO + block
+
+
+def audio_stop_frame(use_json: bool = False):
+    """Message that signals the end of the audio stream."""
+    return orjson.dumps({"type": "audio_stream_stop"}).decode() if use_json else FRAME_AUDIO_STOP
+
+
+# Stop listening after this long without a message from the server
+IDLE_TIMEOUT_SEC = 30.0
+
+
+async def stream_full(
+    ws_url: str,
+    video_path: str,
+    audio_path: str,
+    processor_id: int,
+    use_json: bool = False,
+    audio_batch: int = 1,
+):
     """Stream both audio and video through a single WebSocket."""
 
     # Load audio
     log(f"Loading audio: {audio_path}")
-    audio_data = load_audio(audio_path)
-    total_audio_chunks = len(audio_data) // AUDIO_CHUNK_SIZE
+    total_audio_chunks, audio_blocks = load_audio(audio_path, AUDIO_CHUNK_SIZE * audio_batch)
+    audio_frames = build_audio_frames(audio_blocks, use_json)
+    audio_message_sec = audio_batch * AUDIO_CHUNK_MS / 1000
 
     # Load video
     log(f"Loading video: {video_path}")
@@ -102,83 +219,76 @@ async def stream_full(ws_url: str, video_path: str, audio_path: str, processor_i
         log(f"Video: {total_frames} frames")
 
     log(f"Connecting to {ws_url}...")
-    async with websockets.connect(ws_url) as websocket:
+    # JPEG and PCM payloads don't deflate, so skip per-message compression
+    async with websockets.connect(ws_url, compression=None) as websocket:
         log("Connected! Starting audio + video stream...")
 
         # Shared state
         streaming = True
 
-        async def send_video():
-            """Send video frames at target FPS."""
-            nonlocal streaming
-            if not video_available:
-                return
+        async def send_stream():
+            """Send audio chunks and video frames in real time from one coroutine.
 
+            Each step sends whichever stream is due next, so the two never
+            contend for the connection's write lock or wake each other up.
+            Deadlines are absolute, so time spent encoding or sending doesn't
+            push later messages back.
+            """
+            loop = asyncio.get_running_loop()
             frame_interval = 1.0 / VIDEO_FPS
-            last_time = time.time()
-            frame_count = 0
-
-            while cap.isOpened() and streaming:
-                ret, frame = cap.read()
-                if not ret:
-                    log(f"Video finished ({frame_count} frames sent)")
-                    break
-
-                # Control FPS
-                current_time = time.time()
-                elapsed = current_time - last_time
-                if elapsed < frame_interval:
-                    await asyncio.sleep(frame_interval - elapsed)
-                last_time = time.time()
-                frame_count += 1
-
-                # Resize and compress frame
-                frame = cv2.resize(frame, (640, 480))
-                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
-                b64_image = base64.b64encode(buffer).decode('utf-8')
-
-                # Ray-Ban format
-                msg = {
-                    "image": f"data:image/jpeg;base64,{b64_image}",
-                    "processor": processor_id
-                }
-                await websocket.send(json.dumps(msg))
-
-                if frame_count % 30 == 0:
-                    log(f"[VIDEO] Sent frame #{frame_count}")
-
-            cap.release()
-
-        async def send_audio():
-            """Send audio chunks in real-time."""
-            nonlocal streaming
-            log(f"[AUDIO] Starting stream ({total_audio_chunks} chunks, {AUDIO_CHUNK_MS}ms each)")
-            chunk_count = 0
-
-            for i in range(0, len(audio_data), AUDIO_CHUNK_SIZE):
-                if not streaming:
-                    break
-
-                chunk = audio_data[i:i + AUDIO_CHUNK_SIZE]
-                if len(chunk) < AUDIO_CHUNK_SIZE:
-                    chunk = chunk + b'\x00' * (AUDIO_CHUNK_SIZE - len(chunk))
-
-                chunk_b64 = base64.b64encode(chunk).decode("utf-8")
-                msg = {
-                    "type": "audio_stream",
-                    "audio_chunk": chunk_b64
-                }
-                await websocket.send(json.dumps(msg))
-                chunk_count += 1
-
-                if chunk_count % 20 == 0:
-                    log(f"[AUDIO] Sent chunk {chunk_count}/{total_audio_chunks}")
-
-                await asyncio.sleep(AUDIO_CHUNK_MS / 1000)
-
-            # Signal end of audio stream
-            await websocket.send(json.dumps({"type": "audio_stream_stop"}))
-            log(f"[AUDIO] Stream finished ({chunk_count} chunks sent)")
+            log(
+                f"[AUDIO] Starting stream ({total_audio_chunks} messages, "
+                f"{audio_batch * AUDIO_CHUNK_MS}ms each)"
+            )
+            next_audio = next_video = loop.time()
+            chunk_count = frame_count = 0
+            quality = JPEG_QUALITY
+            audio_done = False
+            video_done = not video_available
+
+            while streaming and not (audio_done and video_done):
+                video_due = not video_done and (audio_done or next_video <= next_audio)
+                delay = (next_video if video_due else next_audio) - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    if not streaming:
+                        break
+
+                if video_due:
+                    ret, frame = cap.read()
+                    if not ret:
+                        log(f"Video finished ({frame_count} frames sent)")
+                        video_done = True
+                        continue
+
+                    # Resize and compress frame
+                    quality = next_jpeg_quality(quality, websocket)
+                    msg = await loop.run_in_executor(
+                        encode_pool, build_video_message, frame, processor_id, use_json, quality
+                    )
+                    await websocket.send(msg)
+                    frame_count += 1
+                    next_video += frame_interval
+
+                    if frame_count % 30 == 0:
+                        log(f"[VIDEO] Sent frame #{frame_count}")
+                else:
+                    frame = next(audio_frames, None)
+                    if frame is None:
+                        await websocket.send(audio_stop_frame(use_json))
+                        log(f"[AUDIO] Stream finished ({chunk_count} chunks sent)")
+                        audio_done = True
+                        continue
+
+                    await websocket.send(frame)
+                    chunk_count += 1
+                    next_audio += audio_message_sec
+
+                    if chunk_count % 20 == 0:
+                        log(f"[AUDIO] Sent chunk {chunk_count}/{total_audio_chunks}")
+
+            if video_available:
+                cap.release()
 
         async def receive_messages():
             """Receive and display all responses."""
@@ -186,9 +296,8 @@ async def stream_full(ws_url: str, video_path: str, audio_path: str, processor_i
             log("Listening for captions and transcripts...")
 
             try:
-                while streaming:
-                    response = await asyncio.wait_for(websocket.recv(), timeout=30.0)
-                    data = json.loads(response)
+                async for response in iter_messages(websocket, IDLE_TIMEOUT_SEC):
+                    data = orjson.loads(response)
                     msg_type = data.get("type")
 
                     if msg_type == "moondream_caption":
@@ -209,6 +318,7 @@ async def stream_full(ws_url: str, video_path: str, audio_path: str, processor_i
                     else:
                         log(f"[{msg_type}] {data}")
 
+                log("Connection closed")
             except websockets.exceptions.ConnectionClosed:
                 log("Connection closed")
             except asyncio.TimeoutError:
@@ -216,10 +326,9 @@ async def stream_full(ws_url: str, video_path: str, audio_path: str, processor_i
             finally:
                 streaming = False
 
-        # Run all three tasks concurrently
+        # Send and receive concurrently
         await asyncio.gather(
-            send_video(),
-            send_audio(),
+            send_stream(),
             receive_messages(),
             return_exceptions=True
         )
@@ -237,8 +346,10 @@ async def main():
     log("Ray-Ban Meta Glasses Simulator (Audio + Video)")
     log("=" * 60)
 
-    await stream_full(ws_url, args.video, args.audio, args.processor)
+    await stream_full(
+        ws_url, args.video, args.audio, args.processor, args.json, max(1, args.batch)
+    )
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main())
@@ -1,15 +1,12 @@
 import asyncio
 import websockets
-import json
+import orjson
 import base64
 import cv2
 import time
 import os
 import sys
-from datetime import datetime
-
-def log(msg):
-    print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] {msg}")
+from sim_utils import encode_jpeg, encode_pool, iter_messages, log, run
 
 # Configuration
 VIDEO_PATH = "tests/test_video.webm"
@@ -17,11 +14,30 @@ FPS_TARGET = 5  # Send video frames at 5 FPS
 
 # Use --local flag to test against localhost
 USE_LOCAL = "--local" in sys.argv
+# Use --json to send base64 JSON messages instead of binary frames
+USE_JSON = "--json" in sys.argv
 if USE_LOCAL:
     WS_URL = "ws://localhost:8000/api/v1/vision/ws"
 else:
     WS_URL = "wss://jarvis.warpdev.cloud/api/v1/vision/ws/video-caption"
 
+# Binary frame type for a JPEG frame on the video-caption endpoint
+FRAME_IMAGE = b"\x00"
+
+def build_video_message(frame):
+    """Resize and compress a frame into its outgoing message (runs in encode_pool)."""
+    jpeg = encode_jpeg(cv2.resize(frame, (640, 480)), 70)
+    if not USE_JSON:
+        return FRAME_IMAGE + jpeg
+
+    # base64 output never needs JSON escaping, so skip json.dumps' re-scan and copy
+    b64_image = base64.b64encode(jpeg).decode('ascii')
+    return f'{{"type": "image", "image": "{b64_image}"}}'
+
+# Stop listening after this long without a message from the server
+IDLE_TIMEOUT_SEC = 30.0
+
+
 async def stream_simulation():
     log(f"Loading video: {VIDEO_PATH}")
 
@@ -31,38 +47,47 @@ async def stream_simulation():
         return
 
     log(f"Connecting to {WS_URL}...")
-    async with websockets.connect(WS_URL) as websocket:
+    # JPEG and PCM payloads don't deflate, so skip per-message compression
+    async with websockets.connect(WS_URL, compression=None) as websocket:
         log("Connected!")
 
         async def send_video():
             log("Starting video stream...")
+            loop = asyncio.get_running_loop()
             frame_interval = 1.0 / FPS_TARGET
-            last_time = time.time()
+            # Play the file in real time: at each send, jump to the source frame
+            # for the elapsed wall-clock time. Skipped frames are only grabbed,
+            # never decoded
+            source_fps = cap.get(cv2.CAP_PROP_FPS) or FPS_TARGET
+            start_time = time.time()
+            next_send = start_time
+            next_index = 0  # Index of the frame the next grab() returns
             frame_count = 0
 
             while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
+                # Control FPS; when behind, send right away rather than in a burst
+                delay = next_send - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                next_send = max(next_send + frame_interval, time.time())
+
+                target_index = int((time.time() - start_time) * source_fps)
+                grabbed = cap.grab()
+                while grabbed and next_index < target_index:
+                    grabbed = cap.grab()
+                    next_index += 1
+                if not grabbed:
                     break
+                next_index += 1
 
-                # Control FPS
-                current_time = time.time()
-                if current_time - last_time < frame_interval:
-                    await asyncio.sleep(0.01)
-                    continue
-                last_time = current_time
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
                 frame_count += 1
 
-                # Resize/Compress frame to reasonable size for streaming
-                frame = cv2.resize(frame, (640, 480))
-                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-                b64_image = base64.b64encode(buffer).decode('utf-8')
-
-                msg = {
-                    "type": "image",
-                    "image": b64_image
-                }
-                await websocket.send(json.dumps(msg))
+                # Resize/Compress frame to reasonable size for streaming, off the event loop
+                msg = await loop.run_in_executor(encode_pool, build_video_message, frame)
+                await websocket.send(msg)
                 log(f"Sent frame #{frame_count}")
 
             log("Video stream finished.")
@@ -70,9 +95,8 @@ async def stream_simulation():
         async def receive_messages():
             log("Listening for Moondream captions...")
             try:
-                while True:
-                    response = await asyncio.wait_for(websocket.recv(), timeout=30.0)
-                    data = json.loads(response)
+                async for response in iter_messages(websocket, IDLE_TIMEOUT_SEC):
+                    data = orjson.loads(response)
                     msg_type = data.get("type")
 
                     if msg_type == "moondream_caption":
@@ -80,6 +104,7 @@ async def stream_simulation():
                         description = data.get('description', '')
                         frame_num = data.get('frame_number', 0)
                         log(f"[MOONDREAM] #{frame_num} | {timestamp} | {description}")
+                log("Connection closed.")
             except websockets.exceptions.ConnectionClosed:
                 log("Connection closed.")
             except asyncio.TimeoutError:
@@ -98,4 +123,4 @@ if __name__ == "__main__":
     if not os.path.exists(VIDEO_PATH):
         log(f"File not found: {VIDEO_PATH}")
     else:
-        asyncio.run(stream_simulation())
+        run(stream_simulation())
@@ -1,17 +1,24 @@
 import asyncio
 import websockets
-import json
+import orjson
 import base64
 import cv2
 import time
 import argparse
-import subprocess
 import sys
+from sim_utils import encode_jpeg, encode_pool, run
 
 # Configuration
 WS_URL = "ws://localhost:8000/ws" 
 AUDIO_CHUNK_SIZE = 4096 # bytes
 
+def build_video_message(frame) -> str:
+    """Resize, encode and wrap a frame as an image message (runs in encode_pool)."""
+    # Resize for faster transmission (optional, maybe 640x480)
+    jpg_as_text = base64.b64encode(encode_jpeg(cv2.resize(frame, (640, 360)), 70)).decode('ascii')
+    # base64 output never needs JSON escaping, so skip json.dumps' re-scan and copy
+    return f'{{"type": "image", "image": "{jpg_as_text}", "timestamp": {time.time()!r}}}'
+
 async def send_audio_stream(websocket, video_path):
     """Extracts audio from video and streams it via WebSocket."""
     print(f"Starting audio stream from {video_path}...")
@@ -33,34 +40,47 @@ async def send_audio_stream(websocket, video_path):
         '-'
     ]
     
-    process = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=AUDIO_CHUNK_SIZE)
+    # Async pipe, so waiting on ffmpeg doesn't block the video and receive tasks
+    process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE)
+    # 4096 bytes / (2 bytes_per_sample * 24000 samples_per_sec) ~= 0.085s
+    chunk_duration = AUDIO_CHUNK_SIZE / 48000
+    loop = asyncio.get_running_loop()
+    next_send = loop.time()
     
     try:
         while True:
-            chunk = process.stdout.read(AUDIO_CHUNK_SIZE)
+            try:
+                chunk = await process.stdout.readexactly(AUDIO_CHUNK_SIZE)
+            except asyncio.IncompleteReadError as e:
+                # End of stream: send whatever is left over
+                chunk = e.partial
             if not chunk:
                 break
                 
             # Base64 encode
-            audio_b64 = base64.b64encode(chunk).decode('utf-8')
+            audio_b64 = base64.b64encode(chunk).decode('ascii')
             
-            # Send
+            # Send - orjson emits bytes; decoded because the server reads text frames
             msg = {
                 "type": "audio_stream",
                 "audio_chunk": audio_b64
             }
-            await websocket.send(json.dumps(msg))
+            await websocket.send(orjson.dumps(msg).decode())
             
-            # Simulate real-time (approximate)
-            # 4096 bytes / 2 bytes_per_sample / 24000 samples_per_sec ~= 0.085s
-            await asyncio.sleep(0.08)
+            # Simulate real-time against absolute deadlines so send time doesn't drift
+            next_send += chunk_duration
+            delay = next_send - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
             
     except Exception as e:
         print(f"Audio streaming error: {e}")
     finally:
-        process.terminate()
+        if process.returncode is None:
+            process.terminate()
+        await process.wait()
         # Send stop
-        await websocket.send(json.dumps({"type": "audio_stream_stop"}))
+        await websocket.send(orjson.dumps({"type": "audio_stream_stop"}).decode())
         print("Audio stream finished.")
 
 async def send_video_stream(websocket, video_path):
@@ -71,6 +91,8 @@ async def send_video_stream(websocket, video_path):
     fps = cap.get(cv2.CAP_PROP_FPS)
     if fps <= 0: fps = 24
     frame_delay = 1.0 / fps
+    loop = asyncio.get_running_loop()
+    next_send = loop.time()
     
     try:
         while cap.isOpened():
@@ -78,22 +100,16 @@ async def send_video_stream(websocket, video_path):
             if not ret:
                 break
                 
-            # Resize for faster transmission (optional, maybe 640x480)
-            frame = cv2.resize(frame, (640, 360))
-            
-            # Encode to JPEG
-            _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 70])
-            jpg_as_text = base64.b64encode(buffer).decode('utf-8')
+            # Resize and encode to JPEG off the event loop
+            msg = await loop.run_in_executor(encode_pool, build_video_message, frame)
             
             # Send
-            msg = {
-                "type": "image",
-                "image": jpg_as_text,
-                "timestamp": time.time()
-            }
-            await websocket.send(json.dumps(msg))
+            await websocket.send(msg)
             
-            await asyncio.sleep(frame_delay)
+            next_send += frame_delay
+            delay = next_send - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
             
     except Exception as e:
         print(f"Video streaming error: {e}")
@@ -105,7 +121,7 @@ async def receive_messages(websocket):
     """Listens for messages from the backend."""
     try:
         async for message in websocket:
-            data = json.loads(message)
+            data = orjson.loads(message)
             msg_type = data.get("type")
             
             if msg_type == "transcript":
@@ -125,7 +141,8 @@ async def run_client(video_path):
     uri = WS_URL
     
     print(f"Connecting to {uri}...")
-    async with websockets.connect(uri) as websocket:
+    # JPEG and PCM payloads don't deflate, so skip per-message compression
+    async with websockets.connect(uri, compression=None) as websocket:
         print("Connected!")
         
         # Run tasks
@@ -146,6 +163,6 @@ if __name__ == "__main__":
     
     video_path = sys.argv[1]
     try:
-        asyncio.run(run_client(video_path))
+        run(run_client(video_path))
     except KeyboardInterrupt:
         print("Stopped.")
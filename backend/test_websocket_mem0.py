@@ -1,54 +1,125 @@
 """Test WebSocket connection with Mem0 tool calling."""
 import asyncio
-import json
+import contextlib
+import signal
+import sys
+import orjson
 import websockets
+from websockets.asyncio.client import connect
+from sim_utils import run
+
+# Each handler indexes the fields the server always sends with its type
+def _on_transcript(data):
+    print(f"📝 Transcript: {data['text']}")
+
+
+def _on_tool_result(data):
+    print(f"🔧 Tool Called: {data['tool']}")
+    print(f"   Result: {data['result']}")
+
+
+# Tokens are buffered and written in batches - a flushed print per token is a
+# write syscall per token. The timer bounds how long a token can sit unseen
+TOKEN_FLUSH_COUNT = 16
+TOKEN_FLUSH_SEC = 0.05
+_token_buffer = []
+_token_flush_timer = None
+
+
+def _flush_tokens():
+    global _token_flush_timer
+    if _token_flush_timer is not None:
+        _token_flush_timer.cancel()
+        _token_flush_timer = None
+    if _token_buffer:
+        sys.stdout.write("".join(_token_buffer))
+        sys.stdout.flush()
+        _token_buffer.clear()
+
+
+def _on_agent_token(data):
+    global _token_flush_timer
+    _token_buffer.append(f"💬 Grok: {data['text']}")
+    if len(_token_buffer) >= TOKEN_FLUSH_COUNT:
+        _flush_tokens()
+    elif _token_flush_timer is None:
+        loop = asyncio.get_running_loop()
+        _token_flush_timer = loop.call_later(TOKEN_FLUSH_SEC, _flush_tokens)
+
+
+def _on_hume_data(data):
+    emotions = data["emotions"]
+    if emotions:
+        # Keyed on the dict's own lookup: no (name, score) tuples, no Python lambda
+        top_emotion = max(emotions, key=emotions.__getitem__)
+        print(f"😊 Top Emotion: {top_emotion} ({emotions[top_emotion]:.2f})")
+
+
+def _on_other(data):
+    print(f"📨 {data.get('type')}: {data}")
+
+
+# Test audio stream message - constant, so serialized once at import. Kept as
+# str because the server reads text frames; bytes would go out as binary
+TEST_MESSAGE = orjson.dumps({
+    "type": "audio_stream",
+    "audio_chunk": "dGVzdA=="  # Base64 encoded "test"
+}).decode()
+
+# One dict lookup per frame instead of walking an if/elif chain
+HANDLERS = {
+    "agent_token": _on_agent_token,
+    "transcript": _on_transcript,
+    "tool_result": _on_tool_result,
+    "hume_data": _on_hume_data,
+}
+
 
 async def test_websocket():
     uri = "ws://localhost:8000/api/v1/vision/ws"
 
     print(f"Connecting to {uri}...")
 
-    async with websockets.connect(uri) as websocket:
+    # Frames are small JSON on a local socket; deflate would only cost CPU
+    async with connect(uri, compression=None) as websocket:
         print("✅ Connected!")
 
         # Send a test audio stream message
-        test_message = {
-            "type": "audio_stream",
-            "audio_chunk": "dGVzdA=="  # Base64 encoded "test"
-        }
-
-        await websocket.send(json.dumps(test_message))
+        await websocket.send(TEST_MESSAGE)
         print("📤 Sent test audio message")
 
         # Listen for responses
         print("\n📡 Listening for responses (press Ctrl+C to stop)...\n")
 
-        try:
-            async for message in websocket:
-                data = json.loads(message)
-                msg_type = data.get("type")
-
-                if msg_type == "transcript":
-                    print(f"📝 Transcript: {data.get('text')}")
-
-                elif msg_type == "tool_result":
-                    print(f"🔧 Tool Called: {data.get('tool')}")
-                    print(f"   Result: {data.get('result')}")
+        # Hot-loop callables bound to locals once, not looked up per frame
+        get_handler = HANDLERS.get
+        loads = orjson.loads
+        recv = websocket.recv
 
-                elif msg_type == "agent_token":
-                    print(f"💬 Grok: {data.get('text')}", end="", flush=True)
+        # Ctrl+C cancels this task so the connection closes cleanly; a
+        # KeyboardInterrupt would land in the runner, not in this loop
+        loop = asyncio.get_running_loop()
+        # Windows loops have no signal handlers; the runner cancels instead
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(signal.SIGINT, asyncio.current_task().cancel)
 
-                elif msg_type == "hume_data":
-                    emotions = data.get("emotions", {})
-                    if emotions:
-                        top_emotion = max(emotions.items(), key=lambda x: x[1])
-                        print(f"😊 Top Emotion: {top_emotion[0]} ({top_emotion[1]:.2f})")
-
-                else:
-                    print(f"📨 {msg_type}: {data}")
+        try:
+            while True:
+                # Raw bytes: orjson parses UTF-8 itself, so skip decoding to str first
+                message = await recv(decode=False)
+                data = loads(message)
+                handler = get_handler(data.get("type"), _on_other)
+                if handler is not _on_agent_token:
+                    # Print buffered tokens first so output stays in order
+                    _flush_tokens()
+                handler(data)
 
-        except KeyboardInterrupt:
+        except websockets.exceptions.ConnectionClosedOK:
+            _flush_tokens()
+            print("\n\n👋 Server closed the connection")
+        except asyncio.CancelledError:
+            _flush_tokens()
             print("\n\n👋 Disconnecting...")
 
 if __name__ == "__main__":
-    asyncio.run(test_websocket())
+    run(test_websocket())